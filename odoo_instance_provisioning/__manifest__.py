@@ -29,11 +29,20 @@
         
         # Data
         'data/cron_data.xml',
+        'data/docker_host_data.xml',
         
         # Views
         'views/saas_instance_log_views.xml',
         'views/saas_instance_request_views.xml',
         'views/saas_instance_views.xml',
+        'views/saas_database_template_views.xml',
+        'views/saas_standby_container_views.xml',
+        'views/saas_provisioning_job_views.xml',
+        'views/saas_instance_metric_views.xml',
+        'views/saas_instance_backup_views.xml',
+        'views/saas_port_allocation_views.xml',
+        'views/saas_docker_host_views.xml',
+        'views/instance_wake_templates.xml',
         'views/provisioning_settings_views.xml',
         'views/provisioning_menus.xml',
     ],
@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from . import provisioning_api
+from . import instance_wake
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from odoo import http
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+
+class InstanceWakeController(http.Controller):
+    """Wake-on-request of hibernated instances.
+
+    The reverse proxy sends the requests it cannot forward to a tenant
+    container (502/503) here, with the original Host header.
+    """
+
+    def _find_instance(self, subdomain=None):
+        Instance = request.env['saas.instance.provisioning'].sudo()
+        if not subdomain:
+            base_domain = request.env['ir.config_parameter'].sudo().get_param('saas.base_domain', 'odoo.saas.com')
+            host = (request.httprequest.host or '').split(':')[0]
+            if not host.endswith(f'.{base_domain}'):
+                return Instance
+            subdomain = host[:-len(base_domain) - 1]
+        return Instance.search([
+            ('subdomain', '=', subdomain),
+            ('state', '!=', 'terminated'),
+        ], limit=1)
+
+    @http.route('/saas/wake', type='http', auth='public', methods=['GET', 'POST'], csrf=False)
+    def wake(self, subdomain=None, **kwargs):
+        """Start a hibernated instance and show a holding page meanwhile"""
+        instance = self._find_instance(subdomain)
+        if not instance:
+            return request.not_found()
+
+        if instance.state == 'hibernated':
+            try:
+                instance.request_wake()
+            except Exception as e:
+                _logger.error(f"Failed to wake up instance {instance.id}: {str(e)}")
+
+        # Polled on the manager, the tenant host only answers once Odoo is up
+        base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url', '')
+        # Never cached, the next load must reach the tenant
+        return request.render('odoo_instance_provisioning.instance_wake_page', {
+            'instance': instance,
+            'waking': instance.state == 'hibernated',
+            'status_url': f'{base_url}/saas/wake/status/{instance.subdomain}',
+        }, status=503, headers={'Cache-Control': 'no-store', 'Retry-After': '5'})
+
+    @http.route('/saas/wake/status/<string:subdomain>', type='http', auth='public', methods=['GET'],
+                csrf=False, cors='*')
+    def wake_status(self, subdomain, **kwargs):
+        """Polled by the holding page, ready once the container answers"""
+        instance = self._find_instance(subdomain)
+        if not instance:
+            return request.not_found()
+        return request.make_json_response({
+            'state': instance.state,
+            'ready': instance.state == 'active',
+        }, headers={'Cache-Control': 'no-store'})
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import csv
+import hmac
+import io
 import json
 import logging
+import zlib
 from datetime import datetime
 from odoo import http, fields, _
-from odoo.http import request
+from odoo.http import request, Response
+from ..models.saas_instance_log import EXPORT_FIELDS
 from odoo.exceptions import UserError, ValidationError
 
 # Optional imports
@@ -214,6 +219,129 @@ class ProvisioningAPIController(http.Controller):
                 'error_code': 'INTERNAL_ERROR'
             }
     
+    @http.route('/api/provisioning/instance_logs/<string:subdomain>/search', 
+                type='json', auth='public', methods=['GET', 'POST'], csrf=False, cors='*')
+    def search_instance_logs(self, subdomain, **kwargs):
+        """Full-text search in the logs of an instance, paged with a cursor"""
+        try:
+            Instance = request.env['saas.instance.provisioning'].sudo()
+            instance = Instance.search([('subdomain', '=', subdomain)], limit=1)
+            
+            if not instance:
+                return {
+                    'success': False,
+                    'error': 'Instance not found',
+                    'error_code': 'INSTANCE_NOT_FOUND'
+                }
+            
+            if not kwargs.get('q'):
+                return {
+                    'success': False,
+                    'error': 'Missing search terms',
+                    'error_code': 'MISSING_QUERY'
+                }
+            
+            InstanceLog = request.env['saas.instance.provisioning.log'].sudo()
+            try:
+                page = InstanceLog.search_logs_page(
+                    kwargs['q'],
+                    instance_id=instance.id,
+                    levels=kwargs.get('levels', '').split(',') if kwargs.get('levels') else None,
+                    date_from=kwargs.get('date_from'),
+                    date_to=kwargs.get('date_to'),
+                    limit=int(kwargs.get('limit', 50)),
+                    cursor=kwargs.get('cursor'),
+                    order='rank' if kwargs.get('order') == 'rank' else 'timestamp',
+                )
+            except ValueError as e:
+                return {
+                    'success': False,
+                    'error': str(e),
+                    'error_code': 'INVALID_PARAMETER'
+                }
+            
+            return {
+                'success': True,
+                'data': page,
+            }
+            
+        except Exception as e:
+            _logger.error(f"API Error in search_instance_logs: {str(e)}")
+            return {
+                'success': False,
+                'error': 'Internal server error',
+                'error_code': 'INTERNAL_ERROR'
+            }
+    
+    @http.route('/api/provisioning/instance_logs/<string:subdomain>/export', 
+                type='http', auth='public', methods=['GET'], csrf=False, cors='*')
+    def export_instance_logs(self, subdomain, levels=None, start_date=None, end_date=None, cursor=None, **kwargs):
+        """Stream the logs of an instance as NDJSON or CSV.
+        
+        Every row carries a ``cursor`` token, pass the last one received to
+        resume an interrupted export. The body is gzipped on the fly when the
+        client accepts it.
+        """
+        instance = request.env['saas.instance.provisioning'].sudo().search([('subdomain', '=', subdomain)], limit=1)
+        if not instance:
+            return request.make_json_response({
+                'success': False,
+                'error': 'Instance not found',
+                'error_code': 'INSTANCE_NOT_FOUND'
+            }, status=404)
+        
+        InstanceLog = request.env['saas.instance.provisioning.log'].sudo()
+        export_format = kwargs.get('format') or 'ndjson'
+        try:
+            if export_format not in ('ndjson', 'csv'):
+                raise ValueError(f"Unsupported format: {export_format}")
+            if cursor:
+                InstanceLog._decode_cursor(cursor)
+            start_date = fields.Datetime.to_datetime(start_date)
+            end_date = fields.Datetime.to_datetime(end_date)
+        except ValueError as e:
+            return request.make_json_response({
+                'success': False,
+                'error': str(e),
+                'error_code': 'INVALID_PARAMETER'
+            }, status=400)
+        
+        levels = levels.split(',') if levels else None
+        instance_id = instance.id
+        use_gzip = 'gzip' in request.httprequest.headers.get('Accept-Encoding', '')
+        
+        def generate():
+            # The request cursor is closed once the response starts, read on a cursor of our own
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+            with InstanceLog.pool.cursor() as cr:
+                header = export_format == 'csv'
+                for batch in InstanceLog._iter_export(cr, instance_id, start_date, end_date, levels, after=cursor):
+                    for row in batch:
+                        row['cursor'] = InstanceLog._encode_cursor(row['timestamp'], row['id'])
+                    if export_format == 'csv':
+                        buffer = io.StringIO()
+                        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS + ['cursor'])
+                        if header:
+                            writer.writeheader()
+                            header = False
+                        writer.writerows(batch)
+                        chunk = buffer.getvalue().encode()
+                    else:
+                        chunk = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch).encode()
+                    yield compressor.compress(chunk) if compressor else chunk
+            if compressor:
+                yield compressor.flush()
+        
+        headers = [
+            ('Content-Type', 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson'),
+            ('Content-Disposition', f'attachment; filename="{subdomain}_logs.{export_format}"'),
+            ('Cache-Control', 'no-store'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if use_gzip:
+            headers.append(('Content-Encoding', 'gzip'))
+        return Response(generate(), headers=headers, direct_passthrough=True)
+    
     @http.route('/api/provisioning/manage_instance/<string:subdomain>', 
                 type='json', auth='public', methods=['POST'], csrf=False, cors='*')
     def manage_instance(self, subdomain, **kwargs):
@@ -237,34 +365,22 @@ class ProvisioningAPIController(http.Controller):
                     'error_code': 'MISSING_ACTION'
                 }
             
-            # Perform action
-            if action == 'start':
-                instance.action_start()
-                message = 'Instance started successfully'
-            elif action == 'stop':
-                instance.action_stop()
-                message = 'Instance stopped successfully'
-            elif action == 'restart':
-                instance.action_stop()
-                instance.action_start()
-                message = 'Instance restarted successfully'
-            elif action == 'backup':
-                instance.action_backup()
-                message = 'Backup created successfully'
-            elif action == 'terminate':
-                instance.action_terminate()
-                message = 'Instance terminated successfully'
-            else:
+            if action not in ('start', 'stop', 'restart', 'backup', 'terminate'):
                 return {
                     'success': False,
                     'error': f'Unknown action: {action}',
                     'error_code': 'UNKNOWN_ACTION'
                 }
             
+            # Queue the action, the caller polls job_status for the outcome
+            job = request.env['saas.provisioning.job'].sudo().enqueue(instance, action)
+            
             return {
                 'success': True,
-                'message': message,
+                'message': f'{action.capitalize()} job queued',
                 'data': {
+                    'job_id': job.job_uuid,
+                    'job_state': job.state,
                     'subdomain': instance.subdomain,
                     'state': instance.state,
                 }
@@ -284,6 +400,34 @@ class ProvisioningAPIController(http.Controller):
                 'error_code': 'INTERNAL_ERROR'
             }
     
+    @http.route('/api/provisioning/job_status/<string:job_id>', 
+                type='json', auth='public', methods=['GET'], csrf=False, cors='*')
+    def get_job_status(self, job_id, **kwargs):
+        """Get status of a queued instance operation"""
+        try:
+            Job = request.env['saas.provisioning.job'].sudo()
+            job = Job.search([('job_uuid', '=', job_id)], limit=1)
+            
+            if not job:
+                return {
+                    'success': False,
+                    'error': 'Job not found',
+                    'error_code': 'JOB_NOT_FOUND'
+                }
+            
+            return {
+                'success': True,
+                'data': job.get_job_status()
+            }
+            
+        except Exception as e:
+            _logger.error(f"API Error in get_job_status: {str(e)}")
+            return {
+                'success': False,
+                'error': 'Internal server error',
+                'error_code': 'INTERNAL_ERROR'
+            }
+    
     @http.route('/api/provisioning/validate_subdomain', 
                 type='json', auth='public', methods=['POST'], csrf=False, cors='*')
     def validate_subdomain(self, **kwargs):
@@ -316,19 +460,16 @@ class ProvisioningAPIController(http.Controller):
                     'error_code': 'INVALID_LENGTH'
                 }
             
-            # Check availability
-            Instance = request.env['saas.instance'].sudo()
-            existing = Instance.search([
-                ('subdomain', '=', subdomain),
-                ('state', '!=', 'terminated')
-            ], limit=1)
-            
-            available = not bool(existing)
+            # Check availability, with the first free alternative when taken
+            Instance = request.env['saas.instance.provisioning'].sudo()
+            free_subdomain = Instance._find_available_subdomain(subdomain)
+            available = free_subdomain == subdomain
             
             return {
                 'success': True,
                 'available': available,
                 'subdomain': subdomain,
+                'suggestion': None if available else free_subdomain or None,
                 'message': 'Subdomain is available' if available else 'Subdomain is already taken'
             }
             
@@ -374,6 +515,49 @@ class ProvisioningAPIController(http.Controller):
                 'error_code': 'INTERNAL_ERROR'
             }
     
+    @http.route('/api/provisioning/report_traffic', 
+                type='json', auth='public', methods=['POST'], csrf=False)
+    def report_traffic(self, **kwargs):
+        """
+        Request counts from the reverse proxy, used to detect idle instances
+        The X-SaaS-Token header must carry the saas.traffic_report_token parameter
+        Expected payload:
+        {
+            "requests": {"companya": 120, "companyb": 3}
+        }
+        """
+        try:
+            token = request.env['ir.config_parameter'].sudo().get_param('saas.traffic_report_token')
+            sent = request.httprequest.headers.get('X-SaaS-Token') or ''
+            if not token or not hmac.compare_digest(sent.encode(), token.encode()):
+                return {
+                    'success': False,
+                    'error': 'Invalid traffic report token',
+                    'error_code': 'UNAUTHORIZED'
+                }
+            
+            counts = kwargs.get('requests')
+            if not isinstance(counts, dict):
+                return {
+                    'success': False,
+                    'error': 'requests must map subdomains to request counts',
+                    'error_code': 'INVALID_PAYLOAD'
+                }
+            
+            updated = request.env['saas.instance.provisioning'].sudo().record_traffic(counts)
+            return {
+                'success': True,
+                'data': {'instances': updated}
+            }
+            
+        except Exception as e:
+            _logger.error(f"API Error in report_traffic: {str(e)}")
+            return {
+                'success': False,
+                'error': 'Internal server error',
+                'error_code': 'INTERNAL_ERROR'
+            }
+    
     @http.route('/api/provisioning/health', 
                 type='json', auth='public', methods=['GET'], csrf=False, cors='*')
     def health_check(self, **kwargs):
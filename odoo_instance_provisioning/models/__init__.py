@@ -3,4 +3,12 @@
 from . import saas_instance
 from . import saas_instance_request
 from . import saas_instance_log
+from . import saas_instance_log_hourly
 from . import res_config_settings
+from . import saas_database_template
+from . import saas_standby_container
+from . import saas_provisioning_job
+from . import saas_instance_metric
+from . import saas_instance_backup
+from . import saas_port_allocation
+from . import saas_docker_host
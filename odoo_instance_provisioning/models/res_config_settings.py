@@ -56,6 +56,167 @@ class ResConfigSettings(models.TransientModel):
         help='Default storage limit in GB for new instances'
     )
     
+    saas_provisioning_concurrency = fields.Integer(
+        'Provisioning Concurrency',
+        config_parameter='saas.provisioning_concurrency',
+        default=4,
+        help='Maximum number of instances provisioned in parallel by the provisioning cron'
+    )
+    
+    saas_template_pool_size = fields.Integer(
+        'Template Pool Size',
+        config_parameter='saas.template_pool_size',
+        default=2,
+        help='Number of pre-warmed template databases kept per popular plan (0 disables the pool)'
+    )
+    
+    saas_template_pool_plans = fields.Integer(
+        'Template Pool Plans',
+        config_parameter='saas.template_pool_plans',
+        default=5,
+        help='Number of most used plans that get pre-warmed template databases'
+    )
+    
+    saas_container_pool_size = fields.Integer(
+        'Standby Container Pool Size',
+        config_parameter='saas.container_pool_size',
+        default=2,
+        help='Number of pre-started containers kept per Docker image (0 disables the pool)'
+    )
+    
+    saas_container_pool_max = fields.Integer(
+        'Standby Container Pool Maximum',
+        config_parameter='saas.container_pool_max',
+        default=5,
+        help='High-water mark of standby containers per image when demand grows'
+    )
+    
+    saas_container_pool_idle_hours = fields.Integer(
+        'Standby Container Idle Hours',
+        config_parameter='saas.container_pool_idle_hours',
+        default=24,
+        help='Standby containers above the target size idle for longer are removed'
+    )
+    
+    saas_port_range_start = fields.Integer(
+        'First Container Port',
+        config_parameter='saas.port_range_start',
+        default=8070,
+        help='First host port given to instance containers'
+    )
+    
+    saas_port_range_end = fields.Integer(
+        'Last Container Port',
+        config_parameter='saas.port_range_end',
+        default=9999,
+        help='Last host port given to instance containers'
+    )
+    
+    saas_placement_overcommit = fields.Float(
+        'Placement Overcommit',
+        config_parameter='saas.placement_overcommit',
+        default=1.0,
+        help='Ratio of the host capacity that instance limits may reserve, measured usage always has to fit the capacity'
+    )
+    
+    saas_rebalance_enabled = fields.Boolean(
+        'Rebalance Docker Hosts',
+        config_parameter='saas.rebalance_enabled',
+        default=False,
+        help='Move instances off Docker hosts whose measured load exceeds the threshold'
+    )
+    
+    saas_rebalance_threshold = fields.Float(
+        'Rebalance Threshold',
+        config_parameter='saas.rebalance_threshold',
+        default=0.85,
+        help='Share of CPU or memory capacity in use above which a Docker host is rebalanced'
+    )
+    
+    saas_users_per_worker = fields.Integer(
+        'Users per Worker',
+        config_parameter='saas.users_per_worker',
+        default=6,
+        help='Plan users served by one Odoo worker process, sizes the workers, CPU and memory of instances'
+    )
+    
+    saas_memory_per_worker = fields.Integer(
+        'Memory per Worker (MB)',
+        config_parameter='saas.memory_per_worker',
+        default=300,
+        help='Memory reserved per Odoo process of an instance, cron included'
+    )
+    
+    saas_max_workers_per_instance = fields.Integer(
+        'Max Workers per Instance',
+        config_parameter='saas.max_workers_per_instance',
+        default=8,
+        help='Upper bound of the Odoo workers of an instance, also used for plans with unlimited users'
+    )
+    
+    saas_hibernation_enabled = fields.Boolean(
+        'Hibernate Idle Instances',
+        config_parameter='saas.hibernation_enabled',
+        default=False,
+        help='Stop the containers of instances without requests, the next request starts them again'
+    )
+    
+    saas_hibernation_idle_hours = fields.Integer(
+        'Hibernation Idle Hours',
+        config_parameter='saas.hibernation_idle_hours',
+        default=72,
+        help='Hours without a request reported by the reverse proxy before an instance is hibernated'
+    )
+    
+    saas_traffic_report_token = fields.Char(
+        'Traffic Report Token',
+        config_parameter='saas.traffic_report_token',
+        help='Secret the reverse proxy sends in the X-SaaS-Token header when reporting traffic, '
+             'traffic reports are refused while empty'
+    )
+    
+    saas_pgbouncer_enabled = fields.Boolean(
+        'Connection Pooler',
+        config_parameter='saas.pgbouncer_enabled',
+        default=False,
+        help='Run PgBouncer on each Docker host and connect tenant containers through it'
+    )
+    
+    saas_pgbouncer_image = fields.Char(
+        'Pooler Image',
+        config_parameter='saas.pgbouncer_image',
+        default='edoburu/pgbouncer:latest',
+        help='Docker image of the PgBouncer container'
+    )
+    
+    saas_pgbouncer_pool_mode = fields.Char(
+        'Pooler Mode',
+        config_parameter='saas.pgbouncer_pool_mode',
+        default='session',
+        help='PgBouncer pool_mode: session or transaction. Odoo longpolling needs session mode'
+    )
+    
+    saas_db_connections_per_process = fields.Integer(
+        'DB Connections per Process',
+        config_parameter='saas.db_connections_per_process',
+        default=2,
+        help='Server connections reserved per Odoo process when sizing the pool of an instance'
+    )
+    
+    saas_db_probe_pool_size = fields.Integer(
+        'Probe Pool Size',
+        config_parameter='saas.db_probe_pool_size',
+        default=4,
+        help='Connections kept open by the manager for database checks and administration'
+    )
+    
+    saas_log_retention_days = fields.Integer(
+        'Log Retention (days)',
+        config_parameter='saas.log_retention_days',
+        default=365,
+        help='Monthly log partitions older than this are dropped, warnings and errors included'
+    )
+    
     # Monitoring Settings
     saas_enable_monitoring = fields.Boolean(
         'Enable Resource Monitoring',
@@ -71,6 +232,34 @@ class ResConfigSettings(models.TransientModel):
         help='Resource monitoring interval in minutes'
     )
     
+    saas_monitoring_concurrency = fields.Integer(
+        'Monitoring Concurrency',
+        config_parameter='saas.monitoring_concurrency',
+        default=16,
+        help='Number of containers whose statistics are collected in parallel'
+    )
+    
+    saas_metrics_retention_raw_hours = fields.Integer(
+        'Raw Metrics Retention (Hours)',
+        config_parameter='saas.metrics_retention_raw_hours',
+        default=48,
+        help='Hours to keep raw resource samples'
+    )
+    
+    saas_metrics_retention_5m_days = fields.Integer(
+        '5 Minute Metrics Retention (Days)',
+        config_parameter='saas.metrics_retention_5m_days',
+        default=14,
+        help='Days to keep 5 minute metric rollups'
+    )
+    
+    saas_metrics_retention_1h_days = fields.Integer(
+        'Hourly Metrics Retention (Days)',
+        config_parameter='saas.metrics_retention_1h_days',
+        default=400,
+        help='Days to keep hourly metric rollups'
+    )
+    
     # Backup Settings
     saas_enable_auto_backup = fields.Boolean(
         'Enable Auto Backup',
@@ -79,6 +268,22 @@ class ResConfigSettings(models.TransientModel):
         help='Enable automatic backup for all instances'
     )
     
+    saas_backup_mode = fields.Selection([
+        ('incremental', 'Incremental'),
+        ('full', 'Full'),
+    ], string='Backup Mode',
+        config_parameter='saas.backup_mode',
+        default='incremental',
+        help='Incremental backups only store the database chunks and filestore files that changed'
+    )
+    
+    saas_filestore_path = fields.Char(
+        'Filestore Path',
+        config_parameter='saas.filestore_path',
+        default='/opt/odoo/data/filestore',
+        help='Directory holding the tenant filestores'
+    )
+    
     saas_backup_retention_days = fields.Integer(
         'Backup Retention Days',
         config_parameter='saas.backup_retention_days',
@@ -86,6 +291,63 @@ class ResConfigSettings(models.TransientModel):
         help='Number of days to keep backup files'
     )
     
+    saas_backup_concurrency = fields.Integer(
+        'Backup Concurrency',
+        config_parameter='saas.backup_concurrency',
+        default=2,
+        help='Number of instances backed up in parallel'
+    )
+    
+    saas_backup_timeout = fields.Integer(
+        'Backup Timeout (Minutes)',
+        config_parameter='saas.backup_timeout',
+        default=60,
+        help='A backup running longer than this is aborted'
+    )
+    
+    saas_backup_bandwidth_mb = fields.Float(
+        'Backup Bandwidth (MB/s)',
+        config_parameter='saas.backup_bandwidth_mb',
+        default=0.0,
+        help='Total I/O rate of the running backups, 0 for no limit. Full backups need pv on the server; '
+             'in incremental mode the pg_dump output is not limited, only its storage'
+    )
+    
+    saas_backup_jitter_minutes = fields.Integer(
+        'Backup Jitter (Minutes)',
+        config_parameter='saas.backup_jitter_minutes',
+        default=60,
+        help='Window over which the next backup times of the instances are spread'
+    )
+    
+    saas_backup_parallel_threshold_gb = fields.Float(
+        'Parallel Dump Threshold (GB)',
+        config_parameter='saas.backup_parallel_threshold_gb',
+        default=5.0,
+        help='Databases larger than this are dumped by parallel workers'
+    )
+    
+    saas_backup_dump_jobs = fields.Integer(
+        'Parallel Dump Jobs',
+        config_parameter='saas.backup_dump_jobs',
+        default=4,
+        help='Number of pg_dump workers for large databases'
+    )
+    
+    saas_backup_keep_weekly = fields.Integer(
+        'Weekly Backups Kept',
+        config_parameter='saas.backup_keep_weekly',
+        default=4,
+        help='Number of weeks for which the newest backup is kept after the retention period'
+    )
+    
+    saas_backup_keep_monthly = fields.Integer(
+        'Monthly Backups Kept',
+        config_parameter='saas.backup_keep_monthly',
+        default=12,
+        help='Number of months for which the newest backup is kept after the retention period'
+    )
+    
     # API Settings
     saas_api_rate_limit = fields.Integer(
         'API Rate Limit',
@@ -128,10 +390,47 @@ class ResConfigSettings(models.TransientModel):
             saas_default_cpu_limit=float(ICPSudo.get_param('saas.default_cpu_limit', 1.0)),
             saas_default_memory_limit=int(ICPSudo.get_param('saas.default_memory_limit', 1024)),
             saas_default_storage_limit=int(ICPSudo.get_param('saas.default_storage_limit', 10)),
+            saas_provisioning_concurrency=int(ICPSudo.get_param('saas.provisioning_concurrency', 4)),
+            saas_template_pool_size=int(ICPSudo.get_param('saas.template_pool_size', 2)),
+            saas_template_pool_plans=int(ICPSudo.get_param('saas.template_pool_plans', 5)),
             saas_enable_monitoring=ICPSudo.get_param('saas.enable_monitoring', 'True').lower() == 'true',
             saas_monitoring_interval=int(ICPSudo.get_param('saas.monitoring_interval', 15)),
             saas_enable_auto_backup=ICPSudo.get_param('saas.enable_auto_backup', 'True').lower() == 'true',
+            saas_backup_mode=ICPSudo.get_param('saas.backup_mode', 'incremental'),
+            saas_filestore_path=ICPSudo.get_param('saas.filestore_path', '/opt/odoo/data/filestore'),
             saas_backup_retention_days=int(ICPSudo.get_param('saas.backup_retention_days', 30)),
+            saas_container_pool_size=int(ICPSudo.get_param('saas.container_pool_size', 2)),
+            saas_container_pool_max=int(ICPSudo.get_param('saas.container_pool_max', 5)),
+            saas_container_pool_idle_hours=int(ICPSudo.get_param('saas.container_pool_idle_hours', 24)),
+            saas_monitoring_concurrency=int(ICPSudo.get_param('saas.monitoring_concurrency', 16)),
+            saas_metrics_retention_raw_hours=int(ICPSudo.get_param('saas.metrics_retention_raw_hours', 48)),
+            saas_metrics_retention_5m_days=int(ICPSudo.get_param('saas.metrics_retention_5m_days', 14)),
+            saas_metrics_retention_1h_days=int(ICPSudo.get_param('saas.metrics_retention_1h_days', 400)),
+            saas_backup_concurrency=int(ICPSudo.get_param('saas.backup_concurrency', 2)),
+            saas_backup_timeout=int(ICPSudo.get_param('saas.backup_timeout', 60)),
+            saas_backup_bandwidth_mb=float(ICPSudo.get_param('saas.backup_bandwidth_mb', 0.0)),
+            saas_backup_jitter_minutes=int(ICPSudo.get_param('saas.backup_jitter_minutes', 60)),
+            saas_backup_parallel_threshold_gb=float(ICPSudo.get_param('saas.backup_parallel_threshold_gb', 5.0)),
+            saas_backup_dump_jobs=int(ICPSudo.get_param('saas.backup_dump_jobs', 4)),
+            saas_backup_keep_weekly=int(ICPSudo.get_param('saas.backup_keep_weekly', 4)),
+            saas_backup_keep_monthly=int(ICPSudo.get_param('saas.backup_keep_monthly', 12)),
+            saas_port_range_start=int(ICPSudo.get_param('saas.port_range_start', 8070)),
+            saas_port_range_end=int(ICPSudo.get_param('saas.port_range_end', 9999)),
+            saas_placement_overcommit=float(ICPSudo.get_param('saas.placement_overcommit', 1.0)),
+            saas_rebalance_enabled=ICPSudo.get_param('saas.rebalance_enabled', 'False').lower() == 'true',
+            saas_rebalance_threshold=float(ICPSudo.get_param('saas.rebalance_threshold', 0.85)),
+            saas_users_per_worker=int(ICPSudo.get_param('saas.users_per_worker', 6)),
+            saas_memory_per_worker=int(ICPSudo.get_param('saas.memory_per_worker', 300)),
+            saas_max_workers_per_instance=int(ICPSudo.get_param('saas.max_workers_per_instance', 8)),
+            saas_hibernation_enabled=ICPSudo.get_param('saas.hibernation_enabled', 'False').lower() == 'true',
+            saas_hibernation_idle_hours=int(ICPSudo.get_param('saas.hibernation_idle_hours', 72)),
+            saas_traffic_report_token=ICPSudo.get_param('saas.traffic_report_token', ''),
+            saas_pgbouncer_enabled=ICPSudo.get_param('saas.pgbouncer_enabled', 'False').lower() == 'true',
+            saas_pgbouncer_image=ICPSudo.get_param('saas.pgbouncer_image', 'edoburu/pgbouncer:latest'),
+            saas_pgbouncer_pool_mode=ICPSudo.get_param('saas.pgbouncer_pool_mode', 'session'),
+            saas_db_connections_per_process=int(ICPSudo.get_param('saas.db_connections_per_process', 2)),
+            saas_db_probe_pool_size=int(ICPSudo.get_param('saas.db_probe_pool_size', 4)),
+            saas_log_retention_days=int(ICPSudo.get_param('saas.log_retention_days', 365)),
             saas_api_rate_limit=int(ICPSudo.get_param('saas.api_rate_limit', 100)),
             saas_enable_api_auth=ICPSudo.get_param('saas.enable_api_auth', 'False').lower() == 'true',
             saas_admin_email=ICPSudo.get_param('saas.admin_email', ''),
@@ -150,10 +449,47 @@ class ResConfigSettings(models.TransientModel):
         ICPSudo.set_param('saas.default_cpu_limit', self.saas_default_cpu_limit)
         ICPSudo.set_param('saas.default_memory_limit', self.saas_default_memory_limit)
         ICPSudo.set_param('saas.default_storage_limit', self.saas_default_storage_limit)
+        ICPSudo.set_param('saas.provisioning_concurrency', self.saas_provisioning_concurrency)
+        ICPSudo.set_param('saas.template_pool_size', self.saas_template_pool_size)
+        ICPSudo.set_param('saas.template_pool_plans', self.saas_template_pool_plans)
         ICPSudo.set_param('saas.enable_monitoring', self.saas_enable_monitoring)
         ICPSudo.set_param('saas.monitoring_interval', self.saas_monitoring_interval)
         ICPSudo.set_param('saas.enable_auto_backup', self.saas_enable_auto_backup)
+        ICPSudo.set_param('saas.backup_mode', self.saas_backup_mode or 'incremental')
+        ICPSudo.set_param('saas.filestore_path', self.saas_filestore_path or '/opt/odoo/data/filestore')
         ICPSudo.set_param('saas.backup_retention_days', self.saas_backup_retention_days)
+        ICPSudo.set_param('saas.container_pool_size', self.saas_container_pool_size)
+        ICPSudo.set_param('saas.container_pool_max', self.saas_container_pool_max)
+        ICPSudo.set_param('saas.container_pool_idle_hours', self.saas_container_pool_idle_hours)
+        ICPSudo.set_param('saas.monitoring_concurrency', self.saas_monitoring_concurrency)
+        ICPSudo.set_param('saas.metrics_retention_raw_hours', self.saas_metrics_retention_raw_hours)
+        ICPSudo.set_param('saas.metrics_retention_5m_days', self.saas_metrics_retention_5m_days)
+        ICPSudo.set_param('saas.metrics_retention_1h_days', self.saas_metrics_retention_1h_days)
+        ICPSudo.set_param('saas.backup_concurrency', self.saas_backup_concurrency)
+        ICPSudo.set_param('saas.backup_timeout', self.saas_backup_timeout)
+        ICPSudo.set_param('saas.backup_bandwidth_mb', self.saas_backup_bandwidth_mb)
+        ICPSudo.set_param('saas.backup_jitter_minutes', self.saas_backup_jitter_minutes)
+        ICPSudo.set_param('saas.backup_parallel_threshold_gb', self.saas_backup_parallel_threshold_gb)
+        ICPSudo.set_param('saas.backup_dump_jobs', self.saas_backup_dump_jobs)
+        ICPSudo.set_param('saas.backup_keep_weekly', self.saas_backup_keep_weekly)
+        ICPSudo.set_param('saas.backup_keep_monthly', self.saas_backup_keep_monthly)
+        ICPSudo.set_param('saas.port_range_start', self.saas_port_range_start)
+        ICPSudo.set_param('saas.port_range_end', self.saas_port_range_end)
+        ICPSudo.set_param('saas.placement_overcommit', self.saas_placement_overcommit)
+        ICPSudo.set_param('saas.rebalance_enabled', self.saas_rebalance_enabled)
+        ICPSudo.set_param('saas.rebalance_threshold', self.saas_rebalance_threshold)
+        ICPSudo.set_param('saas.users_per_worker', self.saas_users_per_worker)
+        ICPSudo.set_param('saas.memory_per_worker', self.saas_memory_per_worker)
+        ICPSudo.set_param('saas.max_workers_per_instance', self.saas_max_workers_per_instance)
+        ICPSudo.set_param('saas.hibernation_enabled', self.saas_hibernation_enabled)
+        ICPSudo.set_param('saas.hibernation_idle_hours', self.saas_hibernation_idle_hours)
+        ICPSudo.set_param('saas.traffic_report_token', self.saas_traffic_report_token or '')
+        ICPSudo.set_param('saas.pgbouncer_enabled', self.saas_pgbouncer_enabled)
+        ICPSudo.set_param('saas.pgbouncer_image', self.saas_pgbouncer_image or 'edoburu/pgbouncer:latest')
+        ICPSudo.set_param('saas.pgbouncer_pool_mode', self.saas_pgbouncer_pool_mode or 'session')
+        ICPSudo.set_param('saas.db_connections_per_process', self.saas_db_connections_per_process)
+        ICPSudo.set_param('saas.db_probe_pool_size', self.saas_db_probe_pool_size)
+        ICPSudo.set_param('saas.log_retention_days', self.saas_log_retention_days)
         ICPSudo.set_param('saas.api_rate_limit', self.saas_api_rate_limit)
         ICPSudo.set_param('saas.enable_api_auth', self.saas_enable_api_auth)
         ICPSudo.set_param('saas.admin_email', self.saas_admin_email or '')
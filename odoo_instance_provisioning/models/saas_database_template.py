@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from odoo import models, fields, api, release, tools, _
+import psycopg2
+from ..utils import db_engine, pg_pool
+
+_logger = logging.getLogger(__name__)
+
+
+class SaasDatabaseTemplate(models.Model):
+    _name = 'saas.database.template'
+    _description = 'SaaS Pre-warmed Database Template'
+    _order = 'odoo_version, module_key, create_date'
+    _rec_name = 'database_name'
+
+    database_name = fields.Char('Template Database', required=True, readonly=True)
+    odoo_version = fields.Char('Odoo Version', required=True, readonly=True)
+    module_key = fields.Char('Modules', required=True, readonly=True,
+                             help='Sorted, comma separated technical names of the installed modules')
+    state = fields.Selection([
+        ('building', 'Building'),
+        ('ready', 'Ready'),
+        ('error', 'Error'),
+    ], string='Status', default='building', required=True, readonly=True)
+    use_count = fields.Integer('Tenants Created', readonly=True)
+    last_used = fields.Datetime('Last Used', readonly=True)
+    error_message = fields.Text('Error', readonly=True)
+
+    _sql_constraints = [
+        ('database_name_unique', 'UNIQUE(database_name)', 'Template database name must be unique.'),
+    ]
+
+    @api.model
+    def _get_pool_key(self, odoo_version, module_names):
+        """Pool key of a plan: (odoo_version, frozenset of module technical names)"""
+        return (odoo_version or '', frozenset(name.strip() for name in module_names if name and name.strip()))
+
+    @api.model
+    def _get_plan_key(self, plan, odoo_version):
+        """Pool key for a plan on a given Odoo version"""
+        return self._get_pool_key(odoo_version, plan.included_module_ids.mapped('technical_name'))
+
+    @api.model
+    def _serialize_modules(self, modules):
+        return ','.join(sorted(modules))
+
+    @api.model
+    def _pg_params(self, dbname='postgres'):
+        """Connection parameters with Odoo's database credentials"""
+        return {
+            'host': tools.config.get('db_host') or 'localhost',
+            'port': tools.config.get('db_port') or 5432,
+            'user': tools.config.get('db_user') or 'odoo',
+            'password': tools.config.get('db_password') or '',
+            'dbname': dbname,
+        }
+
+    @api.model
+    def _pg_connect(self, dbname='postgres'):
+        """Open an autocommit connection with Odoo's database credentials"""
+        conn = psycopg2.connect(**self._pg_params(dbname))
+        conn.autocommit = True
+        return conn
+
+    @api.model
+    def _pg_pool(self):
+        """Small shared pool of connections to the maintenance database"""
+        size = int(self.env['ir.config_parameter'].sudo().get_param('saas.db_probe_pool_size', 4))
+        return pg_pool.get_pool(size, **self._pg_params())
+
+    @api.model
+    def _pg_connection(self):
+        """Autocommit connection to the maintenance database, from the shared pool"""
+        return self._pg_pool().connection()
+
+    @api.model
+    def _get_db_engine(self, progress=None, runner=None):
+        """Database engine creating, initialising and dropping tenant databases"""
+        return db_engine.DatabaseEngine(self._pg_pool(), progress, runner)
+
+    # ------------------------------------------------------------------
+    # Tenant creation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def create_database_from_template(self, database_name, odoo_version, module_names):
+        """Clone a ready template into a new tenant database.
+
+        Returns the template used, or an empty recordset when the pool has
+        no ready template for the key so the caller can fall back to a full
+        database creation.
+        """
+        odoo_version, modules = self._get_pool_key(odoo_version, module_names)
+        template = self._claim_ready_template(odoo_version, modules)
+        if not template:
+            return template
+
+        with self._pg_connection() as conn, conn.cursor() as cr:
+            # CREATE DATABASE ... TEMPLATE requires no session on the source
+            cr.execute("""
+                SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE datname = %s AND pid != pg_backend_pid()
+            """, (template.database_name,))
+            cr.execute('CREATE DATABASE "%s" ENCODING \'unicode\' TEMPLATE "%s"'
+                       % (database_name, template.database_name))
+
+        self._reset_database_identity(database_name)
+        self._copy_filestore(template.database_name, database_name)
+
+        template.write({
+            'use_count': template.use_count + 1,
+            'last_used': fields.Datetime.now(),
+        })
+        return template
+
+    def _claim_ready_template(self, odoo_version, modules):
+        """Lock a ready template for the key, skipping templates being cloned"""
+        self.env.cr.execute("""
+            SELECT id FROM saas_database_template
+            WHERE state = 'ready' AND odoo_version = %s AND module_key = %s
+            ORDER BY use_count, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (odoo_version, self._serialize_modules(modules)))
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    @api.model
+    def _reset_database_identity(self, database_name):
+        """Give a cloned database its own uuid and secret, like Odoo's duplicate"""
+        conn = self._pg_connect(database_name)
+        try:
+            with conn.cursor() as cr:
+                for key, value in [('database.uuid', str(uuid.uuid1())),
+                                   ('database.secret', str(uuid.uuid4())),
+                                   ('database.create_date', fields.Datetime.to_string(fields.Datetime.now()))]:
+                    cr.execute("UPDATE ir_config_parameter SET value = %s WHERE key = %s", (value, key))
+        finally:
+            conn.close()
+
+    @api.model
+    def _copy_filestore(self, source_db, target_db):
+        source = tools.config.filestore(source_db)
+        if os.path.exists(source):
+            shutil.copytree(source, tools.config.filestore(target_db), dirs_exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Pool maintenance
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_wanted_keys(self):
+        """Pool keys of the most popular active plans.
+
+        Templates are built by this server's Odoo, only the plans running on
+        its version get some: instances of other versions are initialised
+        in the image of their version.
+        """
+        plan_count = int(self.env['ir.config_parameter'].sudo().get_param('saas.template_pool_plans', 5))
+        groups = self.env['saas.instance.provisioning']._read_group(
+            [('state', '!=', 'terminated'), ('plan_id.active', '=', True)],
+            ['plan_id', 'odoo_version'], ['__count'], order='__count desc', limit=plan_count,
+        )
+
+        keys = set()
+        for plan, odoo_version, count in groups:
+            if odoo_version != release.serie:
+                continue
+            key = self._get_plan_key(plan, odoo_version)
+            if key[1]:
+                keys.add(key)
+        return keys
+
+    @api.model
+    def cron_refill_template_pool(self):
+        """Cron job to keep N ready templates per popular plan and evict the rest"""
+        pool_size = int(self.env['ir.config_parameter'].sudo().get_param('saas.template_pool_size', 2))
+        wanted = self._get_wanted_keys() if pool_size > 0 else set()
+
+        # Evict templates of plans that are no longer active or popular,
+        # failed builds and builds abandoned by a killed cron run
+        stale = fields.Datetime.now() - timedelta(hours=2)
+        for template in self.search(['|', ('state', '!=', 'building'), ('create_date', '<', stale)]):
+            key = (template.odoo_version, frozenset(template.module_key.split(',')))
+            if key not in wanted or template.state != 'ready':
+                template._drop_template()
+                self.env.cr.commit()
+
+        for odoo_version, modules in wanted:
+            available = self.search_count([
+                ('odoo_version', '=', odoo_version),
+                ('module_key', '=', self._serialize_modules(modules)),
+                ('state', 'in', ['building', 'ready']),
+            ])
+            for _i in range(pool_size - available):
+                self._build_template(odoo_version, modules)
+
+    @api.model
+    def _build_template(self, odoo_version, modules):
+        """Create and initialise one template database with the given modules"""
+        module_key = self._serialize_modules(modules)
+        digest = hashlib.sha1(f'{odoo_version}:{module_key}'.encode()).hexdigest()[:8]
+        template = self.create({
+            'database_name': f'saas_tmpl_{digest}_{uuid.uuid4().hex[:6]}',
+            'odoo_version': odoo_version,
+            'module_key': module_key,
+        })
+        # Make the building template visible so overlapping runs do not duplicate it
+        self.env.cr.commit()
+
+        try:
+            self._get_db_engine().provision(template.database_name, modules, 'admin', 'admin', 'Template')
+            template.state = 'ready'
+            _logger.info(f"Template database {template.database_name} ready for {module_key}")
+        except Exception as e:
+            template.write({'state': 'error', 'error_message': str(e)})
+            _logger.error(f"Failed to build template database {template.database_name}: {str(e)}")
+        self.env.cr.commit()
+        return template
+
+    def _drop_template(self):
+        """Drop the template database and forget it"""
+        for template in self:
+            self._get_db_engine().drop(template.database_name)
+            _logger.info(f"Evicted template database {template.database_name}")
+            template.unlink()
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import tarfile
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError
+
+# Optional imports
+try:
+    import docker
+    HAS_DOCKER = True
+except ImportError:
+    HAS_DOCKER = False
+    docker = None
+
+_logger = logging.getLogger(__name__)
+
+# Connection pooler container run on each Docker host when enabled
+POOLER_NAME = 'saas_pgbouncer'
+POOLER_PORT = 6432
+POOLER_CONFIG_DIR = '/etc/pgbouncer'
+
+
+class SaasDockerHost(models.Model):
+    _name = 'saas.docker.host'
+    _description = 'SaaS Docker Host'
+    _order = 'sequence, id'
+
+    name = fields.Char('Name', required=True,
+                       help='Unique name, also used to key the port ranges of the host')
+    sequence = fields.Integer('Sequence', default=10)
+    active = fields.Boolean('Active', default=True)
+    accept_tenants = fields.Boolean('Accept New Tenants', default=True,
+                                    help='Uncheck to drain the host: running tenants stay, new ones go elsewhere')
+
+    # Connection
+    docker_url = fields.Char('Docker Endpoint',
+                             help='e.g. tcp://10.0.0.12:2376, empty for the local Docker daemon')
+    tls_verify = fields.Boolean('Verify TLS')
+    tls_ca_cert = fields.Char('CA Certificate Path')
+    tls_client_cert = fields.Char('Client Certificate Path')
+    tls_client_key = fields.Char('Client Key Path')
+    network = fields.Char('Docker Network', required=True, default='odoo17-tutorial_default')
+    db_host = fields.Char('Database Host', required=True, default='db',
+                          help='PostgreSQL host as seen from the containers of this host')
+    address = fields.Char('Address',
+                          help='Address at which the published container ports are reachable, '
+                               'empty when containers are reached by name on the Docker network')
+
+    # Capacity
+    cpu_capacity = fields.Float('CPU Capacity (cores)', default=4.0)
+    memory_capacity = fields.Integer('Memory Capacity (MB)', default=8192)
+    port_range_start = fields.Integer('First Port', default=8070)
+    port_range_end = fields.Integer('Last Port', default=9999)
+
+    pooler_container_id = fields.Char('Pooler Container', readonly=True, copy=False)
+
+    instance_ids = fields.One2many('saas.instance.provisioning', 'docker_host_id', 'Instances')
+    instance_count = fields.Integer('Instances', compute='_compute_load')
+    reserved_cpu = fields.Float('Reserved CPU (cores)', compute='_compute_load')
+    reserved_memory = fields.Integer('Reserved Memory (MB)', compute='_compute_load')
+    used_cpu = fields.Float('Used CPU (cores)', compute='_compute_load')
+    used_memory = fields.Integer('Used Memory (MB)', compute='_compute_load')
+
+    _sql_constraints = [
+        ('name_unique', 'UNIQUE(name)', 'Docker host name must be unique.'),
+    ]
+
+    def _compute_load(self):
+        """Reserved limits and measured usage of the live instances, in one query"""
+        loads = self._get_loads()
+        for host in self:
+            load = loads.get(host.id, {})
+            host.instance_count = load.get('count', 0)
+            host.reserved_cpu = load.get('reserved_cpu', 0.0)
+            host.reserved_memory = int(load.get('reserved_memory', 0))
+            host.used_cpu = load.get('used_cpu', 0.0)
+            host.used_memory = int(load.get('used_memory', 0))
+
+    def _get_loads(self):
+        """{host id: load} of the hosts, from the limits and the last usage samples.
+
+        Hibernated instances reserve nothing, their containers are stopped.
+        """
+        if not self.ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT h.id, count(i.id),
+                   coalesce(sum(i.cpu_limit) FILTER (WHERE i.state != 'hibernated'), 0),
+                   coalesce(sum(i.memory_limit) FILTER (WHERE i.state != 'hibernated'), 0),
+                   coalesce(sum(i.cpu_usage / 100.0 * h.cpu_capacity) FILTER (WHERE i.state = 'active'), 0),
+                   coalesce(sum(i.memory_usage / 100.0 * i.memory_limit) FILTER (WHERE i.state = 'active'), 0)
+            FROM saas_docker_host h
+            LEFT JOIN saas_instance_provisioning i
+                   ON i.docker_host_id = h.id AND i.state NOT IN ('terminated', 'draft')
+            WHERE h.id IN %s
+            GROUP BY h.id
+        """, (tuple(self.ids),))
+        return {
+            host_id: {
+                'count': count,
+                'reserved_cpu': reserved_cpu,
+                'reserved_memory': reserved_memory,
+                'used_cpu': used_cpu,
+                'used_memory': used_memory,
+            }
+            for host_id, count, reserved_cpu, reserved_memory, used_cpu, used_memory in self.env.cr.fetchall()
+        }
+
+    def _get_spare(self, load):
+        """Spare (cpu cores, memory MB) of the host for a given load.
+
+        Reservations may exceed the capacity by saas.placement_overcommit,
+        measured usage may not.
+        """
+        self.ensure_one()
+        overcommit = float(self.env['ir.config_parameter'].sudo().get_param('saas.placement_overcommit', 1.0))
+        spare_cpu = min(self.cpu_capacity * overcommit - load.get('reserved_cpu', 0.0),
+                        self.cpu_capacity - load.get('used_cpu', 0.0))
+        spare_memory = min(self.memory_capacity * overcommit - load.get('reserved_memory', 0),
+                           self.memory_capacity - load.get('used_memory', 0))
+        return spare_cpu, spare_memory
+
+    # ------------------------------------------------------------------
+    # Placement
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_default_host(self):
+        """Host of the Docker daemon next to Odoo, used before any placement"""
+        return self.env.ref('odoo_instance_provisioning.docker_host_local', raise_if_not_found=False) \
+            or self.search([], limit=1)
+
+    @api.model
+    def _adopt_instances(self):
+        """Attach the instances without a host to the default host"""
+        host = self._get_default_host()
+        if host:
+            self.env.cr.execute("""
+                UPDATE saas_instance_provisioning SET docker_host_id = %s
+                WHERE docker_host_id IS NULL AND container_id IS NOT NULL
+            """, (host.id,))
+
+    @api.model
+    def select_host(self, cpu, memory, exclude=None):
+        """Host with the most spare capacity that fits the cpu and memory.
+
+        Hosts are ranked by the smaller of their spare cpu and memory ratios
+        after placement, so tenants spread over the hosts instead of filling
+        the first one.
+        """
+        hosts = self.search([('accept_tenants', '=', True)])
+        if exclude:
+            hosts -= exclude
+        loads = hosts._get_loads()
+
+        best, best_score = self.browse(), None
+        for host in hosts:
+            spare_cpu, spare_memory = host._get_spare(loads.get(host.id, {}))
+            if spare_cpu < cpu or spare_memory < memory:
+                continue
+            score = min((spare_cpu - cpu) / (host.cpu_capacity or 1),
+                        (spare_memory - memory) / (host.memory_capacity or 1))
+            if best_score is None or score > best_score:
+                best, best_score = host, score
+
+        if not best:
+            raise Exception(f"No Docker host has {cpu} CPU and {memory} MB of memory to spare")
+        return best
+
+    # ------------------------------------------------------------------
+    # Docker access
+    # ------------------------------------------------------------------
+
+    def _get_client(self, **kwargs):
+        """Docker client of the host"""
+        self.ensure_one()
+        if not HAS_DOCKER:
+            raise Exception("Docker library not available. Please install: pip install docker")
+        if not self.docker_url:
+            return docker.from_env(**kwargs)
+        tls = False
+        if self.tls_verify or self.tls_client_cert:
+            tls = docker.tls.TLSConfig(
+                client_cert=(self.tls_client_cert, self.tls_client_key) if self.tls_client_cert else None,
+                ca_cert=self.tls_ca_cert or None,
+                verify=self.tls_ca_cert if self.tls_verify and self.tls_ca_cert else self.tls_verify,
+            )
+        return docker.DockerClient(base_url=self.docker_url, tls=tls, **kwargs)
+
+    def _get_container_url(self, container_name, port):
+        """URL of an Odoo container of the host, seen from this server"""
+        self.ensure_one()
+        if self.address:
+            return f"http://{self.address}:{port}"
+        return f"http://{container_name}:8069"
+
+    def action_test_connection(self):
+        self.ensure_one()
+        try:
+            client = self._get_client()
+            try:
+                info = client.info()
+            finally:
+                client.close()
+        except Exception as e:
+            raise UserError(_('Cannot reach Docker on %s: %s') % (self.name, str(e)))
+        self.write({
+            'cpu_capacity': info.get('NCPU') or self.cpu_capacity,
+            'memory_capacity': int((info.get('MemTotal') or 0) / 1024 / 1024) or self.memory_capacity,
+        })
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Connection successful'),
+                'message': _('Docker %s, %s cores, %s MB') % (
+                    info.get('ServerVersion'), self.cpu_capacity, self.memory_capacity),
+                'type': 'success',
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Connection pooling
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _pooler_enabled(self):
+        return self.env['ir.config_parameter'].sudo().get_param('saas.pgbouncer_enabled', 'False').lower() == 'true'
+
+    def _get_tenant_db_env(self):
+        """Database environment of the Odoo containers of the host"""
+        self.ensure_one()
+        env = {
+            'HOST': self.db_host,
+            'PORT': '5432',
+            'USER': tools.config.get('db_user') or 'odoo',
+            'PASSWORD': tools.config.get('db_password') or 'odoo',
+        }
+        if self._pooler_enabled():
+            env.update(HOST=POOLER_NAME, PORT=str(POOLER_PORT))
+        return env
+
+    def _get_pooler_config(self, exclude=None):
+        """pgbouncer.ini of the host, one pool per tenant database sized by its plan"""
+        self.ensure_one()
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        self.env['saas.instance.provisioning'].flush_model(['database_name', 'db_pool_size', 'docker_host_id', 'state'])
+        self.env.cr.execute("""
+            SELECT database_name, db_pool_size FROM saas_instance_provisioning
+            WHERE docker_host_id = %s AND state NOT IN ('terminated', 'draft') AND database_name IS NOT NULL
+              AND id != ALL(%s)
+            ORDER BY database_name
+        """, (self.id, exclude.ids if exclude else [0]))
+        server = f"host={self.db_host} port=5432"
+        lines = ["[databases]"]
+        for database_name, pool_size in self.env.cr.fetchall():
+            pool_size = pool_size or 5
+            lines.append(f"{database_name} = {server} dbname={database_name} "
+                         f"pool_size={pool_size} max_db_connections={pool_size}")
+        # Standby containers and databases not yet known to the pooler
+        lines += [
+            f"* = {server}",
+            "",
+            "[pgbouncer]",
+            "listen_addr = 0.0.0.0",
+            f"listen_port = {POOLER_PORT}",
+            "auth_type = scram-sha-256",
+            f"auth_file = {POOLER_CONFIG_DIR}/userlist.txt",
+            f"pool_mode = {ICPSudo.get_param('saas.pgbouncer_pool_mode', 'session')}",
+            f"max_client_conn = {int(ICPSudo.get_param('saas.pgbouncer_max_client_conn', 5000))}",
+            "default_pool_size = 5",
+            "server_idle_timeout = 60",
+            "ignore_startup_parameters = extra_float_digits",
+            "",
+        ]
+        return "\n".join(lines)
+
+    def _sync_pooler(self, exclude=None):
+        """Create the pooler container of the host or reload its configuration in place"""
+        self.ensure_one()
+        if not self._pooler_enabled():
+            return
+        env = self._get_tenant_db_env()
+        files = {
+            'pgbouncer.ini': self._get_pooler_config(exclude),
+            'userlist.txt': f'"{env["USER"]}" "{env["PASSWORD"]}"\n',
+        }
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for name, content in files.items():
+                data = content.encode()
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+
+        client = self._get_client()
+        try:
+            container = client.containers.get(POOLER_NAME)
+        except docker.errors.NotFound:
+            container = None
+        if container:
+            container.put_archive(POOLER_CONFIG_DIR, archive.getvalue())
+            if container.status == 'running':
+                # pgbouncer reloads its configuration without dropping clients
+                container.kill(signal='SIGHUP')
+            else:
+                container.start()
+        else:
+            image = self.env['ir.config_parameter'].sudo().get_param('saas.pgbouncer_image', 'edoburu/pgbouncer:latest')
+            try:
+                client.images.get(image)
+            except docker.errors.ImageNotFound:
+                client.images.pull(image)
+            # Configured before the first start, the image only generates a
+            # configuration when none exists
+            container = client.containers.create(
+                image=image,
+                name=POOLER_NAME,
+                network=self.network,
+                detach=True,
+                restart_policy={"Name": "unless-stopped"},
+            )
+            container.put_archive(POOLER_CONFIG_DIR, archive.getvalue())
+            container.start()
+            _logger.info(f"Started connection pooler on Docker host {self.name}")
+        if self.pooler_container_id != container.id:
+            self.pooler_container_id = container.id
+
+    # ------------------------------------------------------------------
+    # Rebalancing
+    # ------------------------------------------------------------------
+
+    @api.model
+    def cron_rebalance_hosts(self):
+        """Cron job to queue the move of one tenant off each overloaded host"""
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        if ICPSudo.get_param('saas.rebalance_enabled', 'False').lower() != 'true':
+            return
+        threshold = float(ICPSudo.get_param('saas.rebalance_threshold', 0.85))
+
+        Jobs = self.env['saas.provisioning.job']
+        hosts = self.search([])
+        loads = hosts._get_loads()
+        for host in hosts:
+            load = loads.get(host.id, {})
+            cpu_ratio = load.get('used_cpu', 0.0) / (host.cpu_capacity or 1)
+            memory_ratio = load.get('used_memory', 0) / (host.memory_capacity or 1)
+            if max(cpu_ratio, memory_ratio) < threshold:
+                continue
+            # One move at a time per host, the next run sees its effect
+            if Jobs.search_count([
+                ('operation', '=', 'migrate'),
+                ('state', 'in', ['pending', 'running']),
+                ('instance_id.docker_host_id', '=', host.id),
+            ]):
+                continue
+
+            # The busiest tenant another host can take
+            tenants = self.env['saas.instance.provisioning'].search([
+                ('docker_host_id', '=', host.id),
+                ('state', '=', 'active'),
+            ], order='cpu_usage desc, memory_usage desc', limit=5)
+            for tenant in tenants:
+                try:
+                    target = self.select_host(tenant.cpu_limit, tenant.memory_limit, exclude=host)
+                except Exception:
+                    continue
+                Jobs.enqueue(tenant, 'migrate')
+                _logger.info(f"Host {host.name} is overloaded, queued the move of instance {tenant.id} (room on {target.name})")
+                break
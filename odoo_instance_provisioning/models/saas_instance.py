@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import io
 import logging
-import subprocess
+import math
+import tarfile
+import threading
 import os
 import xmlrpc.client
 from datetime import datetime, timedelta
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError, ValidationError
+from odoo.exceptions import UserError
 import psycopg2
+from psycopg2.extras import execute_values
 import time
 import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..utils import db_engine
+from ..utils.container_stats import collect_usage
+from ..utils.tenant_rpc import TenantRPCClient
+from .saas_port_allocation import LOCAL_HOST
 
 # Optional imports
 try:
@@ -28,6 +39,44 @@ except ImportError:
 
 _logger = logging.getLogger(__name__)
 
+# Docker healthcheck of instance containers, intervals are in nanoseconds
+ODOO_HEALTHCHECK = {
+    'test': ['CMD-SHELL', 'curl -fs http://localhost:8069/web/health || exit 1'],
+    'interval': 2 * 10**9,
+    'timeout': 5 * 10**9,
+    'retries': 3,
+    'start_period': 5 * 10**9,
+}
+
+# Odoo configuration file of a tenant container, kept in its data volume so
+# it can be rewritten in place when the plan of the tenant changes
+TENANT_CONFIG_PATH = '/var/lib/odoo/tenant.conf'
+
+# Tenant RPC sessions of the instances being provisioned, by (database, instance id)
+_TENANT_CLIENTS = {}
+
+# Log entries buffered during a provisioning run, by (database, instance id, thread)
+_LOG_BUFFERS = {}
+
+# Ordered provisioning steps: (step, label, handler method, log message)
+PROVISIONING_STEPS = [
+    ('check_postgres', 'Check PostgreSQL', '_check_postgres_connection', 'Checking PostgreSQL connection'),
+    ('create_database', 'Create Database', '_create_database', 'Starting database creation'),
+    ('deploy_container', 'Deploy Container', '_deploy_container', 'Starting container deployment'),
+    ('install_modules', 'Install Modules', '_install_modules', 'Installing modules'),
+    ('setup_admin_user', 'Setup Admin User', '_setup_admin_user', 'Setting up admin user'),
+    ('setup_company', 'Setup Company', '_setup_company', 'Configuring company'),
+    ('setup_subdomain', 'Setup Subdomain', '_setup_subdomain', 'Configuring subdomain'),
+]
+
+
+class ProvisioningDeferred(Exception):
+    """Raised by a step waiting on the instance, provisioning resumes later"""
+
+    def __init__(self, message, retry_after=15):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 
 class SaasInstanceProvisioning(models.Model):
     _name = 'saas.instance.provisioning'
@@ -35,13 +84,16 @@ class SaasInstanceProvisioning(models.Model):
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'create_date desc'
     _rec_name = 'subdomain'
-
+    
     # Basic Information
     name = fields.Char('Instance Name', required=True)
     subdomain = fields.Char('Sub-domain', required=True, 
                            help='Sub-domain for accessing the instance (e.g., companya)')
     database_name = fields.Char('Database Name', required=True)
     plan_id = fields.Many2one('saas.plan', 'Service Plan', required=True)
+    addon_ids = fields.Many2many('saas.plan.addon', string='Add-ons',
+                                 domain="[('plan_id', '=', plan_id)]",
+                                 help='Add-ons bought with the plan, capacity add-ons raise the limits')
     
     # Instance Configuration
     url = fields.Char('Instance URL', compute='_compute_url', store=True)
@@ -56,6 +108,7 @@ class SaasInstanceProvisioning(models.Model):
         ('pending', 'Pending'),
         ('provisioning', 'Provisioning'),
         ('active', 'Active'),
+        ('hibernated', 'Hibernated'),
         ('suspended', 'Suspended'),
         ('terminated', 'Terminated'),
         ('error', 'Error'),
@@ -63,20 +116,34 @@ class SaasInstanceProvisioning(models.Model):
     
     # Technical Details
     container_id = fields.Char('Container ID')
+    docker_host_id = fields.Many2one('saas.docker.host', 'Docker Host', readonly=True, copy=False,
+                                     help='Host running the container, chosen by the placement scheduler')
+    volume_name = fields.Char('Data Volume', readonly=True, copy=False,
+                              help='Docker volume mounted on /var/lib/odoo, kept from the standby container when one was bound')
     port = fields.Integer('Port')
     ip_address = fields.Char('IP Address')
     ssl_enabled = fields.Boolean('SSL Enabled', default=True)
     
     # Resource Limits
-    cpu_limit = fields.Float('CPU Limit (cores)', default=1.0)
-    memory_limit = fields.Integer('Memory Limit (MB)', default=1024)
-    storage_limit = fields.Integer('Storage Limit (GB)', default=10)
+    cpu_limit = fields.Float('CPU Limit (cores)', default=lambda self: float(
+        self.env['ir.config_parameter'].sudo().get_param('saas.default_cpu_limit', 1.0)))
+    memory_limit = fields.Integer('Memory Limit (MB)', default=lambda self: int(
+        self.env['ir.config_parameter'].sudo().get_param('saas.default_memory_limit', 1024)))
+    storage_limit = fields.Integer('Storage Limit (GB)', default=lambda self: int(
+        self.env['ir.config_parameter'].sudo().get_param('saas.default_storage_limit', 10)))
+    max_users = fields.Integer('Max Users', help='Users allowed by the plan and its add-ons, 0 for unlimited')
+    workers = fields.Integer('Odoo Workers', help='HTTP worker processes of the instance, 0 for threaded mode')
+    db_pool_size = fields.Integer('Database Pool Size',
+                                  help='Server connections the connection pooler opens for the instance database')
     
     # Usage Statistics
     cpu_usage = fields.Float('CPU Usage (%)')
     memory_usage = fields.Float('Memory Usage (%)')
     storage_usage = fields.Float('Storage Usage (%)')
-    last_activity = fields.Datetime('Last Activity')
+    last_activity = fields.Datetime('Last Activity', help='Last HTTP request reported by the reverse proxy')
+    hibernated_date = fields.Datetime('Hibernated Since', readonly=True, copy=False)
+    wake_requested = fields.Datetime('Wake-up Requested', readonly=True, copy=False,
+                                     help='Set by the first request to a hibernated instance until it is awake')
     
     # Backup and Maintenance
     backup_enabled = fields.Boolean('Backup Enabled', default=True)
@@ -86,12 +153,25 @@ class SaasInstanceProvisioning(models.Model):
         ('monthly', 'Monthly'),
     ], string='Backup Frequency', default='daily')
     last_backup = fields.Datetime('Last Backup')
-    next_backup = fields.Datetime('Next Backup', compute='_compute_next_backup')
+    last_backup_id = fields.Many2one('saas.instance.backup', 'Latest Backup', readonly=True,
+                                     help='Head of the backup chain, the next incremental backup builds on it')
+    next_backup = fields.Datetime('Next Backup', compute='_compute_next_backup', store=True)
     
     # Relationships
     customer_id = fields.Many2one('saas.customer', 'Customer')
     instance_request_id = fields.Many2one('saas.instance.request', 'Instance Request')
     log_ids = fields.One2many('saas.instance.provisioning.log', 'instance_id', 'Logs')
+    job_ids = fields.One2many('saas.provisioning.job', 'instance_id', 'Jobs')
+    backup_ids = fields.One2many('saas.instance.backup', 'instance_id', 'Backups')
+    
+    # Provisioning Progress
+    provisioning_step = fields.Selection(
+        [(step, label) for step, label, handler, message in PROVISIONING_STEPS],
+        string='Last Completed Step', copy=False, tracking=True,
+        help='Last provisioning step completed successfully, a retry resumes after it')
+    provisioning_step_date = fields.Datetime('Step Completed At', copy=False)
+    provisioning_retry_date = fields.Datetime('Resume After', copy=False,
+                                              help='Paused provisioning is not picked up by the workers before this time')
     
     # Dates
     provisioned_date = fields.Datetime('Provisioned Date')
@@ -111,43 +191,57 @@ class SaasInstanceProvisioning(models.Model):
     
     @api.depends('backup_frequency', 'last_backup')
     def _compute_next_backup(self):
-        """Compute next backup date based on frequency"""
+        """Compute next backup date based on frequency.
+        
+        A stable per-instance offset of up to saas.backup_jitter_minutes
+        spreads the instances so they do not all become due at once.
+        """
+        jitter = int(self.env['ir.config_parameter'].sudo().get_param('saas.backup_jitter_minutes', 60)) * 60
         for record in self:
             if record.last_backup and record.backup_frequency:
                 if record.backup_frequency == 'daily':
-                    record.next_backup = record.last_backup + timedelta(days=1)
+                    next_backup = record.last_backup + timedelta(days=1)
                 elif record.backup_frequency == 'weekly':
-                    record.next_backup = record.last_backup + timedelta(weeks=1)
-                elif record.backup_frequency == 'monthly':
-                    record.next_backup = record.last_backup + timedelta(days=30)
+                    next_backup = record.last_backup + timedelta(weeks=1)
+                else:
+                    next_backup = record.last_backup + timedelta(days=30)
+                if jitter > 0 and record.id:
+                    offset = int(hashlib.sha1(str(record.id).encode()).hexdigest(), 16) % jitter
+                    next_backup += timedelta(seconds=offset - jitter // 2)
+                record.next_backup = next_backup
             else:
                 record.next_backup = False
     
-    @api.constrains('subdomain')
-    def _check_subdomain_unique(self):
-        """Ensure subdomain is unique"""
-        for record in self:
-            if record.subdomain:
-                existing = self.search([
-                    ('subdomain', '=', record.subdomain),
-                    ('id', '!=', record.id),
-                    ('state', '!=', 'terminated')
-                ])
-                if existing:
-                    raise ValidationError(_('Subdomain "%s" is already in use.') % record.subdomain)
-    
-    @api.constrains('database_name')
-    def _check_database_name_unique(self):
-        """Ensure database name is unique"""
-        for record in self:
-            if record.database_name:
-                existing = self.search([
-                    ('database_name', '=', record.database_name),
-                    ('id', '!=', record.id),
-                    ('state', '!=', 'terminated')
-                ])
-                if existing:
-                    raise ValidationError(_('Database name "%s" is already in use.') % record.database_name)
+    def init(self):
+        # Partial unique indexes: terminated instances release their names
+        # while the database still rejects concurrent duplicates. They replace
+        # the exclusion constraints of earlier versions.
+        for column in ('subdomain', 'database_name'):
+            index = f'saas_instance_provisioning_{column}_live_unique'
+            self.env.cr.execute(f"ALTER TABLE saas_instance_provisioning DROP CONSTRAINT IF EXISTS {index}")
+            self.env.cr.execute(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS {index} ON saas_instance_provisioning ({column})
+                WHERE state IS DISTINCT FROM 'terminated'
+            """)
+    
+    @api.model
+    def _find_available_subdomain(self, subdomain, max_suffix=1000):
+        """First free name among subdomain, subdomain1, subdomain2... in one query.
+        
+        A name is free when no live instance uses it as subdomain or, once
+        turned into a database name, as database name. Both lookups are index
+        scans on the partial unique indexes. Returns False when every
+        candidate up to max_suffix is taken.
+        """
+        return self.env['saas.instance']._find_free_name(subdomain, """
+            EXISTS (
+                SELECT 1 FROM saas_instance_provisioning i
+                WHERE i.subdomain = c.name AND i.state IS DISTINCT FROM 'terminated'
+            ) OR EXISTS (
+                SELECT 1 FROM saas_instance_provisioning i
+                WHERE i.database_name = translate(c.name, '-.', '__') AND i.state IS DISTINCT FROM 'terminated'
+            )
+        """, max_suffix=max_suffix)
     
     @api.model
     def create(self, vals):
@@ -155,21 +249,85 @@ class SaasInstanceProvisioning(models.Model):
         if not vals.get('database_name') and vals.get('subdomain'):
             vals['database_name'] = vals['subdomain'].replace('-', '_').replace('.', '_')
         
+        instance = super().create(vals)
+        # Limits given by the caller win over the plan ones
+        instance.write({
+            field: value for field, value in instance._compile_plan_limits().items()
+            if field not in vals
+        })
+        
         # Set port if not provided
         if not vals.get('port'):
-            vals['port'] = self._get_available_port()
+            instance.port = self.env['saas.port.allocation'].allocate(instance=instance)
         
-        return super().create(vals)
+        return instance
+    
+    def write(self, vals):
+        """Recompile the limits of the instances whose plan or add-ons change"""
+        res = super().write(vals)
+        if ('plan_id' in vals or 'addon_ids' in vals) and not self.env.context.get('skip_plan_limits'):
+            for record in self:
+                record.with_context(skip_plan_limits=True)._update_plan_limits()
+        return res
     
-    def _get_available_port(self):
-        """Get next available port for instance"""
-        # Simple implementation - in production, use better port management
-        last_instance = self.search([], order='port desc', limit=1)
-        if last_instance and last_instance.port:
-            return last_instance.port + 1
+    def _compile_plan_limits(self):
+        """Resource limits of the instance from its plan and add-ons.
+        
+        Users and storage are the plan limits plus the capacity add-ons. The
+        users size the Odoo workers (saas.users_per_worker), the workers size
+        the CPU (two workers per core, Odoo's rule of thumb) and the memory
+        (saas.memory_per_worker per process including cron). The default
+        limits of the settings are the floor.
+        """
+        self.ensure_one()
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        plan = self.plan_id
+        addons = self.addon_ids | plan.addon_ids.filtered('is_required')
+        
+        max_users = 0 if plan.unlimited_users else plan.max_users + sum(addons.mapped('additional_users'))
+        if plan.unlimited_storage:
+            storage = 0
         else:
-            return 8070  # Start from 8070
-        # return 8069 
+            storage = plan.storage_limit_gb + sum(addons.mapped('additional_storage_gb')) \
+                or int(ICPSudo.get_param('saas.default_storage_limit', 10))
+        
+        max_workers = int(ICPSudo.get_param('saas.max_workers_per_instance', 8))
+        users_per_worker = max(1, int(ICPSudo.get_param('saas.users_per_worker', 6)))
+        workers = max_workers if not max_users else math.ceil(max_users / users_per_worker)
+        workers = max(2, min(workers, max_workers))
+        
+        memory_per_worker = int(ICPSudo.get_param('saas.memory_per_worker', 300))
+        # Workers, cron and gevent processes each keep their connections
+        connections_per_process = int(ICPSudo.get_param('saas.db_connections_per_process', 2))
+        return {
+            'max_users': max_users,
+            'storage_limit': math.ceil(storage),
+            'workers': workers,
+            'db_pool_size': (workers + 2) * connections_per_process,
+            'cpu_limit': max(float(ICPSudo.get_param('saas.default_cpu_limit', 1.0)), workers / 2),
+            'memory_limit': max(int(ICPSudo.get_param('saas.default_memory_limit', 1024)),
+                                (workers + 1) * memory_per_worker),
+        }
+    
+    def _update_plan_limits(self):
+        """Recompile the limits and apply them to the running container"""
+        old_workers = self.workers
+        self.write(self._compile_plan_limits())
+        if not self.container_id or self.state not in ['active', 'hibernated', 'suspended'] or not HAS_DOCKER:
+            return
+        
+        try:
+            self._get_docker_host()._sync_pooler()
+            container = self._get_docker_client().containers.get(self.container_id)
+            self._apply_resource_limits(container)
+            if self.workers != old_workers and self._uses_tenant_config(container):
+                self._write_tenant_config(container)
+                if container.status == 'running':
+                    container.restart()
+            self._create_log('info', f'Plan limits applied: {self.cpu_limit} CPU, {self.memory_limit} MB, '
+                                     f'{self.workers} workers, {self.storage_limit} GB')
+        except Exception as e:
+            self._create_log('error', f'Failed to apply plan limits: {str(e)}')
     
     def action_provision(self):
         """Start the provisioning process"""
@@ -177,27 +335,62 @@ class SaasInstanceProvisioning(models.Model):
             if record.state != 'draft':
                 raise UserError(_('Only draft instances can be provisioned.'))
             
-            record.state = 'provisioning'
+            record.write({
+                'state': 'provisioning',
+                'provisioning_step': False,
+                'provisioning_step_date': False,
+                'provisioning_retry_date': False,
+            })
             record._create_log('info', 'Starting provisioning process')
             
             try:
-                # Start provisioning in background
-                self.env.ref('odoo_instance_provisioning.ir_cron_provision_instances').sudo().method_direct_trigger()
+                # Start provisioning in background, workers pick the instance up
+                # once this transaction is committed
+                self.env.ref('odoo_instance_provisioning.ir_cron_provision_instances').sudo()._trigger()
                 record._create_log('info', 'Provisioning job queued successfully')
             except Exception as e:
                 record.state = 'error'
                 record._create_log('error', f'Failed to queue provisioning job: {str(e)}')
                 raise UserError(_('Failed to start provisioning: %s') % str(e))
     
+    def action_retry_provisioning(self):
+        """Resume provisioning of failed instances from the last completed step"""
+        for record in self:
+            if record.state != 'error':
+                raise UserError(_('Only instances in error can be retried.'))
+            
+            record.write({'state': 'provisioning', 'provisioning_retry_date': False})
+            if record.provisioning_step:
+                record._create_log('info', f'Retrying provisioning after step "{record.provisioning_step}"')
+            else:
+                record._create_log('info', 'Retrying provisioning from the beginning')
+        
+        self.env.ref('odoo_instance_provisioning.ir_cron_provision_instances').sudo()._trigger()
+    
+    def action_enqueue_job(self):
+        """Queue the operation given in the context for background execution"""
+        operation = self.env.context.get('job_operation')
+        jobs = self.env['saas.provisioning.job']
+        for record in self:
+            job = jobs.enqueue(record, operation)
+            record._create_log('info', f'Job {job.job_uuid} queued for operation "{operation}"')
+            jobs |= job
+        return jobs
+    
     def action_start(self):
         """Start the instance"""
         for record in self:
-            if record.state not in ['suspended', 'active']:
-                raise UserError(_('Only suspended or active instances can be started.'))
+            if record.state not in ['suspended', 'hibernated', 'active']:
+                raise UserError(_('Only suspended, hibernated or active instances can be started.'))
             
             try:
                 record._start_container()
-                record.state = 'active'
+                record.write({
+                    'state': 'active',
+                    'last_activity': fields.Datetime.now(),
+                    'hibernated_date': False,
+                    'wake_requested': False,
+                })
                 record._create_log('info', 'Instance started successfully')
             except Exception as e:
                 record._create_log('error', f'Failed to start instance: {str(e)}')
@@ -226,213 +419,244 @@ class SaasInstanceProvisioning(models.Model):
             try:
                 record._terminate_instance()
                 record.state = 'terminated'
+                self.env['saas.port.allocation'].release(instance=record)
                 record._create_log('info', 'Instance terminated successfully')
             except Exception as e:
                 record._create_log('error', f'Failed to terminate instance: {str(e)}')
                 raise UserError(_('Failed to terminate instance: %s') % str(e))
     
+    def action_migrate(self, target=None):
+        """Move the instance to another Docker host, the least loaded one by default"""
+        for record in self:
+            if record.state not in ['active', 'hibernated', 'suspended']:
+                raise UserError(_('Only active, hibernated or suspended instances can be moved.'))
+            
+            try:
+                host = target or self.env['saas.docker.host'].select_host(
+                    record.cpu_limit, record.memory_limit, exclude=record._get_docker_host())
+                record._migrate_container(host)
+            except Exception as e:
+                record._create_log('error', f'Failed to move instance: {str(e)}')
+                raise UserError(_('Failed to move instance: %s') % str(e))
+    
     def action_backup(self):
         """Create backup of the instance"""
         for record in self:
             if record.state != 'active':
                 raise UserError(_('Only active instances can be backed up.'))
             
+            if not record._try_claim('backup'):
+                raise UserError(_('A backup of this instance is already running.'))
             try:
-                record._create_backup()
-                record.last_backup = fields.Datetime.now()
-                record._create_log('info', 'Backup created successfully')
+                record._backup_instance()
             except Exception as e:
-                record._create_log('error', f'Failed to create backup: {str(e)}')
                 raise UserError(_('Failed to create backup: %s') % str(e))
+            finally:
+                record._release_claim('backup')
     
-    def _provision_instance(self):
-        """Main provisioning logic"""
+    def _backup_instance(self, throttle=None):
+        """Create a backup and move the chain head to it.
+        
+        Runs under the backup claim of the instance (see _try_claim), which
+        also keeps the backup pruner away.
+        """
         try:
-            self._create_log('info', 'Checking PostgreSQL connection')
-            self._check_postgres_connection()
-            
-            self._create_log('info', 'Starting database creation')
-            self._create_database()
-            
-            self._create_log('info', 'Starting container deployment')
-            self._deploy_container()
-            
-            self._create_log('info', 'Installing modules')
-            self._install_modules()
+            with self.env.cr.savepoint():
+                backup = self._create_backup(throttle)
+                self.write({
+                    'last_backup': backup.backup_date,
+                    'last_backup_id': backup.id,
+                })
+            self._create_log('info', 'Backup created successfully')
+        except Exception as e:
+            self._create_log('error', f'Failed to create backup: {str(e)}')
+            raise
+    
+    def _provision_instance(self):
+        """Main provisioning logic, resuming after the last completed step"""
+        steps = [step for step, label, handler, message in PROVISIONING_STEPS]
+        start = steps.index(self.provisioning_step) + 1 if self.provisioning_step else 0
+        
+        # Logs are written once per step, and kept when the transaction rolls back
+        with self._buffered_logs(separate_cursor=True):
+            try:
+                if start:
+                    self._create_log('info', f'Resuming provisioning after step "{self.provisioning_step}"')
             
-            self._create_log('info', 'Setting up admin user')
-            self._setup_admin_user()
+                for step, label, handler, message in PROVISIONING_STEPS[start:]:
+                    self._create_log('info', message)
+                    getattr(self, handler)()
+                    self._checkpoint_provisioning_step(step)
+                    self._flush_logs()
             
-            self._create_log('info', 'Configuring company')
-            self._setup_company()
+                # self._create_log('info', 'Setting up localization')
+                # self._setup_localization()
             
-            self._create_log('info', 'Configuring subdomain')
-            self._setup_subdomain()
+                self.state = 'active'
+                self.provisioned_date = fields.Datetime.now()
+                self._create_log('info', 'Provisioning completed successfully')
             
-            # self._create_log('info', 'Setting up localization')
-            # self._setup_localization()
+                # Notify customer management module
+                self._notify_customer_management()
             
-            self.state = 'active'
-            self.provisioned_date = fields.Datetime.now()
-            self._create_log('info', 'Provisioning completed successfully')
+            except ProvisioningDeferred as e:
+                # Give the worker slot back and come back once the wait is over
+                retry_date = fields.Datetime.now() + timedelta(seconds=e.retry_after)
+                self.provisioning_retry_date = retry_date
+                self._create_log('info', f'Provisioning paused: {str(e)}')
+                self.env.ref('odoo_instance_provisioning.ir_cron_provision_instances').sudo()._trigger(retry_date)
             
-            # Notify customer management module
-            self._notify_customer_management()
+            except Exception as e:
+                # Steps before are committed, drop the failed one (the
+                # transaction may be aborted) and record the error
+                self.env.cr.rollback()
+                self.state = 'error'
+                self._create_log('error', f'Provisioning failed: {str(e)}')
+                _logger.error(f"Provisioning failed for instance {self.id}: {str(e)}")
+                raise
             
-        except Exception as e:
-            self.state = 'error'
-            self._create_log('error', f'Provisioning failed: {str(e)}')
-            _logger.error(f"Provisioning failed for instance {self.id}: {str(e)}")
-            raise
+            finally:
+                self._close_tenant_client()
     
-    def _create_database(self):
-        """Create PostgreSQL database for the instance"""
-        script_path = os.path.join(
-            os.path.dirname(__file__), 
-            '..', 'scripts', 'create_instance.sh'
-        )
-        
-        # Check if script exists
-        if not os.path.exists(script_path):
-            raise Exception(f"Script not found: {script_path}")
+    def _checkpoint_provisioning_step(self, step):
+        """Record a completed provisioning step so a retry can resume after it.
         
-        # Get database configuration from Odoo
-        from odoo import tools
-        db_host = tools.config.get('db_host', 'localhost')
-        db_port = tools.config.get('db_port', 5432)
-        db_user = tools.config.get('db_user', 'odoo')
-        db_password = tools.config.get('db_password', '')
-        
-        # Prepare environment with Odoo's database configuration
-        env = os.environ.copy()
-        env.update({
-            'PGHOST': str(db_host),
-            'PGPORT': str(db_port),
-            'PGUSER': str(db_user),
+        The run's transaction is committed with the checkpoint, so the step
+        and what it wrote on the instance survive a later rollback or crash.
+        The worker keeps its claim through the commit (see
+        _claim_pending_instance).
+        """
+        self.write({
+            'provisioning_step': step,
+            'provisioning_step_date': fields.Datetime.now(),
         })
+        self.env.cr.commit()
+    
+    def _create_database(self):
+        """Create and initialise the PostgreSQL database of the instance"""
+        if self._create_database_from_template():
+            return
         
-        if db_password:
-            env['PGPASSWORD'] = str(db_password)
-        
-        cmd = [
-            'bash', script_path,
-            self.database_name,
-            self.admin_email,
-            self.admin_password,
-            self.company_name
-        ]
-        
-        self._create_log('info', f'Creating database {self.database_name} on {db_host}:{db_port}')
-        self._create_log('info', f'Executing: {" ".join(cmd)}')
+        engine = self.env['saas.database.template']._get_db_engine(
+            progress=lambda step, message: self._create_log('info', message),
+            runner=self._run_odoo_command)
+        modules = self.plan_id.included_module_ids.mapped('technical_name')
+        try:
+            engine.provision(self.database_name, modules, self.admin_email,
+                             self.admin_password, self.company_name, odoo_version=self.odoo_version)
+        except db_engine.DatabaseExists:
+            # Left by a previous attempt that completed provisioning
+            self._create_log('warning', f'Database {self.database_name} already provisioned, using existing database')
+        except db_engine.DatabaseUnavailable as e:
+            raise Exception(f"PostgreSQL server is not accessible during {e.step}: {str(e)}")
+        except db_engine.DatabaseEngineError as e:
+            raise Exception(f"Database creation failed during {e.step}: {str(e)}")
+
+    def _run_odoo_command(self, odoo_version, args, timeout=1800):
+        """Run odoo with the arguments in a throwaway container of the version image.
+
+        The container runs on the host of the instance with its data volume
+        mounted, so the filestore written is the one the tenant container
+        uses. It connects to PostgreSQL directly, not through the pooler.
+        Returns the exit code and the tail of the output.
+        """
+        if not HAS_DOCKER:
+            raise Exception("Docker library not available. Please install: pip install docker")
         
+        host = self._place_container()
+        client = host._get_client()
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, env=env)
-            
-            # Combine stdout and stderr for better error analysis
-            full_output = (result.stdout or '') + (result.stderr or '')
-            
-            # First check if the output indicates database already exists (regardless of return code)
-            if ("Database already exists" in full_output or 
-                "already exists" in full_output or
-                "using existing database" in full_output):
-                # This is acceptable - database already exists, we can use it
-                self._create_log('warning', f'Database {self.database_name} already exists, using existing database')
-                if result.stdout:
-                    self._create_log('info', f'Script output: {result.stdout}')
-                # Don't raise exception, continue with existing database
-                return
+            volume_name = self._get_volume_name()
+            try:
+                client.volumes.get(volume_name)
+            except docker.errors.NotFound:
+                client.volumes.create(name=volume_name)
+            self.volume_name = volume_name
             
-            # Check for actual errors if return code is not 0
-            if result.returncode != 0:
-                error_msg = full_output or "Unknown error occurred"
-                
-                # Check for specific error patterns and provide helpful messages
-                if "connection to server" in error_msg and "Connection refused" in error_msg:
-                    detailed_error = (f"PostgreSQL server is not accessible at {db_host}:{db_port}. "
-                                    f"Please ensure PostgreSQL container is running and accessible. "
-                                    f"Error details: {error_msg}")
-                    self._create_log('error', detailed_error)
-                    raise Exception(detailed_error)
-                elif "command not found" in error_msg:
-                    detailed_error = ("Required command not found. Please ensure PostgreSQL client tools are installed. "
-                                    f"Error details: {error_msg}")
-                    self._create_log('error', detailed_error)
-                    raise Exception(detailed_error)
-                elif "permission denied" in error_msg.lower():
-                    detailed_error = ("Permission denied. Please check database user privileges. "
-                                    f"Error details: {error_msg}")
-                    self._create_log('error', detailed_error)
-                    raise Exception(detailed_error)
-                else:
-                    detailed_error = f"Database creation failed: {error_msg}"
-                    self._create_log('error', detailed_error)
-                    raise Exception(detailed_error)
-            else:
-                # Log successful output
-                if result.stdout:
-                    self._create_log('info', f'Script output: {result.stdout}')
-                
-        except subprocess.TimeoutExpired:
-            error_msg = "Database creation script timed out after 5 minutes"
-            self._create_log('error', error_msg)
-            raise Exception(error_msg)
+            container = client.containers.run(
+                image=f'odoo:{odoo_version}',
+                command=['odoo'] + args,
+                environment={**host._get_tenant_db_env(), 'HOST': host.db_host, 'PORT': '5432'},
+                volumes={volume_name: {'bind': '/var/lib/odoo', 'mode': 'rw'}},
+                network=host.network,
+                detach=True,
+            )
+            try:
+                result = container.wait(timeout=timeout)
+                output = container.logs(tail=20).decode(errors='replace').strip()
+            finally:
+                container.remove(force=True)
+        finally:
+            client.close()
+        return result.get('StatusCode', 1), output
+    
+    def _create_database_from_template(self):
+        """Clone the database from the pre-warmed template pool when possible"""
+        module_names = self.plan_id.included_module_ids.mapped('technical_name')
+        try:
+            template = self.env['saas.database.template'].create_database_from_template(
+                self.database_name, self.odoo_version, module_names)
         except Exception as e:
-            error_msg = f"Failed to execute database creation script: {str(e)}"
-            self._create_log('error', error_msg)
-            raise Exception(error_msg)
+            self._create_log('warning', f'Template clone failed, falling back to full creation: {str(e)}')
+            return False
         
-        self._create_log('info', f'Database {self.database_name} created successfully')
-
+        if template:
+            self._create_log('info', f'Database {self.database_name} cloned from template {template.database_name}')
+        return bool(template)
+    
     def _deploy_container(self):
         """Deploy Docker container for the instance"""
         if not HAS_DOCKER:
             raise Exception("Docker library not available. Please install: pip install docker")
 
         try:
-            # 🔎 Bước 1: Kiểm tra kết nối PostgreSQL trước
-            conn = psycopg2.connect(
-                dbname=self.database_name,
-                user='odoo',                  # hoặc self.db_user nếu có
-                password='odoo',              # hoặc self.db_password
-                host='db',             # đổi từ localhost thành tên service container postgres
-                port=5432
-            )
-            conn.close()
+            # 🔎 Bước 1: Kiểm tra database trước, qua pool kết nối dùng chung
+            with self.env['saas.database.template']._pg_connection() as conn, conn.cursor() as cr:
+                cr.execute("SELECT datallowconn FROM pg_database WHERE datname = %s", (self.database_name,))
+                row = cr.fetchone()
+            if not row or not row[0]:
+                raise psycopg2.OperationalError(f'database "{self.database_name}" does not exist or refuses connections')
             self._create_log('info', f"✅ Database {self.database_name} is accessible")
 
             # 🐳 Bước 2: Khởi tạo Docker container
-            client = docker.from_env()
+            host = self._place_container()
+            client = host._get_client()
+            host._sync_pooler()
 
-            volume_name = f'odoo_data_{self.database_name}'
+            # Reuse the container left by a previous attempt
             try:
-                # Tạo volume Docker (nếu chưa có)
-                client.volumes.get(volume_name)
+                container = client.containers.get(f'odoo_{self.database_name}')
             except docker.errors.NotFound:
-                client.volumes.create(name=volume_name)
-            
-            container_config = {
-                'image': f'odoo:{self.odoo_version}',
-                'name': f'odoo_{self.database_name}',
-                'ports': {'8069/tcp': self.port},
-                'environment': {
-                    'HOST': 'db',               # Đây là tên host DB trong mạng Docker
-                    'USER': 'odoo',
-                    'PASSWORD': 'odoo',
-                    'DATABASE': self.database_name,  # thêm biến để Odoo biết tên DB
-                },
-                'volumes': {
-                    volume_name: {
-                        'bind': '/var/lib/odoo',
-                        'mode': 'rw'
-                    }
-                },
-                'network': 'odoo17-tutorial_default',
-                'detach': True,
-                'restart_policy': {"Name": "unless-stopped"},
-                'command': f"--db-filter=^{self.database_name}$",
-            }
+                container = None
+            if container:
+                if container.status != 'running':
+                    container.start()
+                self.write({
+                    'container_id': container.id,
+                    'volume_name': self._get_container_volume(container) or self.volume_name,
+                })
+                self._create_log('info', f'✅ Reusing existing container {container.id}')
+                return
 
-            container = client.containers.run(**container_config)
+            # Bind a warm standby container instead of starting one from cold,
+            # the standby pool only runs on the default host
+            member = self.env['saas.standby.container']
+            # An instance initialised in its own image already has its data volume
+            if host == self.env['saas.docker.host']._get_default_host() and not self.volume_name:
+                member = member.bind_instance(self)
+            if member:
+                # The instance takes over the port of the standby container
+                Ports = self.env['saas.port.allocation']
+                Ports.release(instance=self)
+                Ports.transfer(member, self)
+                self.write({'container_id': member.container_id, 'port': member.port})
+                self._create_log('info', f'✅ Standby container {member.container_name} bound to {self.database_name}')
+                return
+
+            # Created stopped so the configuration is in place on first start
+            container = client.containers.create(**self._get_container_config(client, host))
+            self._write_tenant_config(container)
+            container.start()
             self.container_id = container.id
             self._create_log('info', f'✅ Container {container.id} deployed successfully')
 
@@ -448,48 +672,234 @@ class SaasInstanceProvisioning(models.Model):
             self._create_log('error', f'❌ Unexpected error: {str(e)}')
             raise Exception(f"Container deployment failed: {str(e)}")
 
-    def _wait_for_odoo(self, timeout=90):
-        """Wait until Odoo is up and responding on HTTP"""
-        container_host = f"odoo_{self.database_name}"  # tên container bạn đặt khi tạo
-        url = f"http://{container_host}:8069"
-        deadline = time.time() + timeout
-
-        while time.time() < deadline:
+    def _get_container_config(self, client, host):
+        """Arguments of containers.run/create for the instance on the host"""
+        volume_name = self._get_volume_name()
+        try:
+            # Tạo volume Docker (nếu chưa có)
+            client.volumes.get(volume_name)
+        except docker.errors.NotFound:
+            client.volumes.create(name=volume_name)
+        self.volume_name = volume_name
+        
+        return {
+            'image': f'odoo:{self.odoo_version}',
+            'name': f'odoo_{self.database_name}',
+            'ports': {'8069/tcp': self.port},
+            'environment': {
+                **host._get_tenant_db_env(),     # PostgreSQL hoặc pooler trong mạng Docker
+                'DATABASE': self.database_name,  # thêm biến để Odoo biết tên DB
+                'ODOO_RC': TENANT_CONFIG_PATH,
+            },
+            'volumes': {
+                volume_name: {
+                    'bind': '/var/lib/odoo',
+                    'mode': 'rw'
+                }
+            },
+            'network': host.network,
+            'detach': True,
+            'restart_policy': {"Name": "unless-stopped"},
+            'command': f"--db-filter=^{self.database_name}$",
+            'healthcheck': ODOO_HEALTHCHECK,
+            **self._get_resource_limits(),
+        }
+    
+    def _get_volume_name(self):
+        """Data volume of the instance, named after the database unless inherited"""
+        return self.volume_name or f'odoo_data_{self.database_name}'
+    
+    def _get_container_volume(self, container):
+        """Name of the volume mounted on /var/lib/odoo in the container"""
+        for mount in container.attrs.get('Mounts') or []:
+            if mount.get('Destination') == '/var/lib/odoo' and mount.get('Type') == 'volume':
+                return mount.get('Name')
+        return False
+    
+    def _get_resource_limits(self):
+        """Docker CPU and memory limits of the instance, without swap"""
+        limits = {}
+        if self.cpu_limit:
+            limits['nano_cpus'] = int(self.cpu_limit * 1e9)
+        if self.memory_limit:
+            limits['mem_limit'] = f'{self.memory_limit}m'
+            limits['memswap_limit'] = f'{self.memory_limit}m'
+        return limits
+    
+    def _get_tenant_config(self):
+        """Odoo configuration file of the instance"""
+        config = (
+            "[options]\n"
+            "addons_path = /mnt/extra-addons\n"
+            "data_dir = /var/lib/odoo\n"
+            f"db_name = {self.database_name}\n"
+            f"dbfilter = ^{self.database_name}$\n"
+        )
+        if self.workers:
+            # Recycle a worker before the container hits its cgroup limit
+            processes = self.workers + 1
+            memory = self.memory_limit * 1024 * 1024
+            config += (
+                f"workers = {self.workers}\n"
+                "max_cron_threads = 1\n"
+                f"limit_memory_soft = {memory * 2 // (3 * processes)}\n"
+                f"limit_memory_hard = {memory // processes}\n"
+            )
+        return config
+    
+    def _write_tenant_config(self, container):
+        """Write the Odoo configuration into the container data volume"""
+        data = self._get_tenant_config().encode()
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            info = tarfile.TarInfo(os.path.basename(TENANT_CONFIG_PATH))
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+        if not container.put_archive(os.path.dirname(TENANT_CONFIG_PATH), archive.getvalue()):
+            raise Exception("Failed to write tenant configuration")
+    
+    def _uses_tenant_config(self, container):
+        """False for containers deployed before the configuration file existed"""
+        return f'ODOO_RC={TENANT_CONFIG_PATH}' in (container.attrs.get('Config', {}).get('Env') or [])
+    
+    def _apply_resource_limits(self, container):
+        """Apply the limits to a running container, no restart needed"""
+        limits = {}
+        if self.cpu_limit:
+            # containers.update does not take nano_cpus
+            limits.update(cpu_period=100000, cpu_quota=int(self.cpu_limit * 100000))
+        if self.memory_limit:
+            limits.update(mem_limit=f'{self.memory_limit}m', memswap_limit=f'{self.memory_limit}m')
+        if limits:
+            container.update(**limits)
+    
+    def _place_container(self):
+        """Docker host of the instance, picked by the scheduler on first deployment"""
+        if self.docker_host_id:
+            return self.docker_host_id
+        
+        host = self.env['saas.docker.host'].select_host(self.cpu_limit, self.memory_limit)
+        if host.name != LOCAL_HOST:
+            # The port given at creation is one of the local host
+            Ports = self.env['saas.port.allocation']
+            self.port = Ports.allocate(instance=self, host=host.name)
+            Ports.release(instance=self, host=LOCAL_HOST)
+        self.docker_host_id = host
+        self._create_log('info', f'Instance placed on Docker host {host.name}')
+        return host
+    
+    def _get_docker_host(self):
+        return self.docker_host_id or self.env['saas.docker.host']._get_default_host()
+    
+    def _get_docker_client(self, **kwargs):
+        """Docker client of the host running the instance"""
+        host = self._get_docker_host()
+        if not host:
+            return docker.from_env(**kwargs)
+        return host._get_client(**kwargs)
+    
+    def _wait_for_odoo(self, timeout=90, since=None, slot_timeout=30):
+        """Wait until Odoo is up and responding on HTTP.
+        
+        Without ``since`` this blocks for up to ``timeout`` seconds. With
+        ``since`` (when the container was started) it only waits
+        ``slot_timeout`` seconds, then raises ProvisioningDeferred so the
+        worker can provision other instances until the timeout has elapsed.
+        """
+        url = self._get_tenant_url()
+        wait = timeout if since is None else slot_timeout
+        
+        if self._wait_for_container_health(wait):
+            self._create_log('info', f"Odoo instance is up at {url}")
+            return
+        
+        if since is not None and fields.Datetime.now() < since + timedelta(seconds=timeout):
+            raise ProvisioningDeferred(f"Waiting for Odoo at {url} to become ready")
+        raise Exception(f"Timed out waiting for Odoo at {url}")
+    
+    def _wait_for_container_health(self, wait):
+        """Wait for the container healthcheck, or probe Odoo when it has none"""
+        start = time.time()
+        if HAS_DOCKER:
+            try:
+                client = self._get_docker_client()
+                container = client.containers.get(self.container_id or f"odoo_{self.database_name}")
+                health = container.attrs.get('State', {}).get('Health')
+                if health:
+                    if health.get('Status') == 'healthy':
+                        return True
+                    # Replays events from ``start`` so a transition right after
+                    # reading the state is not missed
+                    events = client.events(
+                        since=int(start), until=int(start + wait) + 1, decode=True,
+                        filters={'container': container.id, 'event': 'health_status'},
+                    )
+                    for event in events:
+                        if event.get('status', '').split(':')[-1].strip() == 'healthy':
+                            return True
+                    return False
+            except Exception as e:
+                _logger.warning(f"Cannot watch container health of instance {self.id}: {str(e)}")
+        
+        return self._probe_odoo_health(max(0, wait - (time.time() - start)))
+    
+    def _probe_odoo_health(self, wait):
+        """Probe /web/health with an exponential backoff"""
+        url = f"{self._get_tenant_url()}/web/health"
+        deadline = time.time() + wait
+        delay = 0.5
+        
+        while True:
             try:
                 res = requests.get(url, timeout=5)
                 if res.status_code == 200:
-                    self._create_log('info', f"Odoo instance is up at {url}")
-                    return
-            except requests.exceptions.ConnectionError:
+                    return True
+            except requests.exceptions.RequestException:
                 pass
-            time.sleep(3)
-
-        raise Exception(f"Timed out waiting for Odoo at {url}")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 10)
+    
+    def _get_tenant_url(self):
+        """Internal URL of the instance, on the Docker network or on its host"""
+        container_host = f"odoo_{self.database_name}"  # tên container bạn đặt khi tạo
+        host = self._get_docker_host()
+        if host:
+            return host._get_container_url(container_host, self.port)
+        return f"http://{container_host}:8069"
+    
+    def _get_tenant_client(self):
+        """RPC session on the instance, shared by all steps of a provisioning run"""
+        key = (self.env.cr.dbname, self.id)
+        client = _TENANT_CLIENTS.get(key)
+        if not client:
+            # Default credentials of a fresh database, then the configured ones
+            # in case a previous attempt already changed them
+            credentials = [('admin', 'admin')]
+            if self.admin_email and self.admin_password:
+                credentials.append((self.admin_email, self.admin_password))
+            client = TenantRPCClient(self._get_tenant_url(), self.database_name, credentials)
+            _TENANT_CLIENTS[key] = client
+        return client
+    
+    def _close_tenant_client(self):
+        client = _TENANT_CLIENTS.pop((self.env.cr.dbname, self.id), None)
+        if client:
+            client.close()
     
     def _install_modules(self):
         """Install modules based on service plan"""
+        # Wait for Odoo to start, counted from the container deployment. The
+        # next steps need it too, so also when the plan has no modules
+        self._wait_for_odoo(timeout=240, since=self.provisioning_step_date)
         if not self.plan_id.included_module_ids:
             return
 
         try:
-            # Wait for Odoo to start
-            self._wait_for_odoo(timeout=240)
-
-            # RPC connection
-            # url = f'http://localhost:{self.port}'
-            container_host = f"odoo_{self.database_name}"  # tên container bạn đặt khi tạo
-            url = f"http://{container_host}:8069"
-            db = self.database_name
-            username = 'admin'
-            password = 'admin'
-
-            common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-            uid = common.authenticate(db, username, password, {})
-
-            if not uid:
-                raise Exception("Authentication failed to instance")
-
-            models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+            client = self._get_tenant_client()
 
             # Build list of module names
             module_names = [
@@ -503,53 +913,57 @@ class SaasInstanceProvisioning(models.Model):
                 return
 
             # Search modules using 'in' operator — SAFELY
-            module_ids = models.execute_kw(
-                db, uid, password,
-                'ir.module.module', 'search',
-                [[('name', 'in', module_names)]]
+            modules = client.execute(
+                'ir.module.module', 'search_read',
+                [('name', 'in', module_names)],
+                fields=['state'],
             )
 
-            if not module_ids:
+            if not modules:
                 self._create_log('warning', f"No matching modules found in instance for: {module_names}")
                 return
 
+            # Skip modules installed by a previous attempt
+            module_ids = [module['id'] for module in modules if module['state'] != 'installed']
+            if not module_ids:
+                self._create_log('info', f"Modules already installed: {module_names}")
+                return
+
             # Install all at once
-            models.execute_kw(
-                db, uid, password,
-                'ir.module.module', 'button_immediate_install',
-                [module_ids]
-            )
+            client.execute('ir.module.module', 'button_immediate_install', module_ids)
             self._create_log('info', f"Installed modules: {module_names}")
 
+        except ProvisioningDeferred:
+            raise
         except xmlrpc.client.Fault as fault:
             raise Exception(f"XML-RPC Fault: {fault.faultString}")
         except Exception as e:
             raise Exception(f"Module installation failed: {str(e)}")
     
     def _setup_admin_user(self):
-        """Setup admin user for the instance"""
+        """Setup admin user and company information in a single write"""
         try:
-            container_host = f"odoo_{self.database_name}"  # tên container bạn đặt khi tạo
-            url = f"http://{container_host}:8069"
-            db = self.database_name
-            username = 'admin'
-            password = 'admin'
-            
-            common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-            uid = common.authenticate(db, username, password, {})
-            
-            models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
-            
-            # Update admin user
-            models.execute_kw(
-                db, uid, password,
-                'res.users', 'write',
-                [uid, {
-                    'login': self.admin_email,
-                    'email': self.admin_email,
-                    'password': self.admin_password,
-                }]
-            )
+            client = self._get_tenant_client()
+            client.authenticate()
+            
+            if client.login == self.admin_email:
+                # Credentials were already changed by a previous attempt
+                self._create_log('info', 'Admin user already configured')
+                return
+            
+            company_ids = client.execute('res.company', 'search', [], limit=1)
+            
+            # Update admin user, and its company through company_ids
+            vals = {
+                'login': self.admin_email,
+                'email': self.admin_email,
+                'password': self.admin_password,
+            }
+            if company_ids:
+                vals['company_ids'] = [(1, company_ids[0], {'name': self.company_name})]
+            client.execute('res.users', 'write', [client.uid], vals)
+            client.set_password(self.admin_email, self.admin_password)
+            client.company_configured = bool(company_ids)
             
             self._create_log('info', 'Admin user configured successfully')
             
@@ -559,29 +973,13 @@ class SaasInstanceProvisioning(models.Model):
     def _setup_company(self):
         """Setup company information"""
         try:
-            container_host = f"odoo_{self.database_name}"  # tên container bạn đặt khi tạo
-            url = f"http://{container_host}:8069"
-            db = self.database_name
-            username = self.admin_email
-            password = self.admin_password
-            
-            common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-            uid = common.authenticate(db, username, password, {})
-            
-            models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
-            
-            # Get company
-            company_ids = models.execute_kw(
-                db, uid, password,
-                'res.company', 'search', [[]]
-            )
+            client = self._get_tenant_client()
             
-            if company_ids:
-                models.execute_kw(
-                    db, uid, password,
-                    'res.company', 'write',
-                    [company_ids[0], {'name': self.company_name}]
-                )
+            # Already written together with the admin user during this run
+            if not client.company_configured:
+                company_ids = client.execute('res.company', 'search', [], limit=1)
+                if company_ids:
+                    client.execute('res.company', 'write', company_ids, {'name': self.company_name})
             
             self._create_log('info', 'Company information configured')
             
@@ -602,29 +1000,16 @@ class SaasInstanceProvisioning(models.Model):
         """Setup localization modules"""
         # Install Vietnamese localization as default
         try:
-            url = f'http://localhost:{self.port}'
-            db = self.database_name
-            username = self.admin_email
-            password = self.admin_password
-            
-            common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-            uid = common.authenticate(db, username, password, {})
-            
-            models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+            client = self._get_tenant_client()
             
             # Install l10n_vn
-            module_ids = models.execute_kw(
-                db, uid, password,
+            module_ids = client.execute(
                 'ir.module.module', 'search',
                 [['name', '=', 'l10n_vn']]
             )
             
             if module_ids:
-                models.execute_kw(
-                    db, uid, password,
-                    'ir.module.module', 'button_immediate_install',
-                    [module_ids]
-                )
+                client.execute('ir.module.module', 'button_immediate_install', module_ids)
                 self._create_log('info', 'Vietnamese localization installed')
             
         except Exception as e:
@@ -650,7 +1035,7 @@ class SaasInstanceProvisioning(models.Model):
             raise Exception("Docker library not available. Please install: pip install docker")
         
         try:
-            client = docker.from_env()
+            client = self._get_docker_client()
             container = client.containers.get(self.container_id)
             container.start()
         except Exception as e:
@@ -662,7 +1047,7 @@ class SaasInstanceProvisioning(models.Model):
             raise Exception("Docker library not available. Please install: pip install docker")
         
         try:
-            client = docker.from_env()
+            client = self._get_docker_client()
             container = client.containers.get(self.container_id)
             container.stop()
         except Exception as e:
@@ -675,112 +1060,668 @@ class SaasInstanceProvisioning(models.Model):
         
         try:
             # Stop and remove container
-            client = docker.from_env()
+            client = self._get_docker_client()
             container = client.containers.get(self.container_id)
             container.stop()
             container.remove()
+            try:
+                client.volumes.get(self._get_volume_name()).remove()
+            except docker.errors.NotFound:
+                pass
             
-            # Drop database
-            script_path = os.path.join(
-                os.path.dirname(__file__), 
-                '..', 'scripts', 'drop_database.sh'
-            )
+            # Close the pool of the database before dropping it
+            self._get_docker_host()._sync_pooler(exclude=self)
             
-            cmd = ['bash', script_path, self.database_name]
-            subprocess.run(cmd, check=True)
+            # Drop database
+            if not self.env['saas.database.template']._get_db_engine().drop(self.database_name):
+                self._create_log('warning', f'Database {self.database_name} does not exist')
             
         except Exception as e:
             raise Exception(f"Failed to terminate instance: {str(e)}")
     
-    def _create_backup(self):
-        """Create backup of instance"""
-        script_path = os.path.join(
-            os.path.dirname(__file__), 
-            '..', 'scripts', 'backup_instance.sh'
-        )
+    def _migrate_container(self, target):
+        """Move the container and its data volume to another Docker host.
+        
+        Docker cannot move a running container, so the source is stopped, its
+        /var/lib/odoo is streamed into a container created on the target,
+        which is started before the source is removed. The database stays
+        where it is. The instance is down for the copy and the start, any
+        failure restarts the source container.
+        """
+        if not HAS_DOCKER:
+            raise Exception("Docker library not available. Please install: pip install docker")
+        
+        source = self._get_docker_host()
+        if target == source:
+            return
         
-        cmd = ['bash', script_path, self.database_name]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        Ports = self.env['saas.port.allocation']
+        source_client = source._get_client()
+        source_container = source_client.containers.get(self.container_id)
+        was_running = source_container.status == 'running'
+        old_values = {'docker_host_id': source.id, 'container_id': self.container_id, 'port': self.port}
+        volume_name = self._get_volume_name()
         
-        if result.returncode != 0:
-            raise Exception(f"Backup failed: {result.stderr}")
+        target_client = target._get_client()
+        image = f'odoo:{self.odoo_version}'
+        try:
+            target_client.images.get(image)
+        except docker.errors.ImageNotFound:
+            target_client.images.pull(image)
+        
+        self.port = Ports.allocate(instance=self, host=target.name)
+        container = None
+        try:
+            if was_running:
+                source_container.stop()
+            self.docker_host_id = target
+            target._sync_pooler()
+            container = target_client.containers.create(**self._get_container_config(target_client, target))
+            data, _stat = source_container.get_archive('/var/lib/odoo')
+            if not container.put_archive('/var/lib', data):
+                raise Exception("Failed to copy the data volume")
+            self.write({'docker_host_id': target.id, 'container_id': container.id})
+            if was_running:
+                container.start()
+                if not self._wait_for_container_health(240):
+                    raise Exception(f"Odoo did not become healthy on {target.name}")
+        except Exception:
+            if container:
+                try:
+                    container.remove(force=True)
+                    target_client.volumes.get(volume_name).remove(force=True)
+                except Exception as e:
+                    _logger.warning(f"Cannot clean up the target container of instance {self.id}: {str(e)}")
+            Ports.release(instance=self, host=target.name)
+            self.write(old_values)
+            if was_running:
+                source_container.start()
+            raise
+        
+        source_container.remove()
+        try:
+            source_client.volumes.get(volume_name).remove()
+        except docker.errors.NotFound:
+            pass
+        Ports.release(instance=self, host=source.name)
+        source._sync_pooler()
+        self._create_log('info', f'Instance moved from Docker host {source.name} to {target.name}')
+    
+    def _create_backup(self, throttle=None):
+        """Create backup of instance"""
+        try:
+            return self.env['saas.instance.backup'].create_backup(self, throttle)
+        except Exception as e:
+            raise Exception(f"Backup failed: {str(e)}")
     
     def _create_log(self, level, message):
-        """Create log entry for the instance"""
-        self.env['saas.instance.provisioning.log'].create({
+        """Create log entry for the instance, buffered during a provisioning run"""
+        vals = {
             'instance_id': self.id,
             'level': level,
             'message': message,
             'timestamp': fields.Datetime.now(),
-        })
+            'user_id': self.env.uid,
+        }
+        buffer = _LOG_BUFFERS.get(self._log_buffer_key())
+        if buffer is None:
+            self.env['saas.instance.provisioning.log'].create(vals)
+            return
+        buffer['entries'].append(vals)
+        if level in ('error', 'critical'):
+            self._flush_logs()
     
-    @api.model
-    def cron_provision_instances(self):
-        """Cron job to provision pending instances"""
-        instances = self.search([('state', '=', 'provisioning')])
-        for instance in instances:
+    def _log_buffer_key(self):
+        return (self.env.cr.dbname, self.id, threading.get_ident())
+    
+    @contextmanager
+    def _buffered_logs(self, separate_cursor=False):
+        """Collect the log entries of the block and write them in batches.
+        
+        Entries are written by _flush_logs, on errors and when the block
+        ends. With separate_cursor they are committed on a cursor of their
+        own, so they survive a rollback of the current transaction.
+        """
+        self.ensure_one()
+        key = self._log_buffer_key()
+        _LOG_BUFFERS[key] = {'entries': [], 'separate_cursor': separate_cursor}
+        try:
+            yield
+        finally:
             try:
-                instance._provision_instance()
+                self._flush_logs()
             except Exception as e:
-                _logger.error(f"Failed to provision instance {instance.id}: {str(e)}")
+                _logger.error(f"Failed to write the logs of instance {self.id}: {str(e)}")
+            finally:
+                _LOG_BUFFERS.pop(key, None)
+    
+    def _flush_logs(self):
+        """Write the buffered log entries with one multi-row create"""
+        buffer = _LOG_BUFFERS.get(self._log_buffer_key())
+        if not buffer or not buffer['entries']:
+            return
+        entries, buffer['entries'] = buffer['entries'], []
+        self.env['saas.instance.provisioning.log']._create_batch(entries, buffer['separate_cursor'])
+    
+    @api.model
+    def cron_provision_instances(self):
+        """Cron job to provision pending instances with a bounded worker pool"""
+        pending = self.search_count([
+            ('state', '=', 'provisioning'),
+            '|', ('provisioning_retry_date', '=', False), ('provisioning_retry_date', '<=', fields.Datetime.now()),
+        ])
+        if not pending:
+            return
+        
+        workers = min(self._get_provisioning_concurrency(), pending)
+        _logger.info(f"Provisioning {pending} pending instance(s) with {workers} worker(s)")
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='saas_provisioning') as executor:
+            futures = [
+                executor.submit(self._provisioning_worker, self.env.cr.dbname, self.env.uid, dict(self.env.context))
+                for _ in range(workers)
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    _logger.error(f"Provisioning worker crashed: {str(e)}")
+    
+    @api.model
+    def _get_provisioning_concurrency(self):
+        """Get the maximum number of instances provisioned in parallel"""
+        value = self.env['ir.config_parameter'].sudo().get_param('saas.provisioning_concurrency', 4)
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return 1
+    
+    def _provisioning_worker(self, dbname, uid, context):
+        """Claim and provision instances one by one until none is left.
+        
+        Each instance is provisioned on a dedicated cursor, committed after
+        every step. The claim lock held by one worker (or by an overlapping
+        cron run) makes the instance invisible to the others until its run
+        is committed.
+        """
+        threading.current_thread().dbname = dbname
+        processed_ids = []
+        while True:
+            with self.pool.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                instance = env['saas.instance.provisioning']._claim_pending_instance(processed_ids)
+                if not instance:
+                    return len(processed_ids)
+                
+                processed_ids.append(instance.id)
+                try:
+                    try:
+                        instance._provision_instance()
+                    except Exception as e:
+                        _logger.error(f"Failed to provision instance {instance.id}: {str(e)}")
+                    cr.commit()
+                except Exception as e:
+                    _logger.error(f"Failed to record the provisioning of instance {instance.id}: {str(e)}")
+                finally:
+                    try:
+                        cr.rollback()
+                        instance._release_claim('provisioning')
+                    except Exception as e:
+                        # Only fails with a broken connection, the server drops its locks
+                        _logger.error(f"Failed to release the provisioning claim of instance {instance.id}: {str(e)}")
+    
+    @api.model
+    def _claim_pending_instance(self, exclude_ids=None):
+        """Lock the next instance due for provisioning, skipping claimed ones.
+        
+        The claim is a session advisory lock (see _try_claim), unlike a row
+        lock it outlives the commits of the provisioning steps.
+        """
+        query = """
+            SELECT id FROM saas_instance_provisioning
+            WHERE state = 'provisioning'
+              AND (provisioning_retry_date IS NULL OR provisioning_retry_date <= now() at time zone 'UTC')
+        """
+        params = []
+        if exclude_ids:
+            query += " AND id NOT IN %s"
+            params.append(tuple(exclude_ids))
+        query += " ORDER BY id"
+        
+        self.env.cr.execute(query, params)
+        for instance_id, in self.env.cr.fetchall():
+            instance = self.browse(instance_id)
+            if not instance._try_claim('provisioning'):
+                continue
+            # Another worker may have completed the instance before the lock,
+            # check again on a fresh snapshot
+            self.env.cr.commit()
+            self.env.cr.execute("""
+                SELECT 1 FROM saas_instance_provisioning
+                WHERE id = %s AND state = 'provisioning'
+            """, (instance_id,))
+            if self.env.cr.fetchone():
+                self.invalidate_model()
+                return instance
+            instance._release_claim('provisioning')
+        return self.browse()
+    
+    def _try_claim(self, kind):
+        """Take the session advisory lock of an operation on the instance.
+        
+        The lock survives the commits of the cursor, so the instance can be
+        worked on without holding its row lock. Returns False when another
+        cursor holds it.
+        """
+        self.env.cr.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f'saas.{kind}.{self.id}',))
+        return self.env.cr.fetchone()[0]
+    
+    def _release_claim(self, kind):
+        """Release a lock taken by _try_claim.
+        
+        The unlock fails in an aborted transaction, workers roll back first
+        so the lock is not left on the pooled connection.
+        """
+        self.env.cr.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f'saas.{kind}.{self.id}',))
     
     @api.model
     def cron_backup_instances(self):
-        """Cron job to backup instances"""
-        instances = self.search([
+        """Cron job to backup due instances with a bounded worker pool"""
+        due = self.search_count([
             ('state', '=', 'active'),
             ('backup_enabled', '=', True),
-            ('next_backup', '<=', fields.Datetime.now())
+            '|', ('next_backup', '=', False), ('next_backup', '<=', fields.Datetime.now()),
         ])
+        if not due:
+            return
         
-        for instance in instances:
-            try:
-                instance.action_backup()
-            except Exception as e:
-                _logger.error(f"Failed to backup instance {instance.id}: {str(e)}")
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        workers = min(max(1, int(ICPSudo.get_param('saas.backup_concurrency', 2))), due)
+        # One throttle for all workers, the bandwidth cap is global
+        throttle = self.env['saas.instance.backup']._get_throttle()
+        _logger.info(f"Backing up {due} instance(s) with {workers} worker(s)")
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='saas_backup') as executor:
+            futures = [
+                executor.submit(self._backup_worker, self.env.cr.dbname, self.env.uid, dict(self.env.context), throttle)
+                for _ in range(workers)
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    _logger.error(f"Backup worker crashed: {str(e)}")
+    
+    def _backup_worker(self, dbname, uid, context, throttle):
+        """Claim and back up due instances one by one until none is left"""
+        threading.current_thread().dbname = dbname
+        processed_ids = []
+        while True:
+            with self.pool.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                instance = env['saas.instance.provisioning']._claim_due_backup(processed_ids)
+                if not instance:
+                    return len(processed_ids)
+                
+                processed_ids.append(instance.id)
+                try:
+                    try:
+                        instance._backup_instance(throttle)
+                    except Exception as e:
+                        _logger.error(f"Failed to backup instance {instance.id}: {str(e)}")
+                    cr.commit()
+                except Exception as e:
+                    _logger.error(f"Failed to record the backup of instance {instance.id}: {str(e)}")
+                finally:
+                    try:
+                        cr.rollback()
+                        instance._release_claim('backup')
+                    except Exception as e:
+                        _logger.error(f"Failed to release the backup claim of instance {instance.id}: {str(e)}")
+    
+    @api.model
+    def _claim_due_backup(self, exclude_ids=None):
+        """Claim the next instance due for a backup, skipping claimed ones.
+        
+        The claim is a session advisory lock and the claim is committed, so
+        no row lock is held while the backup runs: monitoring, traffic
+        reports and hibernation keep writing the instance.
+        """
+        due = """
+            state = 'active' AND backup_enabled
+            AND (next_backup IS NULL OR next_backup <= (now() at time zone 'UTC'))
+        """
+        query = f"SELECT id FROM saas_instance_provisioning WHERE {due}"
+        params = []
+        if exclude_ids:
+            query += " AND id NOT IN %s"
+            params.append(tuple(exclude_ids))
+        query += " ORDER BY next_backup NULLS FIRST, id"
+        
+        self.env.cr.execute(query, params)
+        for instance_id, in self.env.cr.fetchall():
+            instance = self.browse(instance_id)
+            if not instance._try_claim('backup'):
+                continue
+            # Another worker may have backed the instance up before the lock,
+            # check again on a fresh snapshot
+            self.env.cr.commit()
+            self.env.cr.execute(f"SELECT 1 FROM saas_instance_provisioning WHERE id = %s AND {due}", (instance_id,))
+            if self.env.cr.fetchone():
+                self.invalidate_model()
+                return instance
+            instance._release_claim('backup')
+        return self.browse()
     
     @api.model
     def cron_monitor_instances(self):
         """Cron job to monitor instance health"""
         instances = self.search([('state', '=', 'active')])
+        try:
+            instances._update_resource_usage()
+        except Exception as e:
+            _logger.error(f"Failed to monitor instances: {str(e)}")
+    
+    def _update_resource_usage(self):
+        """Update resource usage statistics of all instances in one pass"""
+        if not HAS_DOCKER:
+            for record in self:
+                record._create_log('warning', 'Docker library not available for resource monitoring')
+            return
+        
+        instances = self.filtered('container_id')
+        if not instances:
+            return
+        
+        concurrency = int(self.env['ir.config_parameter'].sudo().get_param('saas.monitoring_concurrency', 16))
+        usage, errors = {}, {}
+        by_host = {}
         for instance in instances:
+            by_host.setdefault(instance._get_docker_host(), []).append(instance.container_id)
+        for host, container_ids in by_host.items():
             try:
-                instance._update_resource_usage()
+                client = host._get_client(max_pool_size=max(1, concurrency)) if host \
+                    else docker.from_env(max_pool_size=max(1, concurrency))
             except Exception as e:
-                _logger.error(f"Failed to monitor instance {instance.id}: {str(e)}")
+                errors.update(dict.fromkeys(container_ids, str(e)))
+                continue
+            try:
+                host_usage, host_errors = collect_usage(client, container_ids, max_workers=concurrency)
+            finally:
+                client.close()
+            usage.update(host_usage)
+            errors.update(host_errors)
+        
+        # One UPDATE for all instances instead of a write per record
+        rows = [
+            (instance.id, *usage[instance.container_id])
+            for instance in instances if instance.container_id in usage
+        ]
+        if rows:
+            execute_values(self.env.cr, """
+                UPDATE saas_instance_provisioning AS i
+                SET cpu_usage = COALESCE(v.cpu_usage, i.cpu_usage),
+                    memory_usage = COALESCE(v.memory_usage, i.memory_usage)
+                FROM (VALUES %s) AS v(id, cpu_usage, memory_usage)
+                WHERE i.id = v.id
+            """, rows, template='(%s, %s::float8, %s::float8)')
+            self.invalidate_model(['cpu_usage', 'memory_usage'])
+            self.env['saas.instance.metric'].record_samples([
+                (instance.id, *usage[instance.container_id], instance.storage_usage, None)
+                for instance in instances if instance.container_id in usage
+            ])
+        
+        for instance in instances:
+            if instance.container_id in errors:
+                instance._create_log('error', f'Failed to update resource usage: {errors[instance.container_id]}')
     
-    def _update_resource_usage(self):
-        """Update resource usage statistics"""
-        if not HAS_DOCKER:
-            self._create_log('warning', 'Docker library not available for resource monitoring')
+    @api.model
+    def cron_check_storage_quotas(self):
+        """Cron job to measure instance storage against the plan quotas"""
+        instances = self.search([('state', 'in', ['active', 'hibernated', 'suspended'])])
+        try:
+            instances._update_storage_usage()
+        except Exception as e:
+            _logger.error(f"Failed to check storage quotas: {str(e)}")
+    
+    def _update_storage_usage(self):
+        """Storage usage of the instances: database plus data volume.
+        
+        Docker local volumes have no size quota, so the quota is enforced by
+        measuring. Database sizes come from one query, volume sizes from one
+        disk usage call per Docker host.
+        """
+        if not self:
             return
+        self.env.cr.execute(
+            "SELECT datname, pg_database_size(datname) FROM pg_database WHERE datname IN %s",
+            (tuple(self.mapped('database_name')),),
+        )
+        sizes = dict(self.env.cr.fetchall())
+        
+        if HAS_DOCKER:
+            by_host = {}
+            for instance in self.filtered('container_id'):
+                host = instance._get_docker_host()
+                by_host[host] = by_host.get(host, self.browse()) | instance
+            for host, instances in by_host.items():
+                try:
+                    client = instances[0]._get_docker_client()
+                    try:
+                        volumes = {
+                            volume['Name']: (volume.get('UsageData') or {}).get('Size') or 0
+                            for volume in client.df().get('Volumes') or []
+                        }
+                    finally:
+                        client.close()
+                except Exception as e:
+                    _logger.warning(f"Cannot read volume sizes on {host.name or 'local'}: {str(e)}")
+                    continue
+                for instance in instances:
+                    sizes[instance.database_name] = sizes.get(instance.database_name, 0) + \
+                        volumes.get(instance._get_volume_name(), 0)
+        
+        for instance in self:
+            if not instance.storage_limit or instance.database_name not in sizes:
+                continue
+            usage = sizes[instance.database_name] / (instance.storage_limit * 1024 ** 3) * 100.0
+            if usage > 100 >= instance.storage_usage:
+                instance._create_log('warning', f'Storage quota exceeded: {usage:.0f}% of {instance.storage_limit} GB')
+            instance.storage_usage = usage
+    
+    # ------------------------------------------------------------------
+    # Hibernation
+    # ------------------------------------------------------------------
+    
+    @api.model
+    def record_traffic(self, counts):
+        """Record the request counts reported by the reverse proxy.
+        
+        ``counts`` maps subdomains to the number of requests since the
+        previous report. Instances with requests get their last activity
+        moved to now, the counts go to the metrics.
+        """
+        counts = {subdomain: int(count) for subdomain, count in (counts or {}).items() if int(count) > 0}
+        if not counts:
+            return 0
+        self.env.cr.execute("""
+            UPDATE saas_instance_provisioning
+            SET last_activity = now() at time zone 'UTC'
+            WHERE subdomain IN %s AND state IS DISTINCT FROM 'terminated'
+            RETURNING id, subdomain
+        """, (tuple(counts),))
+        rows = self.env.cr.fetchall()
+        self.invalidate_model(['last_activity'])
+        self.env['saas.instance.metric'].record_samples([
+            (instance_id, None, None, None, counts[subdomain]) for instance_id, subdomain in rows
+        ])
+        return len(rows)
+    
+    @api.model
+    def cron_hibernate_idle_instances(self, limit=20):
+        """Cron job to stop the containers of idle instances"""
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        if ICPSudo.get_param('saas.hibernation_enabled', 'False').lower() != 'true':
+            return
+        idle_hours = int(ICPSudo.get_param('saas.hibernation_idle_hours', 72))
+        
+        for instance in self._get_idle_instances(idle_hours, limit):
+            try:
+                instance._hibernate()
+                self.env.cr.commit()
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error(f"Failed to hibernate instance {instance.id}: {str(e)}")
+    
+    @api.model
+    def _get_idle_instances(self, idle_hours, limit):
+        """Active instances without a request in the last idle_hours.
+        
+        The last activity comes from the proxy reports, the request counts of
+        the metrics cover reports that raced with this query.
+        """
+        self.env.cr.execute("""
+            SELECT i.id FROM saas_instance_provisioning i
+            WHERE i.state = 'active' AND i.container_id IS NOT NULL
+              AND coalesce(i.last_activity, i.provisioned_date, i.create_date)
+                  < (now() at time zone 'UTC') - %(idle)s * interval '1 hour'
+              AND NOT EXISTS (
+                  SELECT 1 FROM saas_instance_metric m
+                  WHERE m.instance_id = i.id AND m.tier = 'raw' AND m.request_count > 0
+                    AND m.timestamp >= (now() at time zone 'UTC') - %(idle)s * interval '1 hour'
+              )
+            ORDER BY coalesce(i.last_activity, i.provisioned_date, i.create_date)
+            LIMIT %(limit)s
+        """, {'idle': idle_hours, 'limit': limit})
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+    
+    def _hibernate(self):
+        """Stop the container of an idle instance, the next request wakes it up"""
+        self._stop_container()
+        self.write({
+            'state': 'hibernated',
+            'hibernated_date': fields.Datetime.now(),
+            'cpu_usage': 0.0,
+            'memory_usage': 0.0,
+        })
+        self._create_log('info', f'Instance hibernated, idle since {self.last_activity or self.provisioned_date}')
+    
+    def request_wake(self):
+        """Wake a hibernated instance up, once for concurrent requests"""
+        self.ensure_one()
+        self.env.cr.execute("""
+            UPDATE saas_instance_provisioning
+            SET wake_requested = now() at time zone 'UTC'
+            WHERE id = %s AND state = 'hibernated'
+              AND (wake_requested IS NULL OR wake_requested < (now() at time zone 'UTC') - interval '10 minutes')
+            RETURNING id
+        """, (self.id,))
+        if not self.env.cr.fetchone():
+            return False
+        self.invalidate_recordset(['wake_requested'])
+        self._start_wake()
+        return True
+    
+    def action_wake(self):
+        """Start hibernated instances, they become active once Odoo answers"""
+        for record in self:
+            if record.state != 'hibernated':
+                continue
+            record.wake_requested = fields.Datetime.now()
+            record._start_wake()
+    
+    def _start_wake(self):
+        """Start the container right away, the wake-up cron waits for Odoo.
         
+        Nothing waits in the caller, so a wake-up neither queues behind the
+        jobs of the runner nor holds the request.
+        """
         try:
-            client = docker.from_env()
-            container = client.containers.get(self.container_id)
-            
-            # Get container stats
-            stats = container.stats(stream=False)
-            
-            # Calculate CPU usage
-            cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
-                       stats['precpu_stats']['cpu_usage']['total_usage']
-            system_delta = stats['cpu_stats']['system_cpu_usage'] - \
-                          stats['precpu_stats']['system_cpu_usage']
-            
-            if system_delta > 0:
-                self.cpu_usage = (cpu_delta / system_delta) * 100.0
-            
-            # Calculate memory usage
-            if 'usage' in stats['memory_stats']:
-                memory_usage = stats['memory_stats']['usage']
-                memory_limit = stats['memory_stats']['limit']
-                self.memory_usage = (memory_usage / memory_limit) * 100.0
-            
-            self.last_activity = fields.Datetime.now()
-            
+            self._start_container()
         except Exception as e:
-            self._create_log('error', f'Failed to update resource usage: {str(e)}')
+            self.wake_requested = False
+            self._create_log('error', f'Failed to wake instance up: {str(e)}')
+            raise UserError(_('Failed to wake instance up: %s') % str(e))
+        self._create_log('info', 'Container started, waiting for Odoo to answer')
+        self.env.ref('odoo_instance_provisioning.ir_cron_complete_wake_ups').sudo()._trigger()
+    
+    @api.model
+    def cron_complete_wake_ups(self, limit=20):
+        """Cron job to activate the woken up instances once Odoo answers"""
+        waking = self.search([
+            ('state', '=', 'hibernated'),
+            ('wake_requested', '!=', False),
+        ], order='wake_requested', limit=limit)
+        if not waking:
+            return
+        
+        # Waiting on the health events of one instance must not delay the others
+        with ThreadPoolExecutor(max_workers=len(waking), thread_name_prefix='saas_wake') as executor:
+            futures = [
+                executor.submit(self._wake_worker, self.env.cr.dbname, self.env.uid, dict(self.env.context), instance.id)
+                for instance in waking
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    _logger.error(f"Wake-up worker crashed: {str(e)}")
+    
+    def _wake_worker(self, dbname, uid, context, instance_id):
+        """Complete the wake-up of one instance on a dedicated cursor"""
+        threading.current_thread().dbname = dbname
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            env['saas.instance.provisioning'].browse(instance_id)._complete_wake()
+    
+    def _complete_wake(self):
+        """Activate the instance once Odoo answers, the cron tries again until the timeout"""
+        try:
+            self._wait_for_odoo(timeout=120, since=self.wake_requested)
+        except ProvisioningDeferred:
+            self.env.ref('odoo_instance_provisioning.ir_cron_complete_wake_ups').sudo()._trigger()
+            return
+        except Exception as e:
+            self.wake_requested = False
+            self._create_log('error', f'Failed to wake instance up: {str(e)}')
+            # A hibernated instance must not keep a running container
+            try:
+                self._stop_container()
+                self._create_log('info', 'Container stopped again, instance stays hibernated')
+            except Exception as stop_error:
+                self.state = 'error'
+                self._create_log('error', f'Failed to stop container after failed wake-up: {str(stop_error)}')
+            return
+        self.write({
+            'state': 'active',
+            'last_activity': fields.Datetime.now(),
+            'hibernated_date': False,
+            'wake_requested': False,
+        })
+        self._create_log('info', 'Instance woken up')
+    
+    def action_view_backups(self):
+        """Action to view backups of this instance"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Backups of {self.name}',
+            'res_model': 'saas.instance.backup',
+            'view_mode': 'tree,form',
+            'domain': [('instance_id', '=', self.id)],
+            'target': 'current',
+        }
+    
+    def action_view_metrics(self):
+        """Action to view resource metrics for this instance"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Metrics for {self.name}',
+            'res_model': 'saas.instance.metric',
+            'view_mode': 'graph,tree',
+            'domain': [('instance_id', '=', self.id)],
+            'context': {'search_default_tier_5m': 1},
+            'target': 'current',
+        }
     
     def action_view_logs(self):
         """Action to view logs for this instance"""
@@ -796,83 +1737,18 @@ class SaasInstanceProvisioning(models.Model):
     
     def _check_postgres_connection(self):
         """Check PostgreSQL connection before provisioning"""
-        try:
-            # Get database configuration from Odoo's config
-            from odoo import tools
-            db_host = tools.config.get('db_host', 'localhost')
-            db_port = tools.config.get('db_port', 5432)
-            db_user = tools.config.get('db_user', 'odoo')
-            db_password = tools.config.get('db_password', False)
-            
-            self._create_log('info', f'Checking PostgreSQL connection to {db_host}:{db_port}')
-            
-            # Try to connect using psycopg2 directly
-            try:
-                import psycopg2
-                conn = psycopg2.connect(
-                    host=db_host,
-                    port=db_port,
-                    user=db_user,
-                    password=db_password or '',
-                    database='postgres'  # Connect to default database
-                )
-                conn.close()
-                self._create_log('info', 'PostgreSQL connection successful')
-                return True
-                
-            except ImportError:
-                # Fallback to using script with proper environment variables
-                self._create_log('info', 'Using script method for PostgreSQL check')
-                return self._check_postgres_with_script(db_host, db_port, db_user, db_password)
-            except Exception as e:
-                self._create_log('error', f'PostgreSQL connection failed: {str(e)}')
-                raise Exception(f"Cannot connect to PostgreSQL at {db_host}:{db_port}. Error: {str(e)}")
-                
-        except Exception as e:
-            error_msg = f"Failed to run PostgreSQL connection check: {str(e)}"
-            self._create_log('error', error_msg)
-            raise Exception(error_msg)
-    
-    def _check_postgres_with_script(self, db_host, db_port, db_user, db_password):
-        """Fallback method using script with proper environment"""
-        check_script_path = os.path.join(
-            os.path.dirname(__file__), 
-            '..', 'scripts', 'check_postgres.sh'
-        )
-        
-        if not os.path.exists(check_script_path):
-            self._create_log('warning', 'PostgreSQL check script not found, skipping connection check')
-            return True
-        
-        # Prepare environment with Odoo's database configuration
-        env = os.environ.copy()
-        env.update({
-            'PGHOST': str(db_host),
-            'PGPORT': str(db_port),
-            'PGUSER': str(db_user),
-        })
-        
-        if db_password:
-            env['PGPASSWORD'] = str(db_password)
-        
-        cmd = ['bash', check_script_path]
+        from odoo import tools
+        db_host = tools.config.get('db_host') or 'localhost'
+        db_port = tools.config.get('db_port') or 5432
+        self._create_log('info', f'Checking PostgreSQL connection to {db_host}:{db_port}')
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60, env=env)
-            
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "PostgreSQL connection check failed"
-                self._create_log('error', f'PostgreSQL check failed: {error_msg}')
-                return False
-            
-            self._create_log('info', 'PostgreSQL connection check passed')
-            return True
-            
-        except subprocess.TimeoutExpired:
-            error_msg = "PostgreSQL connection check timed out"
-            self._create_log('error', error_msg)
-            return False
-        except Exception as e:
-            error_msg = f"Failed to run PostgreSQL connection check: {str(e)}"
-            self._create_log('error', error_msg)
-            return False
+            version, missing = self.env['saas.database.template']._get_db_engine().check()
+        except db_engine.DatabaseEngineError as e:
+            self._create_log('error', f'PostgreSQL connection failed: {str(e)}')
+            raise Exception(f"Cannot connect to PostgreSQL at {db_host}:{db_port}. Error: {str(e)}")
+        
+        for extension in missing:
+            self._create_log('warning', f'PostgreSQL extension {extension} is not available')
+        self._create_log('info', f'PostgreSQL {version} connection successful')
+        return True
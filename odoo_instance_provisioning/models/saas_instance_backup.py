@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import re
+import shutil
+import signal
+import subprocess
+import time
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError
+from ..utils.backup_store import BackupRepository, Throttle
+
+_logger = logging.getLogger(__name__)
+
+
+class SaasInstanceBackup(models.Model):
+    _name = 'saas.instance.backup'
+    _description = 'SaaS Instance Backup'
+    _order = 'backup_date desc, id desc'
+
+    name = fields.Char('Backup', required=True, readonly=True)
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', required=True, ondelete='cascade')
+    database_name = fields.Char('Database', required=True, readonly=True)
+    backup_date = fields.Datetime('Backup Date', required=True, readonly=True, default=fields.Datetime.now)
+    mode = fields.Selection([
+        ('full', 'Full'),
+        ('incremental', 'Incremental'),
+    ], string='Mode', required=True, readonly=True)
+    parent_id = fields.Many2one('saas.instance.backup', 'Previous Backup', readonly=True, ondelete='set null',
+                                help='Backup before this one in the chain, an incremental backup reuses its data')
+    path = fields.Char('Location', readonly=True,
+                       help='Manifest of an incremental backup, database dump of a full backup')
+    filestore_path = fields.Char('Filestore Archive', readonly=True)
+    logical_size = fields.Float('Data Size (MB)', readonly=True, digits=(16, 2))
+    stored_size = fields.Float('Stored Size (MB)', readonly=True, digits=(16, 2),
+                               help='Disk space written by this backup')
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_backup_root(self):
+        return self.env['ir.config_parameter'].sudo().get_param('saas.backup_path', '/opt/odoo/backups')
+
+    @api.model
+    def _get_filestore_path(self, database_name):
+        root = self.env['ir.config_parameter'].sudo().get_param('saas.filestore_path', '/opt/odoo/data/filestore')
+        return os.path.join(root, database_name)
+
+    @api.model
+    def _get_repository(self, database_name, throttle=None):
+        return BackupRepository(os.path.join(self._get_backup_root(), 'repository', database_name), throttle)
+
+    @api.model
+    def _get_throttle(self):
+        """Throttle for the total backup I/O, None when unlimited"""
+        bandwidth = float(self.env['ir.config_parameter'].sudo().get_param('saas.backup_bandwidth_mb', 0))
+        return Throttle(bandwidth * 1024 * 1024) if bandwidth > 0 else None
+
+    @api.model
+    def _get_stream_rate(self):
+        """Rate limit of one full backup stream in bytes per second, 0 when unlimited.
+
+        Streams are rate limited one by one, the cap is shared between the
+        backups running in parallel.
+        """
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        bandwidth = float(ICPSudo.get_param('saas.backup_bandwidth_mb', 0))
+        concurrency = max(1, int(ICPSudo.get_param('saas.backup_concurrency', 2)))
+        return int(bandwidth * 1024 * 1024 / concurrency) if bandwidth > 0 else 0
+
+    @api.model
+    def _pg_env(self):
+        """Environment for the PostgreSQL client tools with Odoo's credentials"""
+        env = os.environ.copy()
+        env.update({
+            'PGHOST': str(tools.config.get('db_host') or 'localhost'),
+            'PGPORT': str(tools.config.get('db_port') or 5432),
+            'PGUSER': str(tools.config.get('db_user') or 'odoo'),
+        })
+        if tools.config.get('db_password'):
+            env['PGPASSWORD'] = str(tools.config['db_password'])
+        return env
+
+    @api.model
+    def _get_dump_jobs(self, database_name):
+        """Parallel pg_dump workers for the database, 1 below the size threshold"""
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        threshold = float(ICPSudo.get_param('saas.backup_parallel_threshold_gb', 5))
+        jobs = int(ICPSudo.get_param('saas.backup_dump_jobs', 4))
+        if jobs <= 1:
+            return 1
+        with self.env['saas.database.template']._pg_connection() as conn, conn.cursor() as cr:
+            cr.execute("SELECT pg_database_size(%s)", (database_name,))
+            size = cr.fetchone()[0]
+        return jobs if size >= threshold * 1024 ** 3 else 1
+
+    @api.model
+    def _run(self, cmd, timeout=None, low_priority=False, env=None):
+        if low_priority and shutil.which('ionice'):
+            # Best effort class, lowest priority: live tenants keep their disk
+            cmd = ['ionice', '-c2', '-n7'] + cmd
+        # In a session of its own so a timeout kills the whole pipeline
+        # (pg_dump, compressor...), not only the shell running it
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                env=dict(self._pg_env(), **(env or {})), start_new_session=True)
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            raise Exception(f"{cmd[0]} timed out after {timeout} seconds")
+        if proc.returncode != 0:
+            raise Exception(stderr or stdout or 'Unknown error occurred')
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+    # ------------------------------------------------------------------
+    # Backup
+    # ------------------------------------------------------------------
+
+    @api.model
+    def create_backup(self, instance, throttle=None):
+        """Back the instance up in the configured mode and return the backup.
+
+        ``throttle`` is shared by the backups running in parallel, each
+        backup is aborted after ``saas.backup_timeout`` minutes.
+        """
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        mode = ICPSudo.get_param('saas.backup_mode', 'incremental')
+        timeout = int(ICPSudo.get_param('saas.backup_timeout', 60)) * 60 or None
+        if mode == 'full':
+            return self._create_full_backup(instance, timeout)
+        return self._create_incremental_backup(instance, timeout, throttle or self._get_throttle())
+
+    @api.model
+    def _create_incremental_backup(self, instance, timeout=None, throttle=None):
+        """Dump the database and store what changed since the previous backup"""
+        # The timeout covers the dump and the storage of the chunks and files
+        deadline = time.monotonic() + timeout if timeout else None
+        name = fields.Datetime.now().strftime('%Y%m%d_%H%M%S')
+        parent = instance.last_backup_id if instance.last_backup_id.mode == 'incremental' else self.browse()
+        repository = self._get_repository(instance.database_name, throttle)
+
+        dump_dir = os.path.join(repository.make_temp_dir(), 'dump')
+        jobs = self._get_dump_jobs(instance.database_name)
+        try:
+            # Uncompressed so identical table data gives identical chunks,
+            # the repository compresses the new chunks on all cores
+            self._run(['pg_dump', '--format=directory', '--compress=0', f'--jobs={jobs}',
+                       f'--file={dump_dir}', f'--dbname={instance.database_name}'],
+                      timeout=timeout, low_priority=True)
+            manifest = repository.backup(
+                name, dump_dir, self._get_filestore_path(instance.database_name),
+                parent=parent.name if parent else None,
+                deadline=deadline,
+            )
+        finally:
+            shutil.rmtree(os.path.dirname(dump_dir), ignore_errors=True)
+
+        return self.create({
+            'name': name,
+            'instance_id': instance.id,
+            'database_name': instance.database_name,
+            'mode': 'incremental',
+            'parent_id': parent.id,
+            'path': repository.manifest_path(name),
+            'logical_size': manifest['logical_size'] / 1024 / 1024,
+            'stored_size': manifest['stored_size'] / 1024 / 1024,
+        })
+
+    @api.model
+    def _create_full_backup(self, instance, timeout=None):
+        """Full dump and filestore archive streamed through a compressor by backup_instance.sh"""
+        script_path = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'backup_instance.sh')
+        jobs = self._get_dump_jobs(instance.database_name)
+        filestore_root = os.path.dirname(self._get_filestore_path(instance.database_name))
+        result = self._run(['bash', script_path, instance.database_name, self._get_backup_root(), str(jobs)],
+                           timeout=timeout, low_priority=True,
+                           env={'FILESTORE_ROOT': filestore_root, 'RATE_LIMIT': str(self._get_stream_rate())})
+
+        dump = re.search(r'Database backup completed: (\S+)', result.stdout)
+        filestore = re.search(r'Filestore backup completed: (\S+)', result.stdout)
+        dump_path = dump.group(1) if dump else False
+        filestore_path = filestore.group(1) if filestore else False
+        size = sum(self._disk_size(p) for p in (dump_path, filestore_path) if p and os.path.exists(p))
+
+        return self.create({
+            'name': fields.Datetime.now().strftime('%Y%m%d_%H%M%S'),
+            'instance_id': instance.id,
+            'database_name': instance.database_name,
+            'mode': 'full',
+            'path': dump_path,
+            'filestore_path': filestore_path,
+            'logical_size': size / 1024 / 1024,
+            'stored_size': size / 1024 / 1024,
+        })
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_expired_backups(self):
+        """Backups outside the grandfather-father-son retention, in one query.
+
+        Every backup of the last saas.backup_retention_days days is kept,
+        then the newest backup of each of the last saas.backup_keep_weekly
+        weeks and of the last saas.backup_keep_monthly months. The head of
+        each instance chain is always kept.
+        """
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        self.env.cr.execute("""
+            SELECT b.id FROM (
+                SELECT id, instance_id, backup_date,
+                       row_number() OVER (PARTITION BY instance_id, date_trunc('week', backup_date)
+                                          ORDER BY backup_date DESC, id DESC) AS week_rank,
+                       dense_rank() OVER (PARTITION BY instance_id
+                                          ORDER BY date_trunc('week', backup_date) DESC) AS week_age,
+                       row_number() OVER (PARTITION BY instance_id, date_trunc('month', backup_date)
+                                          ORDER BY backup_date DESC, id DESC) AS month_rank,
+                       dense_rank() OVER (PARTITION BY instance_id
+                                          ORDER BY date_trunc('month', backup_date) DESC) AS month_age
+                FROM saas_instance_backup
+            ) b
+            JOIN saas_instance_provisioning i ON i.id = b.instance_id
+            WHERE b.backup_date < (now() at time zone 'UTC') - %(days)s * interval '1 day'
+              AND NOT (b.week_rank = 1 AND b.week_age <= %(weeks)s)
+              AND NOT (b.month_rank = 1 AND b.month_age <= %(months)s)
+              AND b.id IS DISTINCT FROM i.last_backup_id
+        """, {
+            'days': int(ICPSudo.get_param('saas.backup_retention_days', 30)),
+            'weeks': int(ICPSudo.get_param('saas.backup_keep_weekly', 4)),
+            'months': int(ICPSudo.get_param('saas.backup_keep_monthly', 12)),
+        })
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def cron_prune_backups(self):
+        """Cron job to delete expired backups and report the space reclaimed"""
+        expired = self._get_expired_backups()
+        if not expired:
+            return {}
+
+        reclaimed = {}
+        for instance in expired.instance_id:
+            # Instances being backed up hold their backup claim, their backups
+            # wait for the next run so no object is deleted under a running backup
+            if not instance._try_claim('backup'):
+                continue
+            try:
+                backups = expired.filtered(lambda b: b.instance_id == instance)
+                try:
+                    size = backups._delete_artifacts()
+                except Exception as e:
+                    instance._create_log('error', f'Failed to prune backups: {str(e)}')
+                    _logger.error(f"Failed to prune backups of {instance.database_name}: {str(e)}")
+                    continue
+                backups.unlink()
+                reclaimed[instance.database_name] = size
+                instance._create_log('info', f'Pruned {len(backups)} backup(s), reclaimed {size / 1024 / 1024:.1f} MB')
+                _logger.info(f"Pruned {len(backups)} backup(s) of {instance.database_name}, "
+                             f"reclaimed {size / 1024 / 1024:.1f} MB")
+            finally:
+                self.env.cr.commit()
+                instance._release_claim('backup')
+        return reclaimed
+
+    def _delete_artifacts(self):
+        """Delete the files of backups of one instance, return the bytes reclaimed"""
+        reclaimed = 0
+        incremental = self.filtered(lambda b: b.mode == 'incremental')
+        if incremental:
+            database_name = incremental[0].database_name
+            kept = self.search([
+                ('database_name', '=', database_name),
+                ('mode', '=', 'incremental'),
+                ('id', 'not in', incremental.ids),
+            ])
+            reclaimed += self._get_repository(database_name).prune(incremental.mapped('name'), kept.mapped('name'))
+
+        for backup in self - incremental:
+            info_path = re.sub(r'\.(dump\.\w+|dir|sql)$', '.info', backup.path) if backup.path else False
+            for path in (backup.path, backup.filestore_path, info_path):
+                if not path or not os.path.exists(path):
+                    continue
+                reclaimed += self._disk_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+        return reclaimed
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+
+    def action_restore(self):
+        """Replace the instance database and filestore with this backup"""
+        self.ensure_one()
+        instance = self.instance_id
+        if instance.state not in ('active', 'suspended'):
+            raise UserError(_('Only active or suspended instances can be restored.'))
+
+        was_active = instance.state == 'active'
+        if was_active:
+            instance.action_stop()
+        try:
+            self._restore(instance.database_name)
+            instance._create_log('info', f'Restored backup {self.name}')
+        except Exception as e:
+            instance._create_log('error', f'Failed to restore backup {self.name}: {str(e)}')
+            raise UserError(_('Failed to restore backup: %s') % str(e))
+        if was_active:
+            instance.action_start()
+
+    def _restore(self, database_name):
+        """Recreate the database and filestore from the backup"""
+        self.ensure_one()
+        filestore_path = self._get_filestore_path(database_name)
+
+        if self.mode == 'incremental':
+            repository = self._get_repository(self.database_name)
+            work_dir = repository.make_temp_dir()
+            try:
+                restored_filestore = os.path.join(work_dir, 'filestore')
+                repository.restore(self.name, os.path.join(work_dir, 'dump'), restored_filestore)
+                self._replace_database(database_name, os.path.join(work_dir, 'dump'))
+                shutil.rmtree(filestore_path, ignore_errors=True)
+                if os.path.isdir(restored_filestore):
+                    shutil.move(restored_filestore, filestore_path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            self._replace_database(database_name, self.path)
+            if self.filestore_path:
+                shutil.rmtree(filestore_path, ignore_errors=True)
+                # The archive holds <database>/..., extract it next to the target
+                extract_dir = os.path.dirname(filestore_path)
+                self._run(['bash', '-o', 'pipefail', '-c', f'{self._decompressor(self.filestore_path)} "$0" | tar -xf - -C "$1"',
+                           self.filestore_path, extract_dir])
+                if self.database_name != database_name:
+                    shutil.move(os.path.join(extract_dir, self.database_name), filestore_path)
+
+    @api.model
+    def _decompressor(self, path):
+        """Command writing the uncompressed content of a backup file to stdout"""
+        if path.endswith('.zst'):
+            return 'zstd -dc'
+        if path.endswith('.gz'):
+            return 'gzip -dc'
+        return 'cat'
+
+    @api.model
+    def _disk_size(self, path):
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(dirpath, f))
+                       for dirpath, _dirnames, filenames in os.walk(path) for f in filenames)
+        return os.path.getsize(path)
+
+    @api.model
+    def _replace_database(self, database_name, dump_path):
+        """Restore the dump into a scratch database, then swap it in.
+
+        The live database is only touched once pg_restore succeeded: it is
+        renamed away, the scratch database takes its name and the old copy
+        is dropped. Any failure drops the scratch database and leaves the
+        live one as it was.
+        """
+        Template = self.env['saas.database.template']
+        engine = Template._get_db_engine()
+        # Database names are limited to 63 characters
+        suffix = fields.Datetime.now().strftime('%Y%m%d%H%M%S')
+        restore_name = f'{database_name[:40]}_restore_{suffix}'
+        old_name = f'{database_name[:44]}_old_{suffix}'
+
+        with Template._pg_connection() as conn, conn.cursor() as cr:
+            cr.execute('CREATE DATABASE "%s" ENCODING \'unicode\'' % restore_name)
+        try:
+            self._restore_dump(restore_name, dump_path)
+            with Template._pg_connection() as conn, conn.cursor() as cr:
+                cr.execute("""
+                    SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                    WHERE datname = %s AND pid != pg_backend_pid()
+                """, (database_name,))
+                cr.execute('ALTER DATABASE "%s" RENAME TO "%s"' % (database_name, old_name))
+                try:
+                    cr.execute('ALTER DATABASE "%s" RENAME TO "%s"' % (restore_name, database_name))
+                except Exception:
+                    cr.execute('ALTER DATABASE "%s" RENAME TO "%s"' % (old_name, database_name))
+                    raise
+        except Exception:
+            try:
+                engine.drop(restore_name)
+            except Exception as e:
+                _logger.error(f"Failed to drop the scratch database {restore_name}: {str(e)}")
+            raise
+        engine.drop(old_name)
+
+    @api.model
+    def _restore_dump(self, database_name, dump_path):
+        """pg_restore a dump of any of the backup formats into an empty database"""
+        if os.path.isdir(dump_path):
+            # Directory format, restored by parallel workers
+            jobs = max(1, int(self.env['ir.config_parameter'].sudo().get_param('saas.backup_dump_jobs', 4)))
+            self._run(['pg_restore', '--no-owner', f'--jobs={jobs}', f'--dbname={database_name}', dump_path])
+        elif dump_path.endswith(('.zst', '.gz')):
+            self._run(['bash', '-o', 'pipefail', '-c',
+                       f'{self._decompressor(dump_path)} "$0" | pg_restore --no-owner --dbname="$1"',
+                       dump_path, database_name])
+        else:
+            self._run(['pg_restore', '--no-owner', f'--dbname={database_name}', dump_path])
@@ -1,16 +1,53 @@
 # -*- coding: utf-8 -*-
 
+import base64
+import json
 import logging
+import re
+import uuid
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
 from odoo import models, fields, api, _
 
 _logger = logging.getLogger(__name__)
 
+# Rows live in a table partitioned by month of timestamp. The model reads
+# and writes them through an updatable view, Odoo does not manage
+# partitioned tables.
+LOG_DATA_TABLE = 'saas_instance_provisioning_log_data'
+LOG_DEFAULT_PARTITION = 'saas_instance_provisioning_log_default'
+LOG_PARTITION_NAME = re.compile(r'^saas_instance_provisioning_log_y(\d{4})m(\d{2})$')
+
+# Key errors are grouped by: the exception type or the message head
+LOG_ERROR_KEY = (
+    "CASE WHEN strpos(message, ':') > 0 THEN coalesce(nullif(exception_type, ''), split_part(message, ':', 1)) "
+    "ELSE left(message, 50) END"
+)
+
+# Document of the full-text index. The simple configuration does not stem,
+# logs mix languages with identifiers, paths and error messages.
+LOG_SEARCH_DOCUMENT = "to_tsvector('simple', message || ' ' || coalesce(details, ''))"
+LOG_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MinWords=10, MaxWords=30, MaxFragments=3'
+
+# Rows fetched per round trip by log exports
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_FIELDS = ['id', 'timestamp', 'level', 'message', 'details', 'operation', 'component', 'user', 'exception_type']
+
+LOG_LEVELS = ['debug', 'info', 'warning', 'error', 'critical']
+
+LOG_COLUMNS = (
+    'id, instance_id, timestamp, level, message, details, operation, component, user_id, '
+    'exception_type, stack_trace, request_id, create_uid, create_date, write_uid, write_date'
+)
+
 
 class SaasInstanceProvisioningLog(models.Model):
     _name = 'saas.instance.provisioning.log'
     _description = 'SaaS Instance Provisioning Log'
     _order = 'timestamp desc'
     _rec_name = 'message'
+    _auto = False
 
     # Basic Information
     instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', required=True, ondelete='cascade')
@@ -42,6 +79,114 @@ class SaasInstanceProvisioningLog(models.Model):
     level_color = fields.Integer('Level Color', compute='_compute_level_color')
     formatted_timestamp = fields.Char('Formatted Timestamp', compute='_compute_formatted_timestamp')
     
+    def init(self):
+        """Create the partitioned log table and its view, moving the rows of the former plain table"""
+        cr = self.env.cr
+        cr.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (self._table,))
+        row = cr.fetchone()
+        legacy = bool(row) and row[0] == 'r'
+        if legacy:
+            cr.execute(f'ALTER TABLE {self._table} RENAME TO {self._table}_legacy')
+            cr.execute(f'ALTER SEQUENCE {self._table}_id_seq OWNED BY NONE')
+
+        cr.execute(f'CREATE SEQUENCE IF NOT EXISTS {self._table}_id_seq')
+        cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {LOG_DATA_TABLE} (
+                id integer NOT NULL DEFAULT nextval('{self._table}_id_seq'),
+                instance_id integer NOT NULL REFERENCES saas_instance_provisioning(id) ON DELETE CASCADE,
+                timestamp timestamp NOT NULL,
+                level varchar NOT NULL,
+                message text NOT NULL,
+                details text,
+                operation varchar,
+                component varchar,
+                user_id integer REFERENCES res_users(id) ON DELETE SET NULL,
+                exception_type varchar,
+                stack_trace text,
+                request_id varchar,
+                create_uid integer REFERENCES res_users(id) ON DELETE SET NULL,
+                create_date timestamp,
+                write_uid integer REFERENCES res_users(id) ON DELETE SET NULL,
+                write_date timestamp,
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """)
+        cr.execute(f'ALTER SEQUENCE {self._table}_id_seq OWNED BY {LOG_DATA_TABLE}.id')
+        cr.execute(f'CREATE TABLE IF NOT EXISTS {LOG_DEFAULT_PARTITION} PARTITION OF {LOG_DATA_TABLE} DEFAULT')
+        # Every log query filters on the instance and a time range, often on the level
+        cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS saas_instance_provisioning_log_instance_timestamp_level_idx
+            ON {LOG_DATA_TABLE} (instance_id, timestamp DESC, level)
+        """)
+        cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS saas_instance_provisioning_log_search_idx
+            ON {LOG_DATA_TABLE} USING gin (({LOG_SEARCH_DOCUMENT}))
+        """)
+        # Time range scans over all instances, for the hourly rollup
+        cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS saas_instance_provisioning_log_timestamp_brin_idx
+            ON {LOG_DATA_TABLE} USING brin (timestamp)
+        """)
+
+        if legacy:
+            # Rows land in the default partition, _ensure_partitions moves them to their month
+            cr.execute(f'INSERT INTO {LOG_DATA_TABLE} ({LOG_COLUMNS}) SELECT {LOG_COLUMNS} FROM {self._table}_legacy')
+            cr.execute(f'DROP TABLE {self._table}_legacy')
+            _logger.info("Moved the instance logs to the partitioned log table")
+
+        cr.execute(f'CREATE OR REPLACE VIEW {self._table} AS SELECT * FROM {LOG_DATA_TABLE}')
+        self._ensure_partitions()
+
+    # ------------------------------------------------------------------
+    # Partitions
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_partitions(self):
+        """Monthly partitions as (name, first day of the month), oldest first"""
+        self.env.cr.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, (LOG_DATA_TABLE,))
+        partitions = []
+        for name, in self.env.cr.fetchall():
+            match = LOG_PARTITION_NAME.match(name)
+            if match:
+                partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    @api.model
+    def _ensure_partitions(self, months_ahead=2):
+        """Create the monthly partitions up to months_ahead, and those of rows left in the default partition"""
+        this_month = fields.Datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        self.env.cr.execute(f"SELECT date_trunc('month', min(timestamp)) FROM {LOG_DEFAULT_PARTITION}")
+        oldest = self.env.cr.fetchone()[0]
+        month = min(oldest, this_month) if oldest else this_month
+        last = this_month + relativedelta(months=months_ahead)
+        existing = {start for name, start in self._get_partitions()}
+        while month <= last:
+            if month not in existing:
+                self._create_partition(month)
+            month += relativedelta(months=1)
+
+    @api.model
+    def _create_partition(self, month):
+        """Attach the partition of the month, with its rows taken out of the default partition"""
+        cr = self.env.cr
+        name = f'{self._table}_y{month:%Y}m{month:%m}'
+        end = month + relativedelta(months=1)
+        cr.execute(f'CREATE TABLE {name} (LIKE {LOG_DATA_TABLE} INCLUDING DEFAULTS)')
+        cr.execute(f"""
+            WITH moved AS (
+                DELETE FROM {LOG_DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, (month, end))
+        cr.execute(f'ALTER TABLE {LOG_DATA_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                   (month, end))
+        _logger.info(f"Created log partition {name}")
+
     @api.depends('level')
     def _compute_level_color(self):
         """Compute color based on log level for UI display"""
@@ -82,6 +227,17 @@ class SaasInstanceProvisioningLog(models.Model):
         
         return self.create(vals)
     
+    @api.model
+    def _create_batch(self, vals_list, separate_cursor=False):
+        """Insert log entries with one multi-row create, committed on a cursor of their own if asked"""
+        if not vals_list:
+            return
+        if not separate_cursor:
+            self.create(vals_list)
+            return
+        with self.pool.cursor() as cr:
+            self.with_env(self.env(cr=cr)).create(vals_list)
+    
     @api.model
     def log_info(self, instance_id, message, **kwargs):
         """Create info log entry"""
@@ -138,108 +294,252 @@ class SaasInstanceProvisioningLog(models.Model):
     
     @api.model
     def cleanup_old_logs(self, days=30):
-        """Clean up old log entries"""
-        from datetime import timedelta
+        """Clean up old log entries.
+        
+        Debug and info entries go after ``days``. Monthly partitions older
+        than saas.log_retention_days are dropped whole, warnings and errors
+        included.
+        """
+        self._ensure_partitions()
+        retention = int(self.env['ir.config_parameter'].sudo().get_param('saas.log_retention_days', 365))
+        retention_cutoff = fields.Datetime.now() - timedelta(days=max(days, retention))
         
-        cutoff_date = fields.Datetime.now() - timedelta(days=days)
-        old_logs = self.search([
-            ('timestamp', '<', cutoff_date),
-            ('level', 'in', ['debug', 'info'])  # Keep warnings and errors longer
-        ])
+        dropped = 0
+        for name, start in self._get_partitions():
+            if start + relativedelta(months=1) > retention_cutoff:
+                break
+            self.env.cr.execute(f'ALTER TABLE {LOG_DATA_TABLE} DETACH PARTITION {name}')
+            self.env.cr.execute(f'DROP TABLE {name}')
+            dropped += 1
         
-        count = len(old_logs)
-        old_logs.unlink()
+        # Keep warnings and errors longer, only the partitions before the cutoff are scanned
+        self.env.cr.execute(f"""
+            DELETE FROM {LOG_DATA_TABLE}
+            WHERE timestamp < %s AND level IN ('debug', 'info')
+        """, (fields.Datetime.now() - timedelta(days=days),))
+        count = self.env.cr.rowcount
+        self.invalidate_model()
         
-        _logger.info(f"Cleaned up {count} old log entries")
+        _logger.info(f"Cleaned up {count} old log entries and {dropped} log partition(s)")
         return count
     
     @api.model
     def get_instance_logs_summary(self, instance_id, hours=24):
         """Get log summary for an instance in the last N hours"""
-        from datetime import timedelta
-        
         since = fields.Datetime.now() - timedelta(hours=hours)
         
-        logs = self.search([
-            ('instance_id', '=', instance_id),
-            ('timestamp', '>=', since)
-        ])
+        # Level counts from the hourly rollup, the partial hours from the log table
+        query, params = self.env['saas.instance.provisioning.log.hourly']._union_query(
+            'level', 'level', since, instance_id)
+        self.env.cr.execute(f"SELECT level, sum(n)::integer FROM ({query}) t GROUP BY level", params)
+        by_level = dict.fromkeys(LOG_LEVELS, 0)
+        by_level.update(self.env.cr.fetchall())
         
         summary = {
-            'total': len(logs),
-            'by_level': {},
+            'total': sum(by_level.values()),
+            'by_level': {level: by_level[level] for level in LOG_LEVELS},
             'recent_errors': [],
             'last_activity': None,
         }
         
-        # Count by level
-        for level in ['debug', 'info', 'warning', 'error', 'critical']:
-            summary['by_level'][level] = len(logs.filtered(lambda l: l.level == level))
-        
         # Get recent errors
-        error_logs = logs.filtered(lambda l: l.level in ['error', 'critical'])
+        error_logs = self.search([
+            ('instance_id', '=', instance_id),
+            ('timestamp', '>=', since),
+            ('level', 'in', ['error', 'critical']),
+        ], limit=5, order='timestamp desc')
         summary['recent_errors'] = [{
             'timestamp': log.timestamp,
             'level': log.level,
             'message': log.message,
             'operation': log.operation,
-        } for log in error_logs.sorted('timestamp', reverse=True)[:5]]
+        } for log in error_logs]
         
         # Last activity
-        if logs:
-            summary['last_activity'] = max(logs.mapped('timestamp'))
+        if summary['total']:
+            self.env.cr.execute(f"""
+                SELECT max(timestamp) FROM {LOG_DATA_TABLE}
+                WHERE instance_id = %s AND timestamp >= %s
+            """, (instance_id, since))
+            summary['last_activity'] = self.env.cr.fetchone()[0]
         
         return summary
     
     @api.model
     def export_logs(self, instance_id, start_date=None, end_date=None, levels=None):
         """Export logs for an instance"""
-        domain = [('instance_id', '=', instance_id)]
+        return [
+            row
+            for batch in self._iter_export(self.env.cr, instance_id, start_date, end_date, levels)
+            for row in batch
+        ]
+    
+    @api.model
+    def _iter_export(self, cr, instance_id, start_date=None, end_date=None, levels=None, after=None,
+                     batch_size=EXPORT_BATCH_SIZE):
+        """Export rows in time order, in lists of batch_size.
         
+        Rows are read through a server-side cursor of ``cr``, so memory
+        stays bounded whatever the number of logs. ``after`` is a cursor
+        token from _encode_cursor, the export resumes after that row.
+        """
+        where = ["l.instance_id = %(instance_id)s"]
+        params = {'instance_id': instance_id}
         if start_date:
-            domain.append(('timestamp', '>=', start_date))
+            where.append("l.timestamp >= %(start_date)s")
+            params['start_date'] = fields.Datetime.to_datetime(start_date)
         if end_date:
-            domain.append(('timestamp', '<=', end_date))
+            where.append("l.timestamp <= %(end_date)s")
+            params['end_date'] = fields.Datetime.to_datetime(end_date)
         if levels:
-            domain.append(('level', 'in', levels))
-        
-        logs = self.search(domain, order='timestamp asc')
+            where.append("l.level = ANY(%(levels)s)")
+            params['levels'] = list(levels)
+        if after:
+            where.append("(l.timestamp, l.id) > (%(timestamp)s, %(id)s)")
+            params['timestamp'], params['id'] = self._decode_cursor(after)
         
-        # Format for export
-        export_data = []
-        for log in logs:
-            export_data.append({
-                'timestamp': log.timestamp.isoformat() if log.timestamp else '',
-                'level': log.level,
-                'message': log.message,
-                'details': log.details or '',
-                'operation': log.operation or '',
-                'component': log.component or '',
-                'user': log.user_id.name if log.user_id else '',
-                'exception_type': log.exception_type or '',
-            })
-        
-        return export_data
+        with cr._cnx.cursor(name=f'saas_log_export_{uuid.uuid4().hex[:8]}') as server_cursor:
+            server_cursor.itersize = batch_size
+            server_cursor.execute(f"""
+                SELECT l.id, l.timestamp, l.level, l.message, l.details, l.operation, l.component,
+                       p.name, l.exception_type
+                FROM {LOG_DATA_TABLE} l
+                LEFT JOIN res_users u ON u.id = l.user_id
+                LEFT JOIN res_partner p ON p.id = u.partner_id
+                WHERE {' AND '.join(where)}
+                ORDER BY l.timestamp, l.id
+            """, params)
+            while True:
+                rows = server_cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield [{
+                    'id': log_id,
+                    'timestamp': timestamp.isoformat() if timestamp else '',
+                    'level': level,
+                    'message': message,
+                    'details': details or '',
+                    'operation': operation or '',
+                    'component': component or '',
+                    'user': user or '',
+                    'exception_type': exception_type or '',
+                } for log_id, timestamp, level, message, details, operation, component, user, exception_type in rows]
     
     @api.model
     def search_logs(self, instance_id, search_term, levels=None, limit=100):
         """Search logs by message content"""
-        domain = [
-            ('instance_id', '=', instance_id),
-            '|',
-            ('message', 'ilike', search_term),
-            ('details', 'ilike', search_term)
-        ]
+        page = self.search_logs_page(search_term, instance_id=instance_id, levels=levels,
+                                     limit=limit, highlight=False)
+        return self.browse([hit['id'] for hit in page['results']])
+    
+    @api.model
+    def search_logs_page(self, search_term, instance_id=None, levels=None, date_from=None, date_to=None,
+                         limit=50, cursor=None, order='timestamp', highlight=True):
+        """Full-text search of message and details, one page at a time.
+        
+        ``search_term`` uses the web search syntax ("quoted phrase", or,
+        -word). Hits are sorted by time, or by rank with ``order='rank'``,
+        and paged on the sort key: pass the returned ``next_cursor`` to get
+        the following page. Returns ``{'results': [...], 'next_cursor'}``,
+        the matches in message and details are wrapped in <mark> tags.
+        """
+        if not (search_term or '').strip():
+            return {'results': [], 'next_cursor': None}
+        limit = max(1, min(int(limit), 500))
+        by_rank = order == 'rank'
         
+        where = [f"{LOG_SEARCH_DOCUMENT} @@ q"]
+        params = {'term': search_term, 'limit': limit + 1}
+        if instance_id:
+            where.append("instance_id = %(instance_id)s")
+            params['instance_id'] = instance_id
         if levels:
-            domain.append(('level', 'in', levels))
+            where.append("level = ANY(%(levels)s)")
+            params['levels'] = list(levels)
+        if date_from:
+            where.append("timestamp >= %(date_from)s")
+            params['date_from'] = fields.Datetime.to_datetime(date_from)
+        if date_to:
+            where.append("timestamp < %(date_to)s")
+            params['date_to'] = fields.Datetime.to_datetime(date_to)
+        if cursor:
+            position = self._decode_cursor(cursor)
+            if by_rank:
+                where.append("(ts_rank_cd(document, q), timestamp, id) < (%(rank)s::real, %(timestamp)s, %(id)s)")
+                params['rank'], params['timestamp'], params['id'] = position
+            else:
+                where.append("(timestamp, id) < (%(timestamp)s, %(id)s)")
+                params['timestamp'], params['id'] = position
+        sort = "rank DESC, timestamp DESC, id DESC" if by_rank else "timestamp DESC, id DESC"
         
-        return self.search(domain, limit=limit, order='timestamp desc')
+        # Headlines are the costly part, only computed for the rows of the page
+        self.env.cr.execute(f"""
+            WITH hits AS (
+                SELECT id, timestamp, instance_id, level, operation, component, message, details,
+                       ts_rank_cd(document, q) AS rank, q
+                FROM (
+                    SELECT *, {LOG_SEARCH_DOCUMENT} AS document
+                    FROM {LOG_DATA_TABLE}
+                ) l, websearch_to_tsquery('simple', %(term)s) q
+                WHERE {' AND '.join(where)}
+                ORDER BY {sort}
+                LIMIT %(limit)s
+            )
+            SELECT id, timestamp, instance_id, level, operation, component, rank,
+                   {self._headline_sql('message', highlight)}, {self._headline_sql('details', highlight)}
+            FROM hits
+            ORDER BY {sort}
+        """, params)
+        rows = self.env.cr.fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, last_timestamp, _instance, _level, _operation, _component, last_rank = rows[-1][:7]
+            next_cursor = self._encode_cursor(last_timestamp.isoformat(), last_id,
+                                              rank=last_rank if by_rank else None)
+        
+        return {
+            'results': [{
+                'id': log_id,
+                'timestamp': timestamp.isoformat(),
+                'instance_id': instance_id,
+                'level': level,
+                'operation': operation or '',
+                'component': component or '',
+                'rank': rank,
+                'message': message,
+                'details': details or '',
+            } for log_id, timestamp, instance_id, level, operation, component, rank, message, details in rows],
+            'next_cursor': next_cursor,
+        }
+    
+    @api.model
+    def _headline_sql(self, column, highlight):
+        """Column with its matches marked, HTML-escaped first so only the marks are markup"""
+        if not highlight:
+            return column
+        escaped = f"replace(replace(replace({column}, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')"
+        return f"ts_headline('simple', {escaped}, q, '{LOG_HEADLINE_OPTIONS}')"
+    
+    @api.model
+    def _encode_cursor(self, timestamp, log_id, rank=None):
+        """Opaque token of a position in the logs, for paging and resuming"""
+        position = [timestamp, log_id] if rank is None else [rank, timestamp, log_id]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+    
+    @api.model
+    def _decode_cursor(self, cursor):
+        """Sort key of a cursor token: (timestamp, id), or (rank, timestamp, id)"""
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            *rank, timestamp, log_id = position
+            return (*[float(value) for value in rank], datetime.fromisoformat(timestamp), int(log_id))
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid cursor: {cursor}")
     
     def get_context_logs(self, minutes_before=5, minutes_after=5):
         """Get logs around this log entry for context"""
-        from datetime import timedelta
-        
         self.ensure_one()
         
         start_time = self.timestamp - timedelta(minutes=minutes_before)
@@ -254,45 +554,40 @@ class SaasInstanceProvisioningLog(models.Model):
     @api.model
     def get_error_patterns(self, instance_id=None, days=7):
         """Analyze error patterns"""
-        from datetime import timedelta
-        from collections import Counter
-        
-        domain = [
-            ('level', 'in', ['error', 'critical']),
-            ('timestamp', '>=', fields.Datetime.now() - timedelta(days=days))
-        ]
+        since = fields.Datetime.now() - timedelta(days=days)
+        query, params = self.env['saas.instance.provisioning.log.hourly']._union_query(
+            "error_key, operation, component, extract(hour FROM hour)::integer AS hour_of_day",
+            f"{LOG_ERROR_KEY}, operation, component, extract(hour FROM timestamp)::integer",
+            since, instance_id, levels=['error', 'critical'])
         
-        if instance_id:
-            domain.append(('instance_id', '=', instance_id))
-        
-        error_logs = self.search(domain)
+        # One pass over the errors, counted by each key separately
+        self.env.cr.execute(f"""
+            SELECT GROUPING(error_key) = 0, GROUPING(operation) = 0, GROUPING(component) = 0,
+                   error_key, operation, component, hour_of_day, sum(n)::integer
+            FROM ({query}) t
+            GROUP BY GROUPING SETS ((error_key), (operation), (component), (hour_of_day))
+        """, params)
         
-        # Analyze patterns
         patterns = {
-            'most_common_errors': Counter(),
-            'errors_by_operation': Counter(),
-            'errors_by_component': Counter(),
-            'errors_by_hour': Counter(),
+            'most_common_errors': [],
+            'errors_by_operation': [],
+            'errors_by_component': [],
+            'errors_by_hour': [],
         }
+        for by_error, by_operation, by_component, error_key, operation, component, hour, count in self.env.cr.fetchall():
+            if by_error:
+                patterns['most_common_errors'].append((error_key, count))
+            elif by_operation:
+                if operation:
+                    patterns['errors_by_operation'].append((operation, count))
+            elif by_component:
+                if component:
+                    patterns['errors_by_component'].append((component, count))
+            else:
+                patterns['errors_by_hour'].append((hour, count))
         
-        for log in error_logs:
-            # Extract error type from message
-            error_type = log.exception_type or log.message.split(':')[0] if ':' in log.message else log.message[:50]
-            patterns['most_common_errors'][error_type] += 1
-            
-            if log.operation:
-                patterns['errors_by_operation'][log.operation] += 1
-            
-            if log.component:
-                patterns['errors_by_component'][log.component] += 1
-            
-            # Hour of day
-            hour = log.timestamp.hour
-            patterns['errors_by_hour'][hour] += 1
-        
-        # Convert to lists for easier handling
-        result = {}
-        for key, counter in patterns.items():
-            result[key] = counter.most_common(10)
-        
-        return result
+        # Top 10 of each, like Counter.most_common
+        return {
+            key: sorted(counts, key=lambda item: item[1], reverse=True)[:10]
+            for key, counts in patterns.items()
+        }
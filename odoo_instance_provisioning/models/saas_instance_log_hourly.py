@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+from odoo import models, fields, api
+from .saas_instance_log import LOG_DATA_TABLE, LOG_ERROR_KEY
+
+_logger = logging.getLogger(__name__)
+
+# Hours recomputed on every run, for log entries written after their hour
+# was rolled up (provisioning logs are flushed once per step)
+ROLLUP_RECOMPUTE_HOURS = 2
+
+
+class SaasInstanceLogHourly(models.Model):
+    _name = 'saas.instance.provisioning.log.hourly'
+    _description = 'SaaS Instance Log Hourly Rollup'
+    _order = 'hour desc, id desc'
+    _log_access = False
+
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', required=True, ondelete='cascade')
+    hour = fields.Datetime('Hour', required=True, index=True)
+    level = fields.Selection([
+        ('debug', 'Debug'),
+        ('info', 'Info'),
+        ('warning', 'Warning'),
+        ('error', 'Error'),
+        ('critical', 'Critical'),
+    ], string='Level', required=True)
+    operation = fields.Char('Operation')
+    component = fields.Char('Component')
+    error_key = fields.Char('Error', help='Exception type or message head of error entries')
+    count = fields.Integer('Entries')
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS saas_instance_provisioning_log_hourly_instance_hour_idx
+            ON saas_instance_provisioning_log_hourly (instance_id, hour)
+        """)
+
+    @api.model
+    def cron_rollup_logs(self):
+        """Cron job to count the log entries of the closed hours"""
+        until = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.env.cr.execute("SELECT max(hour) FROM saas_instance_provisioning_log_hourly")
+        last = self.env.cr.fetchone()[0]
+        since = last - timedelta(hours=ROLLUP_RECOMPUTE_HOURS - 1) if last else None
+
+        self.env.cr.execute("""
+            DELETE FROM saas_instance_provisioning_log_hourly
+            WHERE (%(since)s::timestamp IS NULL OR hour >= %(since)s) AND hour < %(until)s
+        """, {'since': since, 'until': until})
+        self.env.cr.execute(f"""
+            INSERT INTO saas_instance_provisioning_log_hourly
+                (instance_id, hour, level, operation, component, error_key, count)
+            SELECT instance_id, date_trunc('hour', timestamp) AS bucket, level, operation, component,
+                   CASE WHEN level IN ('error', 'critical') THEN {LOG_ERROR_KEY} END AS error_key,
+                   count(*)
+            FROM {LOG_DATA_TABLE}
+            WHERE (%(since)s::timestamp IS NULL OR timestamp >= %(since)s) AND timestamp < %(until)s
+            GROUP BY instance_id, bucket, level, operation, component, error_key
+        """, {'since': since, 'until': until})
+        _logger.info(f"Rolled up {self.env.cr.rowcount} hourly log counts")
+
+        retention = int(self.env['ir.config_parameter'].sudo().get_param('saas.log_retention_days', 365))
+        self.env.cr.execute("DELETE FROM saas_instance_provisioning_log_hourly WHERE hour < %s",
+                            (fields.Datetime.now() - timedelta(days=retention),))
+        self.invalidate_model()
+
+    @api.model
+    def _get_split(self, since):
+        """Bounds of the range read from the rollup for a window starting at since.
+
+        Whole hours from the first one after ``since`` up to the last rolled
+        up hour are counted from the rollup, the entries before and after
+        from the log table.
+        """
+        start = since.replace(minute=0, second=0, microsecond=0)
+        if start < since:
+            start += timedelta(hours=1)
+        self.env.cr.execute("SELECT max(hour) FROM saas_instance_provisioning_log_hourly")
+        last = self.env.cr.fetchone()[0]
+        end = max(start, last + timedelta(hours=1)) if last else start
+        return start, end
+
+    @api.model
+    def _union_query(self, rollup_columns, log_columns, since, instance_id=None, levels=None):
+        """Rows (columns..., n) of the window, counted from the rollup and the log table"""
+        start, end = self._get_split(since)
+        params = {'since': since, 'start': start, 'end': end,
+                  'instance_id': instance_id, 'levels': list(levels) if levels else None}
+        query = f"""
+            SELECT {rollup_columns}, count AS n
+            FROM saas_instance_provisioning_log_hourly
+            WHERE hour >= %(start)s AND hour < %(end)s
+              AND (%(instance_id)s::integer IS NULL OR instance_id = %(instance_id)s)
+              AND (%(levels)s::varchar[] IS NULL OR level = ANY(%(levels)s))
+            UNION ALL
+            SELECT {log_columns}, 1 AS n
+            FROM {LOG_DATA_TABLE}
+            WHERE timestamp >= %(since)s AND (timestamp < %(start)s OR timestamp >= %(end)s)
+              AND (%(instance_id)s::integer IS NULL OR instance_id = %(instance_id)s)
+              AND (%(levels)s::varchar[] IS NULL OR level = ANY(%(levels)s))
+        """
+        return query, params
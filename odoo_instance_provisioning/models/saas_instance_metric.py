@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+from odoo import models, fields, api
+from psycopg2.extras import execute_values
+
+_logger = logging.getLogger(__name__)
+
+# Tier, bucket SQL expression on "timestamp", retention parameter and default
+# retention (hours for raw samples, days for rollups). Each tier is rolled up
+# from the one before it.
+METRIC_TIERS = [
+    ('raw', None, 'saas.metrics_retention_raw_hours', 48),
+    ('5m', "date_trunc('hour', timestamp) + floor(date_part('minute', timestamp) / 5) * interval '5 minutes'",
+     'saas.metrics_retention_5m_days', 14),
+    ('1h', "date_trunc('hour', timestamp)", 'saas.metrics_retention_1h_days', 400),
+]
+
+TIER_SECONDS = {'raw': 0, '5m': 300, '1h': 3600}
+
+
+class SaasInstanceMetric(models.Model):
+    _name = 'saas.instance.metric'
+    _description = 'SaaS Instance Resource Metric'
+    _order = 'timestamp desc, id desc'
+    _log_access = False
+
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', required=True, ondelete='cascade')
+    tier = fields.Selection([
+        ('raw', 'Raw'),
+        ('5m', '5 Minutes'),
+        ('1h', '1 Hour'),
+    ], string='Resolution', required=True, default='raw')
+    timestamp = fields.Datetime('Timestamp', required=True)
+    sample_count = fields.Integer('Samples', default=1)
+    cpu_usage = fields.Float('CPU Usage (%)', group_operator='avg')
+    cpu_max = fields.Float('CPU Peak (%)', group_operator='max')
+    memory_usage = fields.Float('Memory Usage (%)', group_operator='avg')
+    memory_max = fields.Float('Memory Peak (%)', group_operator='max')
+    storage_usage = fields.Float('Storage Usage (%)', group_operator='avg')
+    request_count = fields.Integer('Requests')
+
+    _sql_constraints = [
+        ('bucket_unique', 'UNIQUE(instance_id, tier, timestamp)', 'Only one metric per instance, resolution and time.'),
+    ]
+
+    @api.model
+    def record_samples(self, samples):
+        """Append raw samples.
+
+        ``samples`` is a list of ``(instance_id, cpu %, memory %, storage %,
+        request count)`` tuples, unknown values may be None. Samples landing
+        in the same second as an existing one are merged into it: request
+        counts add up, known usage values replace unknown ones.
+        """
+        if not samples:
+            return
+        now = fields.Datetime.now()
+        execute_values(self.env.cr, """
+            INSERT INTO saas_instance_metric
+                (instance_id, tier, timestamp, sample_count, cpu_usage, cpu_max,
+                 memory_usage, memory_max, storage_usage, request_count)
+            SELECT v.instance_id, 'raw', v.ts, 1, v.cpu, v.cpu, v.mem, v.mem, v.storage, v.requests
+            FROM (VALUES %s) AS v(instance_id, cpu, mem, storage, requests, ts)
+            ON CONFLICT (instance_id, tier, timestamp) DO UPDATE SET
+                cpu_usage = coalesce(EXCLUDED.cpu_usage, saas_instance_metric.cpu_usage),
+                cpu_max = greatest(saas_instance_metric.cpu_max, EXCLUDED.cpu_max),
+                memory_usage = coalesce(EXCLUDED.memory_usage, saas_instance_metric.memory_usage),
+                memory_max = greatest(saas_instance_metric.memory_max, EXCLUDED.memory_max),
+                storage_usage = coalesce(EXCLUDED.storage_usage, saas_instance_metric.storage_usage),
+                request_count = CASE
+                    WHEN EXCLUDED.request_count IS NULL THEN saas_instance_metric.request_count
+                    ELSE coalesce(saas_instance_metric.request_count, 0) + EXCLUDED.request_count
+                END
+        """, [(*sample, now) for sample in samples],
+            template='(%s, %s::float8, %s::float8, %s::float8, %s::int, %s::timestamp)')
+
+    # ------------------------------------------------------------------
+    # Downsampling
+    # ------------------------------------------------------------------
+
+    @api.model
+    def cron_rollup_metrics(self):
+        """Cron job to roll raw samples up into 5 minute and hourly buckets"""
+        for (source, _expr, _param, _retention), (tier, bucket, _p, _r) in zip(METRIC_TIERS, METRIC_TIERS[1:]):
+            self._rollup(source, tier, bucket)
+            self.env.cr.commit()
+        self._apply_retention()
+
+    def _rollup(self, source, tier, bucket):
+        """Aggregate the closed buckets of a tier from its source tier.
+
+        The last bucket written is recomputed, so samples that arrived after
+        the previous run are not lost.
+        """
+        self.env.cr.execute("SELECT max(timestamp) FROM saas_instance_metric WHERE tier = %s", (tier,))
+        since = self.env.cr.fetchone()[0]
+        self.env.cr.execute(f"""
+            INSERT INTO saas_instance_metric
+                (instance_id, tier, timestamp, sample_count, cpu_usage, cpu_max,
+                 memory_usage, memory_max, storage_usage, request_count)
+            SELECT instance_id, %(tier)s, {bucket} AS bucket,
+                   sum(sample_count),
+                   sum(cpu_usage * sample_count) / nullif(sum(sample_count) FILTER (WHERE cpu_usage IS NOT NULL), 0),
+                   max(cpu_max),
+                   sum(memory_usage * sample_count) / nullif(sum(sample_count) FILTER (WHERE memory_usage IS NOT NULL), 0),
+                   max(memory_max),
+                   avg(storage_usage),
+                   sum(request_count)
+            FROM saas_instance_metric
+            WHERE tier = %(source)s
+              AND (%(since)s::timestamp IS NULL OR timestamp >= %(since)s)
+              AND timestamp < %(until)s
+            GROUP BY instance_id, bucket
+            ON CONFLICT (instance_id, tier, timestamp) DO UPDATE SET
+                sample_count = EXCLUDED.sample_count,
+                cpu_usage = EXCLUDED.cpu_usage,
+                cpu_max = EXCLUDED.cpu_max,
+                memory_usage = EXCLUDED.memory_usage,
+                memory_max = EXCLUDED.memory_max,
+                storage_usage = EXCLUDED.storage_usage,
+                request_count = EXCLUDED.request_count
+        """, {
+            'tier': tier,
+            'source': source,
+            'since': since,
+            'until': self._bucket_start(fields.Datetime.now(), tier),
+        })
+        _logger.info(f"Rolled up {self.env.cr.rowcount} {tier} metric buckets")
+
+    @api.model
+    def _bucket_start(self, value, tier):
+        """Start of the bucket of a tier containing the datetime"""
+        seconds = TIER_SECONDS[tier]
+        if not seconds:
+            return value
+        seconds_of_day = value.hour * 3600 + value.minute * 60 + value.second
+        return value - timedelta(seconds=seconds_of_day % seconds, microseconds=value.microsecond)
+
+    @api.model
+    def _apply_retention(self):
+        """Delete the samples older than the retention of their tier"""
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        now = fields.Datetime.now()
+        for tier, _bucket, param, default in METRIC_TIERS:
+            retention = int(ICPSudo.get_param(param, default))
+            unit = timedelta(hours=retention) if tier == 'raw' else timedelta(days=retention)
+            self.env.cr.execute(
+                "DELETE FROM saas_instance_metric WHERE tier = %s AND timestamp < %s",
+                (tier, now - unit),
+            )
+            if self.env.cr.rowcount:
+                _logger.info(f"Deleted {self.env.cr.rowcount} expired {tier} metrics")
+        self.invalidate_model()
+
+    # ------------------------------------------------------------------
+    # Query API
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _pick_tier(self, date_from, date_to):
+        """Resolution for a time range, coarser as the range grows"""
+        span = (date_to - date_from).total_seconds()
+        if span <= 6 * 3600:
+            return 'raw'
+        if span <= 3 * 86400:
+            return '5m'
+        return '1h'
+
+    @api.model
+    def get_metrics(self, instance_ids, date_from, date_to=None, resolution=None):
+        """Metric series of instances over a time range.
+
+        Reads a single tier, picked from the range when ``resolution`` is not
+        given, so dashboards never scan raw samples for long ranges. Returns
+        ``{instance_id: [{'timestamp', 'cpu_usage', 'cpu_max', 'memory_usage',
+        'memory_max', 'storage_usage', 'request_count'}, ...]}`` in time order.
+        """
+        date_from = fields.Datetime.to_datetime(date_from)
+        date_to = fields.Datetime.to_datetime(date_to) or fields.Datetime.now()
+        tier = resolution or self._pick_tier(date_from, date_to)
+
+        self.env.cr.execute("""
+            SELECT instance_id, timestamp, cpu_usage, cpu_max, memory_usage,
+                   memory_max, storage_usage, request_count
+            FROM saas_instance_metric
+            WHERE tier = %s AND instance_id IN %s AND timestamp >= %s AND timestamp < %s
+            ORDER BY instance_id, timestamp
+        """, (tier, tuple(instance_ids) or (0,), date_from, date_to))
+
+        series = {instance_id: [] for instance_id in instance_ids}
+        for instance_id, timestamp, cpu, cpu_max, memory, memory_max, storage, requests in self.env.cr.fetchall():
+            series[instance_id].append({
+                'timestamp': timestamp.isoformat(),
+                'cpu_usage': cpu,
+                'cpu_max': cpu_max,
+                'memory_usage': memory,
+                'memory_max': memory_max,
+                'storage_usage': storage,
+                'request_count': requests,
+            })
+        return series
+
+    @api.model
+    def get_metrics_by_database(self, database_names, date_from, date_to=None, resolution=None):
+        """Same as get_metrics, keyed by tenant database name"""
+        instances = self.env['saas.instance.provisioning'].search([('database_name', 'in', list(database_names))])
+        series = self.get_metrics(instances.ids, date_from, date_to, resolution)
+        return {instance.database_name: series[instance.id] for instance in instances}
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+LOCAL_HOST = 'local'
+
+
+class SaasPortAllocation(models.Model):
+    _name = 'saas.port.allocation'
+    _description = 'SaaS Container Port Allocation'
+    _order = 'host, port'
+    _rec_name = 'port'
+
+    host = fields.Char('Docker Host', required=True, default=LOCAL_HOST, readonly=True)
+    port = fields.Integer('Port', required=True, readonly=True)
+    state = fields.Selection([
+        ('used', 'In Use'),
+        ('free', 'Free'),
+    ], string='Status', default='used', required=True, readonly=True)
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', readonly=True, ondelete='set null')
+    standby_id = fields.Many2one('saas.standby.container', 'Standby Container', readonly=True, ondelete='set null')
+
+    _sql_constraints = [
+        ('host_port_unique', 'UNIQUE(host, port)', 'A port can only be allocated once per host.'),
+    ]
+
+    # ------------------------------------------------------------------
+    # Allocation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def allocate(self, instance=None, standby=None, host=LOCAL_HOST):
+        """Reserve a port on the host for an instance or a standby container.
+
+        A port released by a terminated instance is reused first, locked with
+        SKIP LOCKED so concurrent allocations never wait on each other. Fresh
+        ports come from a PostgreSQL sequence per host, which is not
+        transactional either. When the sequence reaches the end of the host
+        range, the holes left by rolled back allocations are searched.
+        """
+        owner = {
+            'instance_id': instance.id if instance else False,
+            'standby_id': standby.id if standby else False,
+        }
+
+        self.env.cr.execute("""
+            SELECT id FROM saas_port_allocation
+            WHERE host = %s AND state = 'free'
+            ORDER BY port
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (host,))
+        row = self.env.cr.fetchone()
+        if row:
+            allocation = self.browse(row[0])
+            allocation.write(dict(owner, state='used'))
+            return allocation.port
+
+        start, end = self._get_port_range(host)
+        sequence = self._get_sequence(host)
+        port = int(sequence.next_by_id())
+        if port <= end and self._insert(host, port, owner):
+            return port
+
+        # Range exhausted: take a hole, if any
+        self.env.cr.execute("""
+            SELECT p FROM generate_series(%s, %s) p
+            WHERE NOT EXISTS (SELECT 1 FROM saas_port_allocation a WHERE a.host = %s AND a.port = p)
+            LIMIT 10
+        """, (start, end, host))
+        for port, in self.env.cr.fetchall():
+            if self._insert(host, port, owner):
+                return port
+        raise Exception(f"No free port left on host {host} ({start}-{end})")
+
+    def _insert(self, host, port, owner):
+        """Insert an allocation, False when the port is already taken"""
+        self.env.cr.execute("""
+            INSERT INTO saas_port_allocation (host, port, state, instance_id, standby_id,
+                                              create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, 'used', %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (host, port) DO NOTHING
+            RETURNING id
+        """, (host, port, owner['instance_id'] or None, owner['standby_id'] or None, self.env.uid, self.env.uid))
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def release(self, instance=None, standby=None, host=None):
+        """Put the ports of an instance or a standby container back in the free list"""
+        domain = [('instance_id', '=', instance.id)] if instance else [('standby_id', '=', standby.id)]
+        if host:
+            domain.append(('host', '=', host))
+        self.search(domain + [('state', '=', 'used')]).write({
+            'state': 'free',
+            'instance_id': False,
+            'standby_id': False,
+        })
+
+    @api.model
+    def transfer(self, standby, instance):
+        """Hand the port of a bound standby container over to its instance"""
+        self.search([('standby_id', '=', standby.id), ('state', '=', 'used')]).write({
+            'standby_id': False,
+            'instance_id': instance.id,
+        })
+
+    # ------------------------------------------------------------------
+    # Host ranges
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_port_range(self, host):
+        """First and last port usable for tenant containers on the host.
+
+        The range of the Docker host record wins, the local host included;
+        the global parameters only serve hosts without a record.
+        """
+        docker_host = self.env['saas.docker.host'].with_context(active_test=False).search(
+            [('name', '=', host)], limit=1)
+        if docker_host:
+            return docker_host.port_range_start, docker_host.port_range_end
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        return int(ICPSudo.get_param('saas.port_range_start', 8070)), int(ICPSudo.get_param('saas.port_range_end', 9999))
+
+    @api.model
+    def _get_sequence(self, host):
+        """Sequence handing out fresh ports of the host, created on first use"""
+        code = f'saas.port.{host}'
+        sequence = self.env['ir.sequence'].sudo().search([('code', '=', code)], limit=1)
+        if sequence:
+            return sequence
+
+        # Only the first allocation of a host goes through here
+        self.env.cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (code,))
+        sequence = self.env['ir.sequence'].sudo().search([('code', '=', code)], limit=1)
+        if sequence:
+            return sequence
+
+        if host == LOCAL_HOST:
+            self._import_existing_ports()
+        start, _end = self._get_port_range(host)
+        self.env.cr.execute("SELECT max(port) FROM saas_port_allocation WHERE host = %s", (host,))
+        last_port = self.env.cr.fetchone()[0]
+        return self.env['ir.sequence'].sudo().create({
+            'name': f'SaaS Ports {host}',
+            'code': code,
+            'implementation': 'standard',
+            'number_next': max(start, (last_port or 0) + 1),
+            'number_increment': 1,
+            'padding': 0,
+        })
+
+    @api.model
+    def _import_existing_ports(self):
+        """Record the ports allocated before this table existed"""
+        self.env.cr.execute("""
+            INSERT INTO saas_port_allocation (host, port, state, instance_id,
+                                              create_uid, create_date, write_uid, write_date)
+            SELECT %(host)s, port,
+                   CASE WHEN state = 'terminated' THEN 'free' ELSE 'used' END,
+                   CASE WHEN state = 'terminated' THEN NULL ELSE id END,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM saas_instance_provisioning
+            WHERE port IS NOT NULL AND port > 0
+            ORDER BY state = 'terminated', id
+            ON CONFLICT (host, port) DO NOTHING
+        """, {'host': LOCAL_HOST, 'uid': self.env.uid})
+        self.env.cr.execute("""
+            INSERT INTO saas_port_allocation (host, port, state, standby_id,
+                                              create_uid, create_date, write_uid, write_date)
+            SELECT %(host)s, port, 'used', id,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM saas_standby_container
+            WHERE port IS NOT NULL AND port > 0 AND state != 'assigned'
+            ON CONFLICT (host, port) DO NOTHING
+        """, {'host': LOCAL_HOST, 'uid': self.env.uid})
+        _logger.info("Imported the ports of existing containers into the port allocator")
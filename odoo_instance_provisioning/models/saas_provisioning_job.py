@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import uuid
+from datetime import timedelta
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Instance request priority to job priority
+JOB_PRIORITIES = {'low': '0', 'normal': '1', 'high': '2', 'urgent': '3'}
+
+
+class SaasProvisioningJob(models.Model):
+    _name = 'saas.provisioning.job'
+    _description = 'SaaS Provisioning Job'
+    _order = 'priority desc, eta, id'
+    _rec_name = 'job_uuid'
+
+    job_uuid = fields.Char('Job ID', required=True, readonly=True, copy=False, index=True,
+                           default=lambda self: str(uuid.uuid4()))
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Instance', required=True, ondelete='cascade')
+    operation = fields.Selection([
+        ('start', 'Start'),
+        ('stop', 'Stop'),
+        ('restart', 'Restart'),
+        ('backup', 'Backup'),
+        ('terminate', 'Terminate'),
+        ('migrate', 'Move Host'),
+        ('wake', 'Wake Up'),
+    ], string='Operation', required=True)
+    priority = fields.Selection([
+        ('0', 'Low'),
+        ('1', 'Normal'),
+        ('2', 'High'),
+        ('3', 'Urgent'),
+    ], string='Priority', default='1', required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead Letter'),
+    ], string='Status', default='pending', required=True, index=True)
+
+    attempts = fields.Integer('Attempts', readonly=True)
+    max_attempts = fields.Integer('Max Attempts', default=3)
+    eta = fields.Datetime('Run After', default=fields.Datetime.now, required=True,
+                          help='The job is not run before this date, used to delay retries')
+    started_date = fields.Datetime('Started', readonly=True)
+    finished_date = fields.Datetime('Finished', readonly=True)
+    result = fields.Text('Result', readonly=True)
+    error = fields.Text('Last Error', readonly=True)
+
+    _sql_constraints = [
+        ('job_uuid_unique', 'UNIQUE(job_uuid)', 'Job ID must be unique.'),
+    ]
+
+    @api.model
+    def enqueue(self, instance, operation, priority=None):
+        """Queue an operation on an instance and wake the job runner up"""
+        request_priority = instance.instance_request_id.priority or 'normal'
+        job = self.create({
+            'instance_id': instance.id,
+            'operation': operation,
+            'priority': priority or JOB_PRIORITIES.get(request_priority, '1'),
+        })
+        self.env.ref('odoo_instance_provisioning.ir_cron_run_provisioning_jobs').sudo()._trigger()
+        return job
+
+    def action_requeue(self):
+        """Send dead jobs back to the queue"""
+        for job in self:
+            if job.state != 'dead':
+                raise UserError(_('Only dead letter jobs can be requeued.'))
+            job.write({
+                'state': 'pending',
+                'attempts': 0,
+                'eta': fields.Datetime.now(),
+                'error': False,
+            })
+        self.env.ref('odoo_instance_provisioning.ir_cron_run_provisioning_jobs').sudo()._trigger()
+
+    def get_job_status(self):
+        """Status information for the API"""
+        self.ensure_one()
+        return {
+            'job_id': self.job_uuid,
+            'operation': self.operation,
+            'state': self.state,
+            'subdomain': self.instance_id.subdomain,
+            'instance_state': self.instance_id.state,
+            'attempts': self.attempts,
+            'created': self.create_date.isoformat() if self.create_date else None,
+            'started': self.started_date.isoformat() if self.started_date else None,
+            'finished': self.finished_date.isoformat() if self.finished_date else None,
+            'result': self.result,
+            'error': self.error,
+        }
+
+    # ------------------------------------------------------------------
+    # Runner
+    # ------------------------------------------------------------------
+
+    @api.model
+    def cron_run_jobs(self, limit=50):
+        """Cron job to run queued provisioning jobs by priority"""
+        self._requeue_stale_jobs()
+        self.env.cr.commit()
+
+        uid, context = self.env.uid, dict(self.env.context)
+        for _i in range(limit):
+            if not self._run_next_job(uid, context):
+                break
+
+    def _run_next_job(self, uid, context):
+        """Claim the next due job and run it on a dedicated cursor.
+
+        The cursor holds the advisory lock of the job until the outcome is
+        committed. Should the worker die, the lock goes away with its
+        connection, which is how stale jobs are told apart from slow ones.
+        """
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            job = env['saas.provisioning.job']._claim_next_job()
+            if not job:
+                return False
+            try:
+                job._run()
+                cr.commit()
+            finally:
+                # The unlock fails in an aborted transaction
+                cr.rollback()
+                job._release_lock()
+            return True
+
+    @api.model
+    def _claim_next_job(self):
+        """Lock the next due job and mark it running, committed right away"""
+        self.env.cr.execute("""
+            SELECT id FROM saas_provisioning_job
+            WHERE state = 'pending' AND eta <= (now() at time zone 'UTC')
+            ORDER BY priority DESC, eta, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        if not row:
+            return self.browse()
+        job = self.browse(row[0])
+        if not job._try_lock():
+            # Still held by a runner requeueing it
+            return self.browse()
+        job.write({
+            'state': 'running',
+            'attempts': job.attempts + 1,
+            'started_date': fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+        return job
+
+    def _run(self):
+        """Run a claimed job, its changes are rolled back if it fails"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                result = self._execute()
+            self.write({
+                'state': 'done',
+                'finished_date': fields.Datetime.now(),
+                'result': result,
+                'error': False,
+            })
+        except Exception as e:
+            self._handle_failure(e)
+
+    def _try_lock(self):
+        """Take the session advisory lock of the job, False when held elsewhere"""
+        self.env.cr.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f'saas.job.{self.id}',))
+        return self.env.cr.fetchone()[0]
+
+    def _release_lock(self):
+        """Release a lock taken by _try_lock"""
+        self.env.cr.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f'saas.job.{self.id}',))
+
+    def _execute(self):
+        """Run the operation and return a result message"""
+        self.ensure_one()
+        instance = self.instance_id
+        if self.operation == 'start':
+            instance.action_start()
+            return 'Instance started successfully'
+        elif self.operation == 'stop':
+            instance.action_stop()
+            return 'Instance stopped successfully'
+        elif self.operation == 'restart':
+            instance.action_stop()
+            instance.action_start()
+            return 'Instance restarted successfully'
+        elif self.operation == 'backup':
+            instance.action_backup()
+            return 'Backup created successfully'
+        elif self.operation == 'terminate':
+            instance.action_terminate()
+            return 'Instance terminated successfully'
+        elif self.operation == 'wake':
+            instance.action_wake()
+            return 'Instance woken up'
+        elif self.operation == 'migrate':
+            instance.action_migrate()
+            return f'Instance moved to Docker host {instance.docker_host_id.name}'
+        raise UserError(_('Unknown operation: %s') % self.operation)
+
+    def _handle_failure(self, error):
+        """Retry with an exponential delay, dead-letter when out of attempts"""
+        self.ensure_one()
+        if self.attempts >= self.max_attempts:
+            self.write({
+                'state': 'dead',
+                'finished_date': fields.Datetime.now(),
+                'error': str(error),
+            })
+            self.instance_id._create_log('error', f'Job {self.job_uuid} ({self.operation}) failed: {str(error)}')
+            _logger.error(f"Job {self.job_uuid} ({self.operation}) moved to dead letter: {str(error)}")
+        else:
+            self.write({
+                'state': 'pending',
+                'eta': fields.Datetime.now() + timedelta(minutes=2 ** self.attempts),
+                'error': str(error),
+            })
+            _logger.warning(f"Job {self.job_uuid} ({self.operation}) failed, retrying: {str(error)}")
+
+    @api.model
+    def _requeue_stale_jobs(self):
+        """Jobs left running by a dead worker go back to the queue.
+
+        A live runner holds the advisory lock of its job however long the job
+        takes, so a running job whose lock can be taken has lost its runner.
+        The state is read again once the locks are held, jobs finished in the
+        meantime are left alone.
+        """
+        stale = self.search([('state', '=', 'running')]).filtered(lambda job: job._try_lock())
+        if not stale:
+            return
+        try:
+            # Fresh snapshot, the session locks survive the commit
+            self.env.cr.commit()
+            stale.invalidate_recordset(['state'])
+            for job in stale.filtered(lambda job: job.state == 'running'):
+                job._handle_failure(Exception('Job interrupted'))
+            self.env.cr.commit()
+        finally:
+            self.env.cr.rollback()
+            for job in stale:
+                job._release_lock()
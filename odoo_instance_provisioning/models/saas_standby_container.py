@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import uuid
+from datetime import timedelta
+from odoo import models, fields, api, _
+from .saas_instance import ODOO_HEALTHCHECK, TENANT_CONFIG_PATH
+
+# Optional imports
+try:
+    import docker
+    HAS_DOCKER = True
+except ImportError:
+    HAS_DOCKER = False
+    docker = None
+
+try:
+    import requests
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+    requests = None
+
+_logger = logging.getLogger(__name__)
+
+
+class SaasStandbyContainer(models.Model):
+    _name = 'saas.standby.container'
+    _description = 'SaaS Warm Standby Container'
+    _order = 'image, create_date'
+    _rec_name = 'container_name'
+
+    container_name = fields.Char('Container Name', required=True, readonly=True)
+    container_id = fields.Char('Container ID', readonly=True)
+    volume_name = fields.Char('Volume', readonly=True)
+    image = fields.Char('Docker Image', required=True, readonly=True)
+    port = fields.Integer('Port', readonly=True)
+    state = fields.Selection([
+        ('starting', 'Starting'),
+        ('ready', 'Ready'),
+        ('assigned', 'Assigned'),
+        ('error', 'Error'),
+    ], string='Status', default='starting', required=True, readonly=True)
+    instance_id = fields.Many2one('saas.instance.provisioning', 'Bound Instance', readonly=True, ondelete='set null')
+    ready_date = fields.Datetime('Ready Since', readonly=True)
+    assigned_date = fields.Datetime('Assigned Date', readonly=True)
+    error_message = fields.Text('Error', readonly=True)
+
+    _sql_constraints = [
+        ('container_name_unique', 'UNIQUE(container_name)', 'Standby container name must be unique.'),
+    ]
+
+    @api.model
+    def _get_pool_settings(self):
+        """Target size, high-water mark and idle timeout of the pool"""
+        ICPSudo = self.env['ir.config_parameter'].sudo()
+        target = int(ICPSudo.get_param('saas.container_pool_size', 2))
+        high_water = max(target, int(ICPSudo.get_param('saas.container_pool_max', 5)))
+        idle_hours = int(ICPSudo.get_param('saas.container_pool_idle_hours', 24))
+        return target, high_water, idle_hours
+
+    @api.model
+    def _get_image(self, odoo_version):
+        return f'odoo:{odoo_version}'
+
+    # ------------------------------------------------------------------
+    # Binding
+    # ------------------------------------------------------------------
+
+    @api.model
+    def bind_instance(self, instance):
+        """Bind a ready standby container to the instance database.
+
+        Returns the standby container used, or an empty recordset when the
+        pool has nothing ready for the instance image.
+        """
+        if not HAS_DOCKER:
+            return self.browse()
+
+        member = self._claim_ready_member(self._get_image(instance.odoo_version))
+        if not member:
+            return member
+
+        try:
+            client = self.env['saas.docker.host']._get_default_host()._get_client()
+            container = client.containers.get(member.container_id)
+            instance._write_tenant_config(container)
+
+            # Take the tenant name so the instance is reachable on the Docker network,
+            # the restart makes Odoo pick up the tenant --db-filter
+            container.rename(f'odoo_{instance.database_name}')
+            instance._apply_resource_limits(container)
+            container.restart()
+            # The data volume keeps its standby name, the instance records it
+            instance.volume_name = member.volume_name
+        except Exception as e:
+            member.write({'state': 'error', 'error_message': str(e)})
+            _logger.error(f"Failed to bind standby container {member.container_name}: {str(e)}")
+            return self.browse()
+
+        member.write({
+            'state': 'assigned',
+            'instance_id': instance.id,
+            'assigned_date': fields.Datetime.now(),
+        })
+        return member
+
+    def _claim_ready_member(self, image):
+        """Lock a ready standby container for the image, skipping locked rows"""
+        self.env.cr.execute("""
+            SELECT id FROM saas_standby_container
+            WHERE state = 'ready' AND image = %s
+            ORDER BY ready_date, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (image,))
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    # ------------------------------------------------------------------
+    # Pool maintenance
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_wanted_images(self):
+        """Images of the default setting and of all running Odoo versions"""
+        default_image = self.env['ir.config_parameter'].sudo().get_param('saas.docker_image', 'odoo:17.0')
+        versions = self.env['saas.instance.provisioning'].search([
+            ('state', '!=', 'terminated'),
+        ]).mapped('odoo_version')
+        return {default_image} | {self._get_image(version) for version in versions if version}
+
+    @api.model
+    def cron_maintain_container_pool(self):
+        """Cron job to refill, promote and reap the standby container pool"""
+        if not HAS_DOCKER:
+            _logger.warning("Docker library not available for the standby container pool")
+            return
+
+        target, high_water, idle_hours = self._get_pool_settings()
+        wanted = self._get_wanted_images() if target > 0 else set()
+
+        self.search([('state', '=', 'starting')])._check_ready()
+
+        # Forget assigned members, they now belong to their instance
+        self.search([('state', '=', 'assigned')]).unlink()
+        self.search([('state', '=', 'error')])._reap()
+
+        idle_since = fields.Datetime.now() - timedelta(hours=idle_hours)
+        recent = fields.Datetime.now() - timedelta(hours=1)
+        for image in wanted:
+            members = self.search([('image', '=', image), ('state', 'in', ['starting', 'ready'])])
+
+            # Scale with recent demand, between the target and the high-water mark
+            demand = self.env['saas.instance.provisioning'].search_count([
+                ('odoo_version', '=', image.split(':')[-1]),
+                ('provisioned_date', '>=', recent),
+            ])
+            wanted_size = min(high_water, target + demand)
+
+            if len(members) > high_water:
+                members.sorted('create_date')[high_water:]._reap()
+            elif len(members) > wanted_size:
+                idle = members.filtered(lambda m: m.state == 'ready' and m.ready_date and m.ready_date < idle_since)
+                idle[:len(members) - wanted_size]._reap()
+
+            for _i in range(wanted_size - len(members)):
+                self._start_member(image)
+                self.env.cr.commit()
+
+        # Images no longer used by any instance
+        self.search([('image', 'not in', list(wanted)), ('state', 'in', ['starting', 'ready'])])._reap()
+
+    @api.model
+    def _start_member(self, image):
+        """Start one unassigned Odoo container for the image"""
+        name = f'odoo_standby_{uuid.uuid4().hex[:8]}'
+        member = self.create({
+            'container_name': name,
+            'volume_name': f'odoo_data_{name}',
+            'image': image,
+        })
+        member.port = self.env['saas.port.allocation'].allocate(standby=member)
+        host = self.env['saas.docker.host']._get_default_host()
+        try:
+            client = host._get_client()
+            client.volumes.create(name=member.volume_name)
+            container = client.containers.run(
+                image=image,
+                name=name,
+                ports={'8069/tcp': member.port},
+                environment={
+                    **host._get_tenant_db_env(),
+                    'ODOO_RC': TENANT_CONFIG_PATH,
+                },
+                volumes={member.volume_name: {'bind': '/var/lib/odoo', 'mode': 'rw'}},
+                network=host.network,
+                detach=True,
+                restart_policy={"Name": "unless-stopped"},
+                healthcheck=ODOO_HEALTHCHECK,
+            )
+            member.container_id = container.id
+        except Exception as e:
+            member.write({'state': 'error', 'error_message': str(e)})
+            _logger.error(f"Failed to start standby container {name}: {str(e)}")
+        return member
+
+    def _check_ready(self):
+        """Promote starting members whose Odoo answers on HTTP"""
+        for member in self:
+            try:
+                res = requests.get(f'http://{member.container_name}:8069/web/health', timeout=5)
+                if res.status_code == 200:
+                    member.write({'state': 'ready', 'ready_date': fields.Datetime.now()})
+            except requests.exceptions.RequestException:
+                if member.create_date < fields.Datetime.now() - timedelta(minutes=15):
+                    member.write({'state': 'error', 'error_message': 'Odoo did not start within 15 minutes'})
+
+    def _reap(self):
+        """Remove the containers and volumes of unassigned members"""
+        client = self.env['saas.docker.host']._get_default_host()._get_client() if self else None
+        for member in self:
+            try:
+                if member.container_id:
+                    container = client.containers.get(member.container_id)
+                    container.remove(force=True)
+                if member.volume_name:
+                    client.volumes.get(member.volume_name).remove(force=True)
+            except docker.errors.NotFound:
+                pass
+            except Exception as e:
+                _logger.error(f"Failed to reap standby container {member.container_name}: {str(e)}")
+                continue
+            _logger.info(f"Reaped standby container {member.container_name}")
+            self.env['saas.port.allocation'].release(standby=member)
+            member.unlink()
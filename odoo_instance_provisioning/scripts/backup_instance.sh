@@ -1,9 +1,16 @@
 #!/bin/bash
 
 # Script to backup Odoo instance
-# Usage: ./backup_instance.sh <db_name> [backup_dir]
+# Usage: ./backup_instance.sh <db_name> [backup_dir] [jobs]
+#
+# The dump is streamed through a multi-threaded compressor (zstd, or pigz,
+# or gzip) into the backup directory without an intermediate file. With
+# jobs > 1 the database is dumped in directory format by parallel workers.
+# RATE_LIMIT (bytes per second, needs pv) caps the dump and filestore
+# streams, a rate limited dump is always a single stream.
 
 set -e  # Exit on any error
+set -o pipefail  # A failing pg_dump or tar fails the whole pipeline
 
 # Set locale to avoid perl warnings
 export LC_ALL=C.UTF-8
@@ -12,6 +19,8 @@ export LANG=C.UTF-8
 # Parse arguments
 DB_NAME="$1"
 BACKUP_DIR="${2:-/opt/odoo/backups}"
+DUMP_JOBS="${3:-1}"
+RATE_LIMIT="${RATE_LIMIT:-0}"
 
 # Configuration
 ODOO_USER="${PGUSER:-odoo}"
@@ -19,8 +28,37 @@ ODOO_PASSWORD="${PGPASSWORD:-odoo}"
 DB_HOST="${PGHOST:-localhost}"
 DB_PORT="${PGPORT:-5432}"
 TIMESTAMP=$(date '+%Y%m%d_%H%M%S')
-BACKUP_FILE="$BACKUP_DIR/${DB_NAME}_${TIMESTAMP}.sql"
-FILESTORE_BACKUP="$BACKUP_DIR/${DB_NAME}_filestore_${TIMESTAMP}.tar.gz"
+
+# Pick the fastest compressor available, all of them use every core but gzip
+if command -v zstd >/dev/null 2>&1; then
+    COMPRESS="zstd -q -T0 -3"
+    EXT="zst"
+elif command -v pigz >/dev/null 2>&1; then
+    COMPRESS="pigz -6"
+    EXT="gz"
+else
+    COMPRESS="gzip -6"
+    EXT="gz"
+fi
+
+# Rate limiter inserted in the streams, pass-through when unlimited
+LIMIT="cat"
+if [ "$RATE_LIMIT" -gt 0 ]; then
+    if command -v pv >/dev/null 2>&1; then
+        LIMIT="pv -q -L $RATE_LIMIT"
+        # Parallel workers write their files directly, they cannot be limited
+        DUMP_JOBS=1
+    else
+        echo "pv not found, backup bandwidth is not limited" >&2
+    fi
+fi
+
+if [ "$DUMP_JOBS" -gt 1 ]; then
+    BACKUP_FILE="$BACKUP_DIR/${DB_NAME}_${TIMESTAMP}.dir"
+else
+    BACKUP_FILE="$BACKUP_DIR/${DB_NAME}_${TIMESTAMP}.dump.$EXT"
+fi
+FILESTORE_BACKUP="$BACKUP_DIR/${DB_NAME}_filestore_${TIMESTAMP}.tar.$EXT"
 
 # Logging function
 log() {
@@ -73,7 +111,7 @@ run_psql_cmd() {
 
 # Validate arguments
 if [ -z "$DB_NAME" ]; then
-    error_exit "Usage: $0 <db_name> [backup_dir]"
+    error_exit "Usage: $0 <db_name> [backup_dir] [jobs]"
 fi
 
 # Check if database exists
@@ -94,28 +132,38 @@ export PGPASSWORD="$ODOO_PASSWORD"
 export PGHOST="$DB_HOST"
 export PGPORT="$DB_PORT"
 
-pg_dump \
-    --dbname="$DB_NAME" \
-    --file="$BACKUP_FILE" \
-    --verbose \
-    --format=custom \
-    --compress=9 || error_exit "Failed to backup database"
+if [ "$DUMP_JOBS" -gt 1 ]; then
+    # Large database: one worker per table, each file compressed by pg_dump
+    pg_dump \
+        --dbname="$DB_NAME" \
+        --file="$BACKUP_FILE" \
+        --format=directory \
+        --jobs="$DUMP_JOBS" \
+        --compress=1 || error_exit "Failed to backup database"
+else
+    # Uncompressed custom format, compressed on the way to the backup file
+    pg_dump \
+        --dbname="$DB_NAME" \
+        --format=custom \
+        --compress=0 | $LIMIT | $COMPRESS > "$BACKUP_FILE" || error_exit "Failed to backup database"
+fi
 
 # Backup filestore
-FILESTORE_PATH="/opt/odoo/data/filestore/$DB_NAME"
+FILESTORE_ROOT="${FILESTORE_ROOT:-/opt/odoo/data/filestore}"
+FILESTORE_PATH="$FILESTORE_ROOT/$DB_NAME"
 if [ -d "$FILESTORE_PATH" ]; then
     log "Creating filestore backup: $FILESTORE_BACKUP"
-    tar -czf "$FILESTORE_BACKUP" -C "/opt/odoo/data/filestore" "$DB_NAME" || error_exit "Failed to backup filestore"
+    tar -cf - -C "$FILESTORE_ROOT" "$DB_NAME" | $LIMIT | $COMPRESS > "$FILESTORE_BACKUP" || error_exit "Failed to backup filestore"
 else
     log "Filestore directory not found, skipping filestore backup"
 fi
 
 # Verify backup files
-if [ ! -f "$BACKUP_FILE" ]; then
+if [ ! -e "$BACKUP_FILE" ]; then
     error_exit "Database backup file not created"
 fi
 
-BACKUP_SIZE=$(du -h "$BACKUP_FILE" | cut -f1)
+BACKUP_SIZE=$(du -sh "$BACKUP_FILE" | cut -f1)
 log "Database backup completed: $BACKUP_FILE ($BACKUP_SIZE)"
 
 if [ -f "$FILESTORE_BACKUP" ]; then
@@ -138,10 +186,7 @@ EOF
 
 log "Backup info saved: $INFO_FILE"
 
-# Cleanup old backups (keep last 7 days)
-log "Cleaning up old backups (keeping last 7 days)"
-find "$BACKUP_DIR" -name "${DB_NAME}_*.sql" -mtime +7 -delete || true
-find "$BACKUP_DIR" -name "${DB_NAME}_filestore_*.tar.gz" -mtime +7 -delete || true
-find "$BACKUP_DIR" -name "${DB_NAME}_*.info" -mtime +7 -delete || true
+# Old backups are pruned by the module from its backup index
+# (saas.backup_retention_days), not by scanning the backup directory
 
 log "Backup process completed successfully for database: $DB_NAME"
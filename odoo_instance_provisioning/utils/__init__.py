@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import container_stats
+from . import tenant_rpc
+from . import pg_pool
+from . import db_engine
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional imports
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+    zstandard = None
+
+# Dump files are cut in fixed size chunks. pg_dump writes one file per
+# table, so unchanged tables and the unchanged head of append-mostly tables
+# (mail_message, account_move_line...) map to chunks already stored.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Odoo stores attachments as <2 hex>/<sha1 of the content>
+FILESTORE_NAME = re.compile(r'^[0-9a-f]{40}$')
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def compress(data):
+    """zstd when available, zlib otherwise. Both release the GIL."""
+    if HAS_ZSTANDARD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data):
+    if data[:4] == ZSTD_MAGIC:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class Throttle:
+    """Token bucket shared by concurrent backups to cap their total I/O rate"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.allowance = bytes_per_second
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= nbytes
+            # Sleeping under the lock makes the other backups wait their turn
+            if self.allowance < 0:
+                time.sleep(-self.allowance / self.rate)
+
+
+class BackupRepository:
+    """Content-addressed backup repository of one tenant.
+
+    Layout under ``root``::
+
+        chunks/<2 hex>/<sha256>    compressed database dump chunks
+        blobs/<2 hex>/<sha1>       filestore files, under their Odoo name
+        manifests/<name>.json      one per backup
+
+    Every manifest describes a complete backup, but a backup only writes the
+    objects missing from the repository, which it lists with their stored
+    size under ``objects``. Restoring a backup reads objects written by the
+    backups before it in the chain, so pruning a backup only deletes the
+    objects no remaining manifest refers to.
+    """
+
+    def __init__(self, root, throttle=None, workers=None):
+        self.root = root
+        self.throttle = throttle
+        # Chunks are hashed and compressed by a pool of threads
+        self.workers = workers or os.cpu_count() or 1
+        self.chunks_path = os.path.join(root, 'chunks')
+        self.blobs_path = os.path.join(root, 'blobs')
+        self.manifests_path = os.path.join(root, 'manifests')
+
+    def _object_path(self, kind, key):
+        return os.path.join(self.chunks_path if kind == 'chunk' else self.blobs_path, key[:2], key)
+
+    def _write_atomic(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return os.path.getsize(path)
+
+    def _throttle(self, nbytes):
+        if self.throttle:
+            self.throttle.consume(nbytes)
+
+    def manifest_path(self, name):
+        return os.path.join(self.manifests_path, f'{name}.json')
+
+    def load_manifest(self, name):
+        with open(self.manifest_path(name)) as f:
+            return json.load(f)
+
+    def make_temp_dir(self):
+        """Scratch directory on the repository disk"""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(dir=self.root, prefix='.tmp_')
+
+    # ------------------------------------------------------------------
+    # Backup
+    # ------------------------------------------------------------------
+
+    def backup(self, name, dump_dir, filestore_path, parent=None, deadline=None):
+        """Store a pg_dump directory and a filestore as backup ``name``.
+
+        Returns the manifest, with ``logical_size`` (size of the backed up
+        data) and ``stored_size`` (bytes actually written). ``deadline`` is
+        a ``time.monotonic()`` value, checked before each chunk and each
+        filestore file; past it the backup raises TimeoutError and writes
+        no manifest.
+        """
+        manifest = {
+            'name': name,
+            'parent': parent,
+            'dump': {},
+            'filestore': {},
+            'objects': {},
+            'logical_size': 0,
+        }
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Bounded so at most a few chunks per worker are held in memory
+            pending = deque()
+            for filename in sorted(os.listdir(dump_dir)):
+                chunks = manifest['dump'][filename] = []
+                with open(os.path.join(dump_dir, filename), 'rb') as f:
+                    while True:
+                        self._check_deadline(name, deadline)
+                        data = f.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        self._throttle(len(data))
+                        manifest['logical_size'] += len(data)
+                        pending.append((chunks, len(chunks), executor.submit(self._store_chunk, data)))
+                        chunks.append(None)
+                        if len(pending) >= 2 * self.workers:
+                            self._collect_chunk(pending.popleft(), manifest['objects'])
+            while pending:
+                self._collect_chunk(pending.popleft(), manifest['objects'])
+
+        if filestore_path and os.path.isdir(filestore_path):
+            for dirpath, _dirnames, filenames in os.walk(filestore_path):
+                for filename in filenames:
+                    self._check_deadline(name, deadline)
+                    source = os.path.join(dirpath, filename)
+                    relpath = os.path.relpath(source, filestore_path)
+                    manifest['logical_size'] += os.path.getsize(source)
+                    manifest['filestore'][relpath] = self._store_blob(source, filename, manifest['objects'])
+
+        manifest['stored_size'] = sum(manifest['objects'].values())
+        self._write_atomic(self.manifest_path(name), lambda f: f.write(json.dumps(manifest).encode()))
+        return manifest
+
+    def _check_deadline(self, name, deadline):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"Backup {name} did not complete before its deadline")
+
+    def _store_chunk(self, data):
+        """Store a chunk, return its key and the bytes written, None if present"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self._object_path('chunk', key)
+        if os.path.exists(path):
+            return key, None
+        return key, self._write_atomic(path, lambda f: f.write(compress(data)))
+
+    def _collect_chunk(self, item, written):
+        chunks, index, future = item
+        key, size = future.result()
+        chunks[index] = key
+        if size is not None:
+            written.setdefault(f'chunk:{key}', size)
+
+    def _store_blob(self, source, filename, written):
+        if FILESTORE_NAME.match(filename):
+            # Already named after its content, no need to read it when present
+            key = filename
+        else:
+            with open(source, 'rb') as f:
+                key = hashlib.sha1(f.read()).hexdigest()
+        path = self._object_path('blob', key)
+        if not os.path.exists(path):
+            self._throttle(os.path.getsize(source))
+            written[f'blob:{key}'] = self._write_atomic(path, lambda f: _copy_into(source, f))
+        return key
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+
+    def restore(self, name, dump_dir, filestore_path):
+        """Rebuild the pg_dump directory and the filestore of backup ``name``"""
+        manifest = self.load_manifest(name)
+
+        os.makedirs(dump_dir, exist_ok=True)
+        for filename, chunks in manifest['dump'].items():
+            with open(os.path.join(dump_dir, filename), 'wb') as f:
+                for key in chunks:
+                    with open(self._object_path('chunk', key), 'rb') as chunk:
+                        f.write(decompress(chunk.read()))
+
+        if filestore_path:
+            for relpath, key in manifest['filestore'].items():
+                target = os.path.join(filestore_path, relpath)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(self._object_path('blob', key), target)
+        return manifest
+
+
+    # ------------------------------------------------------------------
+    # Pruning
+    # ------------------------------------------------------------------
+
+    def prune(self, names, keep_names):
+        """Delete backups ``names`` and the objects no kept backup uses.
+
+        Only the manifests are read, the object directories are never
+        listed. Returns the number of bytes reclaimed.
+        """
+        referenced = set()
+        for name in keep_names:
+            referenced |= self._references(self.load_manifest(name))
+
+        reclaimed = 0
+        for name in names:
+            path = self.manifest_path(name)
+            if not os.path.exists(path):
+                continue
+            for ref in self._references(self.load_manifest(name)) - referenced:
+                kind, key = ref.split(':')
+                object_path = self._object_path(kind, key)
+                if os.path.exists(object_path):
+                    reclaimed += os.path.getsize(object_path)
+                    os.unlink(object_path)
+                # Shared by several pruned backups, count it once
+                referenced.add(ref)
+            reclaimed += os.path.getsize(path)
+            os.unlink(path)
+        return reclaimed
+
+    def _references(self, manifest):
+        refs = {f'chunk:{key}' for chunks in manifest['dump'].values() for key in chunks}
+        refs.update(f'blob:{key}' for key in manifest['filestore'].values())
+        return refs
+
+
+def _copy_into(source, f):
+    with open(source, 'rb') as src:
+        shutil.copyfileobj(src, f)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def _host_memory():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def _read_value(path):
+    with open(path) as f:
+        value = f.read().strip()
+    return None if value == 'max' else int(value)
+
+
+def find_cgroup(container_id):
+    """Locate the cgroup of a container on this host, (version, path) or None"""
+    for path in (os.path.join(CGROUP_ROOT, 'system.slice', f'docker-{container_id}.scope'),
+                 os.path.join(CGROUP_ROOT, 'docker', container_id)):
+        if os.path.exists(os.path.join(path, 'cpu.stat')):
+            return ('v2', path)
+    if os.path.exists(os.path.join(CGROUP_ROOT, 'cpuacct', 'docker', container_id, 'cpuacct.usage')):
+        return ('v1', container_id)
+    return None
+
+
+def read_cgroup(cgroup):
+    """Sample a cgroup: (cpu time in ns, memory usage, memory limit) in bytes"""
+    version, path = cgroup
+    if version == 'v2':
+        with open(os.path.join(path, 'cpu.stat')) as f:
+            stats = dict(line.split() for line in f if line.strip())
+        cpu_ns = int(stats['usage_usec']) * 1000
+        memory = _read_value(os.path.join(path, 'memory.current'))
+        limit = _read_value(os.path.join(path, 'memory.max'))
+    else:
+        cpu_ns = _read_value(os.path.join(CGROUP_ROOT, 'cpuacct', 'docker', path, 'cpuacct.usage'))
+        memory = _read_value(os.path.join(CGROUP_ROOT, 'memory', 'docker', path, 'memory.usage_in_bytes'))
+        limit = _read_value(os.path.join(CGROUP_ROOT, 'memory', 'docker', path, 'memory.limit_in_bytes'))
+
+    host_memory = _host_memory()
+    if not limit or limit > host_memory:
+        limit = host_memory
+    return cpu_ns, memory, limit
+
+
+def docker_usage(client, container_id):
+    """(cpu %, memory %) from the Docker stats API, blocks for about a second"""
+    stats = client.containers.get(container_id).stats(stream=False)
+
+    cpu_usage = None
+    cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
+        stats['precpu_stats']['cpu_usage']['total_usage']
+    system_delta = stats['cpu_stats'].get('system_cpu_usage', 0) - \
+        stats['precpu_stats'].get('system_cpu_usage', 0)
+    if system_delta > 0:
+        cpu_usage = (cpu_delta / system_delta) * 100.0
+
+    memory_usage = None
+    if 'usage' in stats['memory_stats']:
+        memory_usage = (stats['memory_stats']['usage'] / stats['memory_stats']['limit']) * 100.0
+
+    return cpu_usage, memory_usage
+
+
+def collect_usage(client, container_ids, max_workers=16, interval=1.0):
+    """Collect (cpu %, memory %) of many containers at once.
+
+    Containers whose cgroup is readable on this host are sampled twice
+    ``interval`` seconds apart, all of them during the same interval. The
+    others go through the Docker stats API, ``max_workers`` at a time, while
+    the cgroup interval elapses. Returns ``(usage, errors)`` dicts keyed by
+    container id.
+    """
+    usage, errors = {}, {}
+
+    first = {}
+    start = time.monotonic()
+    for container_id in container_ids:
+        cgroup = find_cgroup(container_id)
+        if cgroup:
+            try:
+                first[container_id] = (cgroup, read_cgroup(cgroup))
+            except (OSError, KeyError, ValueError):
+                pass
+
+    remaining = [container_id for container_id in container_ids if container_id not in first]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(docker_usage, client, container_id): container_id
+            for container_id in remaining
+        }
+
+        if first:
+            time.sleep(max(0, interval - (time.monotonic() - start)))
+            elapsed_ns = (time.monotonic() - start) * 10**9
+            cpu_count = os.cpu_count() or 1
+            for container_id, (cgroup, (cpu_ns, _memory, _limit)) in first.items():
+                try:
+                    cpu_ns_after, memory, limit = read_cgroup(cgroup)
+                except (OSError, KeyError, ValueError) as e:
+                    errors[container_id] = str(e)
+                    continue
+                cpu_usage = (cpu_ns_after - cpu_ns) / (elapsed_ns * cpu_count) * 100.0
+                memory_usage = (memory / limit) * 100.0 if memory is not None else None
+                usage[container_id] = (cpu_usage, memory_usage)
+
+        for future in as_completed(futures):
+            container_id = futures[future]
+            try:
+                usage[container_id] = future.result()
+            except Exception as e:
+                errors[container_id] = str(e)
+
+    return usage, errors
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import shutil
+
+import psycopg2
+import psycopg2.errors
+
+import odoo
+from odoo import api, fields, tools, SUPERUSER_ID
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# Extensions Odoo uses when they are available
+EXTENSIONS = ('unaccent', 'pg_trgm')
+
+# System parameter written in the tenant database once provisioning completed
+PROVISIONED_MARKER = 'saas.provisioned_date'
+
+
+class DatabaseEngineError(Exception):
+    """Base error of the database engine, carries the step that failed"""
+
+    def __init__(self, message, step=None):
+        super().__init__(message)
+        self.step = step
+
+
+class DatabaseUnavailable(DatabaseEngineError):
+    """The PostgreSQL server cannot be reached"""
+
+
+class DatabasePermissionError(DatabaseEngineError):
+    """The database user lacks a privilege the operation needs"""
+
+
+class DatabaseExists(DatabaseEngineError):
+    """The database to create is already there"""
+
+
+class DatabaseEngine:
+    """Create, initialise and drop tenant databases without a shell.
+
+    Server statements go through ``pool`` (a ``pg_pool.ConnectionPool`` on
+    the maintenance database), so concurrent provisioning jobs share a few
+    connections. Databases of this server's Odoo version are initialised
+    with Odoo's own registry loader, the way the database manager does it.
+    Other versions are initialised by ``runner(odoo_version, args)``, which
+    runs ``odoo`` with the arguments in the image of the version and
+    returns its exit code and output. ``progress(step, message)`` is called
+    before each step.
+    """
+
+    def __init__(self, pool, progress=None, runner=None):
+        self.pool = pool
+        self.progress = progress
+        self.runner = runner
+
+    def _report(self, step, message):
+        _logger.info(message)
+        if self.progress:
+            self.progress(step, message)
+
+    def _execute(self, step, query, params=None, fetch=False):
+        """Run one statement on the server, translating psycopg2 errors"""
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cr:
+                cr.execute(query, params)
+                return cr.fetchall() if fetch else None
+        except psycopg2.errors.DuplicateDatabase as e:
+            raise DatabaseExists(str(e).strip(), step) from e
+        except psycopg2.errors.InsufficientPrivilege as e:
+            raise DatabasePermissionError(str(e).strip(), step) from e
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            raise DatabaseUnavailable(str(e).strip(), step) from e
+        except psycopg2.Error as e:
+            raise DatabaseEngineError(str(e).strip(), step) from e
+
+    # ------------------------------------------------------------------
+    # Server
+    # ------------------------------------------------------------------
+
+    def check(self):
+        """Check the server is reachable and the user may create databases.
+
+        Returns the server version and the missing optional extensions.
+        """
+        self._report('check', 'Checking PostgreSQL server')
+        rows = self._execute('check', """
+            SELECT current_setting('server_version'),
+                   (SELECT rolcreatedb OR rolsuper FROM pg_roles WHERE rolname = current_user),
+                   ARRAY(SELECT name FROM pg_available_extensions WHERE name = ANY(%s))
+        """, (list(EXTENSIONS),), fetch=True)
+        version, can_create, available = rows[0]
+        if not can_create:
+            raise DatabasePermissionError(
+                'The database user cannot create databases (ALTER USER ... CREATEDB)', 'check')
+        return version, [ext for ext in EXTENSIONS if ext not in available]
+
+    def exists(self, name):
+        rows = self._execute('check', "SELECT 1 FROM pg_database WHERE datname = %s", (name,), fetch=True)
+        return bool(rows)
+
+    def is_initialized(self, name):
+        """Whether the database holds an Odoo installation"""
+        db = odoo.sql_db.db_connect(name)
+        try:
+            with db.cursor() as cr:
+                return odoo.modules.db.is_initialized(cr)
+        except psycopg2.OperationalError as e:
+            raise DatabaseUnavailable(str(e).strip(), 'check') from e
+        finally:
+            odoo.sql_db.close_db(name)
+
+    def is_provisioned(self, name):
+        """Whether a provisioning of the database ran to completion"""
+        db = odoo.sql_db.db_connect(name)
+        try:
+            with db.cursor() as cr:
+                if not odoo.modules.db.is_initialized(cr):
+                    return False
+                cr.execute("SELECT 1 FROM ir_config_parameter WHERE key = %s", (PROVISIONED_MARKER,))
+                return bool(cr.fetchone())
+        except psycopg2.OperationalError as e:
+            raise DatabaseUnavailable(str(e).strip(), 'check') from e
+        finally:
+            odoo.sql_db.close_db(name)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def create(self, name, template=None):
+        """Create an empty database, DatabaseExists when the name is taken"""
+        template = template or tools.config['db_template']
+        self._report('create', f'Creating database {name}')
+        self._execute('create', 'CREATE DATABASE "%s" ENCODING \'unicode\' TEMPLATE "%s"' % (name, template))
+
+    def initialize(self, name, modules, login, password, company_name, lang='en_US', odoo_version=None):
+        """Install base and the modules, then set the admin user and the company.
+
+        The completion marker is written with the last step, a database
+        without it was left half-provisioned. Registry loading is serialised
+        per process by Odoo, database creation and the other steps of
+        concurrent jobs are not.
+        """
+        if odoo_version and odoo_version != odoo.release.serie:
+            return self._initialize_in_image(name, modules, lang, odoo_version)
+        step = 'initialize'
+        try:
+            self._report(step, f'Initialising database {name}')
+            with odoo.sql_db.db_connect(name).cursor() as cr:
+                odoo.modules.db.initialize(cr)
+            Registry.new(name, update_module=True)
+
+            modules = sorted(set(modules) - {'base'})
+            if modules:
+                step = 'install'
+                self._report(step, f'Installing modules: {", ".join(modules)}')
+                with Registry(name).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    to_install = env['ir.module.module'].search([
+                        ('name', 'in', modules),
+                        ('state', '!=', 'installed'),
+                    ])
+                    missing = set(modules) - set(to_install.mapped('name'))
+                    if missing:
+                        _logger.warning(f"Modules not found for database {name}: {', '.join(sorted(missing))}")
+                    if to_install:
+                        to_install.button_immediate_install()
+
+            step = 'configure'
+            self._report(step, 'Configuring admin user and company')
+            with Registry(name).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                if lang and lang != 'en_US':
+                    env['res.lang']._activate_lang(lang)
+                env.ref('base.user_admin').write({
+                    'login': login,
+                    'email': login,
+                    'password': password,
+                    'lang': lang,
+                })
+                env.ref('base.main_company').write({'name': company_name, 'email': login})
+                env['ir.config_parameter'].set_param(PROVISIONED_MARKER, fields.Datetime.now())
+        except DatabaseEngineError:
+            raise
+        except psycopg2.OperationalError as e:
+            raise DatabaseUnavailable(str(e).strip(), step) from e
+        except Exception as e:
+            raise DatabaseEngineError(f'{type(e).__name__}: {e}', step) from e
+        finally:
+            # The manager does not serve the tenant, free its registry and connections
+            Registry.delete(name)
+            odoo.sql_db.close_db(name)
+        self._report('done', f'Database {name} ready')
+
+    def _initialize_in_image(self, name, modules, lang, odoo_version):
+        """Install base and the modules with the Odoo of another version.
+
+        The admin user and the company keep their defaults, the provisioning
+        sets them through the tenant once it runs.
+        """
+        step = 'initialize'
+        if not self.runner:
+            raise DatabaseEngineError(
+                f'Odoo {odoo_version} databases cannot be initialised by this Odoo {odoo.release.serie} server', step)
+        modules = sorted(set(modules) | {'base'})
+        self._report(step, f'Initialising database {name} with Odoo {odoo_version}: {", ".join(modules)}')
+        args = ['-d', name, '-i', ','.join(modules), '--without-demo=all', '--stop-after-init']
+        if lang and lang != 'en_US':
+            args.append(f'--load-language={lang}')
+        try:
+            exit_code, output = self.runner(odoo_version, args)
+        except Exception as e:
+            raise DatabaseEngineError(f'{type(e).__name__}: {e}', step) from e
+        if exit_code:
+            raise DatabaseEngineError(f'Odoo {odoo_version} exited with status {exit_code}: {output}', step)
+
+        step = 'configure'
+        db = odoo.sql_db.db_connect(name)
+        try:
+            with db.cursor() as cr:
+                cr.execute("""
+                    INSERT INTO ir_config_parameter (key, value, create_date, write_date)
+                    VALUES (%s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+                """, (PROVISIONED_MARKER, fields.Datetime.to_string(fields.Datetime.now())))
+        except psycopg2.OperationalError as e:
+            raise DatabaseUnavailable(str(e).strip(), step) from e
+        finally:
+            odoo.sql_db.close_db(name)
+        self._report('done', f'Database {name} ready')
+
+    def provision(self, name, modules, login, password, company_name, lang='en_US', odoo_version=None):
+        """Create and initialise the database.
+
+        A database that completed provisioning raises DatabaseExists. One
+        left by an interrupted attempt is initialised when empty, dropped
+        and created again otherwise. A failed initialisation drops the
+        database so the next attempt starts from scratch.
+        """
+        try:
+            self.create(name)
+        except DatabaseExists:
+            if self.is_provisioned(name):
+                raise
+            if self.is_initialized(name):
+                self._report('create', f'Database {name} was left half-provisioned, creating it again')
+                self.drop(name)
+                self.create(name)
+            else:
+                self._report('create', f'Database {name} already exists but is empty, initialising it')
+        try:
+            self.initialize(name, modules, login, password, company_name, lang, odoo_version)
+        except DatabaseEngineError:
+            try:
+                self.drop(name)
+            except DatabaseEngineError as e:
+                _logger.warning(f"Failed to drop database {name} after a failed initialisation: {e}")
+            raise
+
+    def drop(self, name):
+        """Close the sessions on the database, drop it and remove its filestore.
+
+        Returns False when there was no database to drop.
+        """
+        if not self.exists(name):
+            return False
+        self._report('drop', f'Dropping database {name}')
+        odoo.sql_db.close_db(name)
+        self._execute('drop', """
+            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+            WHERE datname = %s AND pid != pg_backend_pid()
+        """, (name,))
+        self._execute('drop', 'DROP DATABASE IF EXISTS "%s"' % name)
+        shutil.rmtree(tools.config.filestore(name), ignore_errors=True)
+        return True
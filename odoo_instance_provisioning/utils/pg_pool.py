@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+# Idle connections older than this are checked before being lent again
+STALE_AFTER = 60
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class ConnectionPool:
+    """Small blocking pool of autocommit connections.
+
+    At most ``maxconn`` connections are open at once, borrowers wait for a
+    free one instead of opening more. Connections broken while borrowed are
+    dropped instead of being returned.
+    """
+
+    def __init__(self, maxconn, **params):
+        self.params = params
+        self.slots = threading.BoundedSemaphore(max(1, maxconn))
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _take_idle(self):
+        with self.lock:
+            while self.idle:
+                conn, released = self.idle.pop()
+                if conn.closed:
+                    continue
+                if time.monotonic() - released > STALE_AFTER:
+                    try:
+                        with conn.cursor() as cr:
+                            cr.execute("SELECT 1")
+                    except psycopg2.Error:
+                        conn.close()
+                        continue
+                return conn
+        return None
+
+    @contextmanager
+    def connection(self, timeout=30):
+        if not self.slots.acquire(timeout=timeout):
+            raise psycopg2.OperationalError(f"No database connection available within {timeout} seconds")
+        conn = None
+        try:
+            conn = self._take_idle()
+            if conn is None:
+                conn = psycopg2.connect(**self.params)
+                conn.autocommit = True
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if conn is not None:
+                conn.close()
+            raise
+        finally:
+            if conn is not None and not conn.closed:
+                with self.lock:
+                    self.idle.append((conn, time.monotonic()))
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for conn, _released in self.idle:
+                conn.close()
+            self.idle = []
+
+
+def get_pool(maxconn=4, **params):
+    """Process-wide pool for the connection parameters, created on first use"""
+    key = tuple(sorted(params.items()))
+    pool = _POOLS.get(key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(key)
+            if pool is None:
+                pool = _POOLS[key] = ConnectionPool(maxconn, **params)
+    return pool
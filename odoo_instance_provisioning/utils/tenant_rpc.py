@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import http.client
+import logging
+import socket
+import time
+import xmlrpc.client
+
+_logger = logging.getLogger(__name__)
+
+# HTTP status codes returned by a proxy or an Odoo still booting
+TRANSIENT_HTTP_CODES = (502, 503, 504)
+
+# Methods without side effects, safe to send again after the outcome of a
+# call was lost
+READ_METHODS = frozenset([
+    'check_access_rights', 'fields_get', 'name_search', 'read', 'read_group',
+    'search', 'search_count', 'search_read',
+])
+
+
+class KeepAliveTransport(xmlrpc.client.Transport):
+    """XML-RPC transport with a socket timeout.
+
+    The standard transport already keeps its HTTP/1.1 connection open between
+    requests, sharing one instance between the common and object endpoints
+    makes both reuse the same TCP connection.
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+class TenantRPCClient:
+    """Authenticated XML-RPC session on a tenant instance.
+
+    The uid is resolved once and reused for every call, transient connection
+    errors are retried with an exponential backoff. Calls that may change
+    data are only retried when the connection was refused, since after a
+    timeout or a dropped connection the server may have run them already.
+    """
+
+    def __init__(self, url, db, credentials, timeout=900, retries=4, backoff=1.0):
+        self.url = url
+        self.db = db
+        self.credentials = list(credentials)
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = KeepAliveTransport(timeout=timeout)
+        self.common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common', transport=self.transport, allow_none=True)
+        self.object = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object', transport=self.transport, allow_none=True)
+        self.uid = None
+        self.login = None
+        self.password = None
+        # Set once the company was written along with the admin user
+        self.company_configured = False
+
+    def authenticate(self):
+        """Log in with the first working credentials and cache the uid"""
+        if self.uid:
+            return self.uid
+        for login, password in self.credentials:
+            uid = self._call(self.common.authenticate, self.db, login, password, {})
+            if uid:
+                self.uid, self.login, self.password = uid, login, password
+                return uid
+        raise Exception("Authentication failed to instance")
+
+    def set_password(self, login, password):
+        """Keep the session valid after the logged in user credentials changed"""
+        self.login, self.password = login, password
+        self.credentials.insert(0, (login, password))
+
+    def execute(self, model, method, *args, **kwargs):
+        uid = self.authenticate()
+        return self._call(self.object.execute_kw, self.db, uid, self.password, model, method, list(args), kwargs,
+                          idempotent=method in READ_METHODS)
+
+    def _call(self, method, *args, idempotent=True):
+        attempt = 0
+        while True:
+            try:
+                return method(*args)
+            except ConnectionRefusedError as e:
+                # Nothing was sent, any call can go again
+                if attempt >= self.retries:
+                    raise
+                error = e
+            except xmlrpc.client.ProtocolError as e:
+                if not idempotent or e.errcode not in TRANSIENT_HTTP_CODES or attempt >= self.retries:
+                    raise
+                error = e
+            except (ConnectionError, socket.timeout, http.client.HTTPException) as e:
+                if not idempotent or attempt >= self.retries:
+                    raise
+                error = e
+
+            delay = self.backoff * (2 ** attempt)
+            _logger.warning(f"Transient RPC error on {self.url} ({error}), retrying in {delay:.0f}s")
+            # Drop the broken connection, the next call opens a fresh one
+            self.transport.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
@@ -8,7 +8,7 @@ class SaasInstance(models.Model):
     _order = 'date_created desc'
 
     instance_name = fields.Char(string='Instance Name', required=True)
-    subdomain = fields.Char(string='Subdomain', required=True)
+    subdomain = fields.Char(string='Subdomain', required=True, index=True)
     full_url = fields.Char(string='Full URL', compute='_compute_full_url', store=True)
     
     # Thông tin kỹ thuật
@@ -143,6 +143,32 @@ class SaasInstance(models.Model):
     #     if self.plan_id and self.plan_id.billing_cycle:
     #         self.billing_cycle = self.plan_id.billing_cycle
     
+    @api.model
+    def find_available_subdomain(self, subdomain, max_suffix=1000):
+        """First free name among subdomain, subdomain1, subdomain2... in one query"""
+        return self._find_free_name(
+            subdomain, "EXISTS (SELECT 1 FROM saas_instance i WHERE i.subdomain = c.name)", max_suffix=max_suffix)
+    
+    @api.model
+    def _find_free_name(self, base, taken, params=None, max_suffix=1000):
+        """First name among base, base1, base2... for which ``taken`` is false.
+        
+        ``taken`` is an SQL condition on the candidate ``c.name``, with
+        ``params`` as named parameters. All candidates are checked in one
+        query. Returns False when every candidate up to max_suffix is taken.
+        """
+        self.env.cr.execute(f"""
+            SELECT c.name FROM (
+                SELECT n, CASE WHEN n = 0 THEN %(base)s ELSE %(base)s || n END AS name
+                FROM generate_series(0, %(max_suffix)s) n
+            ) c
+            WHERE NOT ({taken})
+            ORDER BY c.n
+            LIMIT 1
+        """, dict(params or {}, base=base, max_suffix=max_suffix))
+        row = self.env.cr.fetchone()
+        return row[0] if row else False
+    
     def action_activate(self):
         self.write({
             'status': 'active',
@@ -277,20 +277,11 @@ Requirements: {post.get('requirements', 'None')}
                 service_package = ServicePackage.create(package_data)
                 _logger.info(f"Created default service package: {service_package.name}")
 
-            # Make subdomain unique if needed
-            final_subdomain = preferred_subdomain
-            existing_instance = Instance.search(
-                [("subdomain", "=", final_subdomain)], limit=1
-            )
-            if existing_instance:
-                counter = 1
-                while existing_instance:
-                    test_subdomain = f"{preferred_subdomain}{counter}"
-                    existing_instance = Instance.search(
-                        [("subdomain", "=", test_subdomain)], limit=1
-                    )
-                    counter += 1
-                final_subdomain = f"{preferred_subdomain}{counter-1}"  # Create instance with service package
+            # Make subdomain unique if needed, first free suffix in one query
+            final_subdomain = Instance.find_available_subdomain(preferred_subdomain)
+            if not final_subdomain:
+                raise ValueError(f"No available subdomain for {preferred_subdomain}")
+            # Create instance with service package
             instance_data = {
                 "instance_name": f"{customer.company_name} - {plan.name}",
                 "subdomain": final_subdomain,